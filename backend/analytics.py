@@ -0,0 +1,173 @@
+"""
+Revenue rollups.
+
+`revenue_rollups` holds one document per (vendor, day, status) with the
+booking and seat counts and gross / commission / vendor net totals, bucketed by the
+booking's created_at (UTC day). A scheduled job keeps it current: it finds
+the (vendor, day) pairs touched by bookings updated since the last watermark,
+recomputes just those days with an aggregation ending in `$merge`, and drops
+rollup documents for statuses those days no longer have. Archived bookings
+(see archive.py) are included via `$unionWith`. Analytics endpoints read the
+rollups instead of the bookings.
+"""
+from typing import Optional, List
+from datetime import datetime, timedelta
+import os
+
+from database import get_database, get_read_database, COLLECTIONS
+from models import RevenueSeries, RevenuePoint
+from archive import union_with_archive
+
+ROLLUP_JOB = 'revenue_rollups'
+REVENUE_ROLLUP_INTERVAL_SECONDS = float(os.environ.get('REVENUE_ROLLUP_INTERVAL_SECONDS', '60'))
+# Re-read this far behind the watermark to catch writes that committed late
+ROLLUP_LAG_SECONDS = 30
+# (vendor, day) pairs recomputed per aggregation
+ROLLUP_BATCH_KEYS = 500
+
+DAY_EXPR = {'$dateTrunc': {'date': '$created_at', 'unit': 'day'}}
+
+def _rollup_stages(stamp: datetime) -> List[dict]:
+    return [
+        {'$group': {
+            '_id': {'vendor_id': '$vendor_id', 'day': DAY_EXPR, 'status': '$status'},
+            'bookings': {'$sum': 1},
+            'seats': {'$sum': {'$ifNull': ['$seats', 1]}},
+            'gross': {'$sum': '$total_amount'},
+            'commission': {'$sum': '$commission_amount'},
+            'vendor_net': {'$sum': '$vendor_amount'},
+        }},
+        {'$project': {
+            '_id': 0,
+            'vendor_id': '$_id.vendor_id',
+            'day': '$_id.day',
+            'status': '$_id.status',
+            'bookings': 1,
+            'seats': 1,
+            'gross': {'$round': ['$gross', 2]},
+            'commission': {'$round': ['$commission', 2]},
+            'vendor_net': {'$round': ['$vendor_net', 2]},
+            'refreshed_at': {'$literal': stamp},
+        }},
+        {'$merge': {
+            'into': COLLECTIONS['revenue_rollups'],
+            'on': ['vendor_id', 'day', 'status'],
+            'whenMatched': 'replace',
+            'whenNotMatched': 'insert',
+        }},
+    ]
+
+async def _rebuild_days(keys: List[dict], stamp: datetime):
+    """Recompute the rollups for a batch of (vendor_id, day) pairs"""
+    db = get_database()
+    match = {'$or': [
+        {'vendor_id': k['vendor_id'], 'created_at': {'$gte': k['day'], '$lt': k['day'] + timedelta(days=1)}}
+        for k in keys
+    ]}
+    # Old days can mix live and archived bookings
+    await db[COLLECTIONS['bookings']].aggregate(
+        [{'$match': match}, union_with_archive('bookings', match)] + _rollup_stages(stamp),
+        allowDiskUse=True
+    ).to_list(None)
+    # Statuses that no longer occur on these days weren't rewritten by this run
+    await db[COLLECTIONS['revenue_rollups']].delete_many({
+        '$or': [{'vendor_id': k['vendor_id'], 'day': k['day']} for k in keys],
+        'refreshed_at': {'$ne': stamp},
+    })
+
+async def refresh_revenue_rollups(full: bool = False) -> dict:
+    """Bring revenue_rollups up to date; full=True rebuilds everything"""
+    db = get_database()
+    checkpoints = db[COLLECTIONS['job_checkpoints']]
+    stamp = datetime.utcnow()
+
+    state = None if full else await checkpoints.find_one({'_id': ROLLUP_JOB})
+    if state is None:
+        # First run (or forced): one pass over all bookings, archived ones included
+        await db[COLLECTIONS['bookings']].aggregate(
+            [union_with_archive('bookings')] + _rollup_stages(stamp), allowDiskUse=True
+        ).to_list(None)
+        await db[COLLECTIONS['revenue_rollups']].delete_many({'refreshed_at': {'$ne': stamp}})
+        await checkpoints.update_one({'_id': ROLLUP_JOB}, {'$set': {'watermark': stamp}}, upsert=True)
+        return {'full': True}
+
+    cursor = db[COLLECTIONS['bookings']].aggregate([
+        {'$match': {'updated_at': {'$gte': state['watermark'] - timedelta(seconds=ROLLUP_LAG_SECONDS)}}},
+        {'$group': {'_id': {'vendor_id': '$vendor_id', 'day': DAY_EXPR}}},
+    ], allowDiskUse=True)
+
+    days = 0
+    batch: List[dict] = []
+    async for row in cursor:
+        batch.append(row['_id'])
+        if len(batch) >= ROLLUP_BATCH_KEYS:
+            await _rebuild_days(batch, stamp)
+            days += len(batch)
+            batch = []
+    if batch:
+        await _rebuild_days(batch, stamp)
+        days += len(batch)
+
+    await checkpoints.update_one({'_id': ROLLUP_JOB}, {'$set': {'watermark': stamp}}, upsert=True)
+    return {'vendor_days': days}
+
+async def get_revenue_series(start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                             interval: str = "day", vendor_id: Optional[str] = None,
+                             statuses: Optional[List[str]] = None) -> RevenueSeries:
+    """Revenue per day/week/month from the rollups (default: the last 30 days)"""
+    db = get_read_database()
+    # Rollups are whole UTC days: start rounds down, the exclusive end rounds up
+    if end_date is None:
+        end_date = datetime.utcnow()
+    if end_date.time() != datetime.min.time():
+        end_date = datetime.combine(end_date.date(), datetime.min.time()) + timedelta(days=1)
+    start_date = datetime.combine((start_date or end_date - timedelta(days=30)).date(), datetime.min.time())
+    match = {'day': {'$gte': start_date, '$lt': end_date}}
+    if vendor_id:
+        match['vendor_id'] = vendor_id
+    if statuses:
+        match['status'] = {'$in': statuses}
+
+    period = {'date': '$day', 'unit': interval}
+    if interval == "week":
+        period['startOfWeek'] = 'monday'
+
+    rows = await db[COLLECTIONS['revenue_rollups']].aggregate([
+        {'$match': match},
+        {'$group': {
+            '_id': {'period': {'$dateTrunc': period}, 'status': '$status'},
+            'bookings': {'$sum': '$bookings'},
+            'seats': {'$sum': '$seats'},
+            'gross': {'$sum': '$gross'},
+            'commission': {'$sum': '$commission'},
+            'vendor_net': {'$sum': '$vendor_net'},
+        }},
+        {'$group': {
+            '_id': '$_id.period',
+            'bookings': {'$sum': '$bookings'},
+            'seats': {'$sum': '$seats'},
+            'gross': {'$sum': '$gross'},
+            'commission': {'$sum': '$commission'},
+            'vendor_net': {'$sum': '$vendor_net'},
+            'by_status': {'$push': {'k': '$_id.status', 'v': '$bookings'}},
+        }},
+        {'$sort': {'_id': 1}},
+        {'$project': {
+            '_id': 0,
+            'period_start': '$_id',
+            'bookings': 1,
+            'seats': 1,
+            'gross': {'$round': ['$gross', 2]},
+            'commission': {'$round': ['$commission', 2]},
+            'vendor_net': {'$round': ['$vendor_net', 2]},
+            'by_status': {'$arrayToObject': '$by_status'},
+        }},
+    ]).to_list(None)
+
+    return RevenueSeries(
+        interval=interval,
+        start_date=start_date,
+        end_date=end_date,
+        vendor_id=vendor_id,
+        points=[RevenuePoint(**row) for row in rows]
+    )
@@ -0,0 +1,217 @@
+"""
+Archival of booking and settlement history.
+
+The `archive_history` job moves completed or cancelled bookings created (and
+last updated) more than ARCHIVE_AFTER_MONTHS ago into `bookings_archive`, and
+settlement rows older than that into `settlement_transactions_archive`, so
+the hot collections (and their indexes) stay proportional to recent activity.
+A settlement row is only moved once a wallet checkpoint covers its sequence,
+so balances keep starting from a checkpoint plus a hot tail.
+
+Each batch is copied with `$setOnInsert` upserts keyed by `_id` and then
+deleted from the hot collection, so a crashed run is simply repeated. Between
+the two steps a document exists in both collections; `find_with_archive`
+drops the duplicate, while aggregations can briefly count it twice.
+
+Reads that need history fan out:
+- `find_with_archive` merges sorted finds over both collections
+- `union_with_archive` is a `$unionWith` stage for aggregations
+- `repository.get_booking` falls back to the archive
+"""
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+import heapq
+import os
+
+from database import get_database, get_read_database, COLLECTIONS
+from models import BookingStatus
+from metrics import registry
+from cache import cache
+
+ARCHIVE_AFTER_MONTHS = float(os.environ.get('ARCHIVE_AFTER_MONTHS', '6'))
+ARCHIVE_INTERVAL_SECONDS = float(os.environ.get('ARCHIVE_INTERVAL_SECONDS', '3600'))
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', '1000'))
+# Archived totals are cached per archive generation, which each run that moves bookings bumps
+ARCHIVE_TOTALS_CACHE_SECONDS = 3600
+ARCHIVE_JOB = 'archive_history'
+
+# Hot collection -> archive collection
+ARCHIVES = {
+    'bookings': 'bookings_archive',
+    'settlement_transactions': 'settlement_transactions_archive',
+}
+ARCHIVABLE_BOOKING_STATUSES = [BookingStatus.completed.value, BookingStatus.cancelled.value]
+
+archived_documents_total = registry.counter(
+    'archived_documents_total',
+    'Documents moved to archive collections',
+    ('collection',)
+)
+
+# ============================================================
+# FAN-OUT READS
+# ============================================================
+
+def union_with_archive(collection: str, match: Optional[dict] = None) -> dict:
+    """$unionWith stage adding the collection's archived documents (optionally filtered)"""
+    stage = {'coll': COLLECTIONS[ARCHIVES[collection]]}
+    if match:
+        stage['pipeline'] = [{'$match': match}]
+    return {'$unionWith': stage}
+
+async def find_with_archive(collection: str, query: dict, sort_field: str = 'created_at',
+                            descending: bool = True, limit: int = 100, skip: int = 0,
+                            projection: Optional[dict] = None, db=None) -> List[dict]:
+    """One page of a sorted find over a collection and its archive"""
+    db = db if db is not None else get_database()
+    direction = DESCENDING if descending else ASCENDING
+    wanted = skip + limit
+    sources = [
+        await db[COLLECTIONS[name]].find(query, projection).sort(sort_field, direction).limit(wanted).to_list(wanted)
+        for name in (collection, ARCHIVES[collection])
+    ]
+    merged = heapq.merge(*sources, key=lambda d: d.get(sort_field), reverse=descending)
+    seen = set()
+    page = []
+    for document in merged:
+        # A document being archived can briefly be in both collections
+        key = document.get('id', document.get('_id'))
+        if key is not None:
+            if key in seen:
+                continue
+            seen.add(key)
+        page.append(document)
+        if len(page) >= wanted:
+            break
+    return page[skip:]
+
+async def _archived_booking_totals(vendor_id: Optional[str]) -> Dict[str, dict]:
+    db = get_read_database()
+    match = {'vendor_id': vendor_id} if vendor_id else {}
+    return {
+        row['_id']: row async for row in db[COLLECTIONS['bookings_archive']].aggregate([
+            {'$match': match},
+            {'$group': {'_id': '$status', 'bookings': {'$sum': 1},
+                        'gross': {'$sum': '$total_amount'},
+                        'commission': {'$sum': '$commission_amount'},
+                        'vendor_net': {'$sum': '$vendor_amount'}}},
+        ])
+    }
+
+async def get_booking_totals(vendor_id: Optional[str] = None) -> Dict[str, dict]:
+    """Booking count and amounts per status, for one vendor or the platform, archive included"""
+    db = get_read_database()
+    match = {'vendor_id': vendor_id} if vendor_id else {}
+    totals = {
+        row['_id']: row async for row in db[COLLECTIONS['bookings']].aggregate([
+            {'$match': match},
+            {'$group': {'_id': '$status', 'bookings': {'$sum': 1},
+                        'gross': {'$sum': '$total_amount'},
+                        'commission': {'$sum': '$commission_amount'},
+                        'vendor_net': {'$sum': '$vendor_amount'}}},
+        ])
+    }
+    state = await db[COLLECTIONS['job_checkpoints']].find_one({'_id': ARCHIVE_JOB}, {'generation': 1})
+    generation = state.get('generation', 0) if state else 0
+    archived = await cache.get_or_load(
+        f"archive:bookings:{vendor_id or 'all'}:{generation}", ARCHIVE_TOTALS_CACHE_SECONDS,
+        lambda: _archived_booking_totals(vendor_id)
+    )
+    for status, row in archived.items():
+        entry = totals.setdefault(status, {'bookings': 0, 'gross': 0.0, 'commission': 0.0, 'vendor_net': 0.0})
+        for field in ('bookings', 'gross', 'commission', 'vendor_net'):
+            entry[field] += row[field]
+    return totals
+
+# ============================================================
+# ARCHIVAL JOB
+# ============================================================
+
+async def _move(collection: str, documents: List[dict]) -> int:
+    """Copy documents into the archive, then delete them from the hot collection"""
+    db = get_database()
+    await db[COLLECTIONS[ARCHIVES[collection]]].bulk_write([
+        UpdateOne({'_id': d['_id']}, {'$setOnInsert': d}, upsert=True) for d in documents
+    ], ordered=False)
+    result = await db[COLLECTIONS[collection]].delete_many({'_id': {'$in': [d['_id'] for d in documents]}})
+    archived_documents_total.inc(result.deleted_count, collection=collection)
+    return result.deleted_count
+
+async def archive_bookings(cutoff: datetime) -> int:
+    """Move terminal bookings created and last updated before cutoff"""
+    db = get_database()
+    moved = 0
+    while True:
+        batch = await db[COLLECTIONS['bookings']].find({
+            'status': {'$in': ARCHIVABLE_BOOKING_STATUSES},
+            'created_at': {'$lt': cutoff},
+            'updated_at': {'$lt': cutoff},
+        }).sort('created_at', ASCENDING).limit(ARCHIVE_BATCH_SIZE).to_list(ARCHIVE_BATCH_SIZE)
+        if not batch:
+            return moved
+        moved += await _move('bookings', batch)
+        if len(batch) < ARCHIVE_BATCH_SIZE:
+            return moved
+
+async def _archive_vendor_settlements(vendor_id: str, checkpointed_seq: Optional[int],
+                                      cutoff: datetime) -> int:
+    db = get_database()
+    # Rows without a sequence predate the ledger and never enter a balance tail
+    covered = [{'sequence': None}]
+    if checkpointed_seq:
+        covered.append({'sequence': {'$lte': checkpointed_seq}})
+    moved = 0
+    while True:
+        batch = await db[COLLECTIONS['settlement_transactions']].find({
+            'vendor_id': vendor_id,
+            'created_at': {'$lt': cutoff},
+            '$or': covered,
+        }).limit(ARCHIVE_BATCH_SIZE).to_list(ARCHIVE_BATCH_SIZE)
+        if not batch:
+            return moved
+        moved += await _move('settlement_transactions', batch)
+        if len(batch) < ARCHIVE_BATCH_SIZE:
+            return moved
+
+async def archive_settlements(cutoff: datetime) -> int:
+    """Move settlement rows created before cutoff that a wallet checkpoint covers"""
+    db = get_database()
+    # Every vendor with old rows, including those whose rows all predate the
+    # ledger and so have no ledger_sequences counter
+    vendors = db[COLLECTIONS['settlement_transactions']].aggregate([
+        {'$match': {'created_at': {'$lt': cutoff}}},
+        {'$group': {'_id': '$vendor_id'}},
+    ], allowDiskUse=True)
+
+    async def archive_chunk(vendor_ids: List[str]) -> int:
+        counters = await db[COLLECTIONS['ledger_sequences']].find(
+            {'_id': {'$in': vendor_ids}}, {'checkpointed_seq': 1}
+        ).to_list(None)
+        checkpointed = {c['_id']: c.get('checkpointed_seq') for c in counters}
+        moved = 0
+        for vendor_id in vendor_ids:
+            moved += await _archive_vendor_settlements(vendor_id, checkpointed.get(vendor_id), cutoff)
+        return moved
+
+    moved = 0
+    chunk: List[str] = []
+    async for row in vendors:
+        chunk.append(row['_id'])
+        if len(chunk) == ARCHIVE_BATCH_SIZE:
+            moved += await archive_chunk(chunk)
+            chunk = []
+    if chunk:
+        moved += await archive_chunk(chunk)
+    return moved
+
+async def archive_history() -> dict:
+    """Scheduled job: move old bookings and settlement rows to the archive collections"""
+    cutoff = datetime.utcnow() - timedelta(days=30 * ARCHIVE_AFTER_MONTHS)
+    bookings = await archive_bookings(cutoff)
+    settlements = await archive_settlements(cutoff)
+    if bookings:
+        await get_database()[COLLECTIONS['job_checkpoints']].update_one(
+            {'_id': ARCHIVE_JOB}, {'$inc': {'generation': 1}, '$set': {'cutoff': cutoff}}, upsert=True
+        )
+    return {'bookings': bookings, 'settlements': settlements}
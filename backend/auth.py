@@ -2,8 +2,8 @@ from fastapi import Header, HTTPException, Depends
 from typing import Optional
 import jwt
 import os
-from database import get_database, COLLECTIONS
 from models import UserRole
+from repository import get_user_by_auth_id, get_vendor_by_user
 
 # Supabase JWT secret - will be used to validate tokens
 SUPABASE_JWT_SECRET = os.environ.get('SUPABASE_JWT_SECRET', '')
@@ -33,8 +33,7 @@ async def get_current_user(authorization: Optional[str] = Header(None)) -> dict:
             raise HTTPException(status_code=401, detail="Invalid token")
         
         # Get user from database
-        db = get_database()
-        user = await db[COLLECTIONS['users']].find_one({'supabase_user_id': user_id})
+        user = await get_user_by_auth_id(user_id)
         
         if not user:
             # Auto-create user if doesn't exist (first login)
@@ -64,8 +63,7 @@ def require_role(required_roles: list[UserRole]):
 
 async def get_current_vendor(current_user: dict = Depends(get_current_user)) -> dict:
     """Get vendor profile for current user"""
-    db = get_database()
-    vendor = await db[COLLECTIONS['vendors']].find_one({'user_id': current_user['id']})
+    vendor = await get_vendor_by_user(current_user['id'])
     
     if not vendor:
         raise HTTPException(status_code=404, detail="Vendor profile not found")
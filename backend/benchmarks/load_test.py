@@ -0,0 +1,324 @@
+"""
+Booking funnel load test.
+
+Seeds vendors, packages, time slots and customers into a dedicated database,
+then drives concurrent virtual users through the funnel:
+
+    browse -> availability -> create_booking -> vendor confirm -> complete -> review
+
+By default the app runs in-process over ASGI against a local mongod; pass
+--base-url to drive a running server instead (it must use the same database).
+Results (throughput, p50/p95/p99 per endpoint, DB ops per request) are written
+as JSON so runs can be compared across commits.
+
+Usage:
+    python benchmarks/load_test.py run --vendors 20 --users 25 --funnels 500
+"""
+from typing import Optional, Dict, List
+from datetime import datetime, timedelta
+from pathlib import Path
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+
+import typer
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+app = typer.Typer(help="Load test the booking funnel")
+
+# ============================================================
+# SEEDING
+# ============================================================
+
+async def seed_marketplace(db, rng: random.Random, vendors: int, packages_per_vendor: int,
+                           slots_per_vendor: int, slot_capacity: int, customers: int) -> dict:
+    """Insert a consistent marketplace and return the ids the funnel needs"""
+    from database import COLLECTIONS
+    from models import (
+        User, UserRole, Vendor, VendorStatus, VendorWallet, Package, TimeSlot
+    )
+
+    vendor_users, vendor_docs, wallet_docs, package_docs, slot_docs = [], [], [], [], []
+    today = datetime.utcnow().date()
+
+    for i in range(vendors):
+        user = User(email=f"vendor{i}@loadtest.example.com", name=f"Vendor {i}",
+                    role=UserRole.vendor, supabase_user_id=f"lt-vendor-{i}")
+        vendor = Vendor(
+            user_id=user.id,
+            company_name=f"Loadtest Flyers {i}",
+            contact_email=user.email,
+            contact_phone="+910000000000",
+            location=rng.choice(["Bir Billing", "Manali", "Dharamshala", "Kamshet"]),
+            status=VendorStatus.approved,
+            is_approved=True,
+            commission_rate=rng.choice([10.0, 12.5, 15.0]),
+            approved_at=datetime.utcnow(),
+        )
+        vendor_users.append(user.dict())
+        vendor_docs.append(vendor.dict())
+        wallet_docs.append(VendorWallet(vendor_id=vendor.id).dict())
+
+        for p in range(packages_per_vendor):
+            package = Package(
+                vendor_id=vendor.id,
+                name=f"Tandem {p}",
+                price=float(rng.choice([2500, 3500, 4500, 6000])),
+                duration_minutes=rng.choice([15, 20, 30]),
+            )
+            package_docs.append(package.dict())
+
+        for s in range(slots_per_vendor):
+            slot_date = today + timedelta(days=1 + s // 4)
+            hour = 8 + (s % 4) * 2
+            slot_docs.append(TimeSlot(
+                vendor_id=vendor.id,
+                slot_date=slot_date.isoformat(),
+                start_time=f"{hour:02d}:00",
+                end_time=f"{hour + 1:02d}:00",
+                capacity=slot_capacity,
+            ).dict())
+
+    customer_users = [
+        User(email=f"customer{i}@loadtest.example.com", name=f"Customer {i}",
+             supabase_user_id=f"lt-customer-{i}").dict()
+        for i in range(customers)
+    ]
+
+    await db[COLLECTIONS['users']].insert_many(vendor_users + customer_users)
+    await db[COLLECTIONS['vendors']].insert_many(vendor_docs)
+    await db[COLLECTIONS['vendor_wallets']].insert_many(wallet_docs)
+    await db[COLLECTIONS['packages']].insert_many(package_docs)
+    await db[COLLECTIONS['time_slots']].insert_many(slot_docs)
+
+    vendor_tokens = {v['id']: u['supabase_user_id'] for v, u in zip(vendor_docs, vendor_users)}
+    return {
+        'vendor_tokens': vendor_tokens,
+        'customer_tokens': [u['supabase_user_id'] for u in customer_users],
+    }
+
+# ============================================================
+# FUNNEL
+# ============================================================
+
+class Recorder:
+    """Collects per-endpoint latency, status and DB round-trips"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[tuple]] = {}
+
+    async def call(self, client, endpoint: str, method: str, url: str, token: Optional[str] = None, **kwargs):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        start = time.perf_counter()
+        response = await client.request(method, url, headers=headers, **kwargs)
+        elapsed = time.perf_counter() - start
+        db_ops = response.headers.get('X-DB-Query-Count')
+        self.samples.setdefault(endpoint, []).append(
+            (elapsed, response.status_code, int(db_ops) if db_ops is not None else None)
+        )
+        return response
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+async def run_funnel(client, recorder: Recorder, rng: random.Random, seeded: dict) -> bool:
+    customer = rng.choice(seeded['customer_tokens'])
+
+    response = await recorder.call(client, 'browse_packages', 'GET', '/api/packages',
+                                   params={'limit': 20, 'skip': rng.randint(0, 3) * 20})
+    packages = response.json() if response.status_code == 200 else []
+    if not packages:
+        response = await recorder.call(client, 'browse_packages', 'GET', '/api/packages', params={'limit': 20})
+        packages = response.json() if response.status_code == 200 else []
+        if not packages:
+            return False
+    package = rng.choice(packages)
+
+    response = await recorder.call(client, 'get_package_availability', 'GET',
+                                   f"/api/time-slots/availability/{package['id']}")
+    slots = response.json() if response.status_code == 200 else []
+    if not slots:
+        return False
+    slot = rng.choice(slots)
+
+    response = await recorder.call(client, 'create_booking', 'POST', '/api/bookings', token=customer, json={
+        'vendor_id': package['vendor_id'],
+        'package_id': package['id'],
+        'time_slot_id': slot['id'],
+        'customer_name': 'Load Test',
+        'customer_email': 'loadtest@example.com',
+    })
+    if response.status_code != 200:
+        return False
+    booking = response.json()
+
+    vendor_token = seeded['vendor_tokens'][package['vendor_id']]
+    for status, endpoint in (('confirmed', 'vendor_confirm'), ('completed', 'vendor_complete')):
+        response = await recorder.call(client, endpoint, 'PUT', f"/api/bookings/{booking['id']}/status",
+                                       token=vendor_token, json={'status': status})
+        if response.status_code != 200:
+            return False
+
+    response = await recorder.call(client, 'create_review', 'POST', '/api/reviews', token=customer, json={
+        'booking_id': booking['id'],
+        'rating': rng.randint(3, 5),
+        'title': 'Great flight',
+    })
+    return response.status_code == 200
+
+def build_report(recorder: Recorder, elapsed: float, completed: int, attempted: int, params: dict) -> dict:
+    endpoints = {}
+    total_requests = 0
+    for endpoint, samples in recorder.samples.items():
+        latencies = sorted(s[0] * 1000 for s in samples)
+        errors = sum(1 for s in samples if s[1] >= 400)
+        db_ops = [s[2] for s in samples if s[2] is not None]
+        total_requests += len(samples)
+        endpoints[endpoint] = {
+            'requests': len(samples),
+            'errors': errors,
+            'throughput_rps': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+            'max_ms': round(latencies[-1], 3),
+            'db_ops_per_request': round(sum(db_ops) / len(db_ops), 2) if db_ops else None,
+        }
+
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        'commit': commit,
+        'generated_at': datetime.utcnow().isoformat(),
+        'params': params,
+        'elapsed_seconds': round(elapsed, 3),
+        'funnels_attempted': attempted,
+        'funnels_completed': completed,
+        'funnels_per_second': round(completed / elapsed, 2) if elapsed else 0.0,
+        'requests': total_requests,
+        'requests_per_second': round(total_requests / elapsed, 2) if elapsed else 0.0,
+        'endpoints': endpoints,
+    }
+
+async def _run(params: dict) -> dict:
+    # database.py reads these at import time
+    os.environ['MONGO_URL'] = params['mongo_url']
+    os.environ['DB_NAME'] = params['db_name']
+
+    import httpx
+    import database
+
+    # Per-request httpx logging would dominate the output
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    await database.connect_to_mongo()
+    db = database.get_database()
+    await database.client.drop_database(params['db_name'])
+    await database.create_indexes()
+
+    rng = random.Random(params['seed'])
+    seeded = await seed_marketplace(
+        db, rng, params['vendors'], params['packages_per_vendor'],
+        params['slots_per_vendor'], params['slot_capacity'], params['customers']
+    )
+
+    if params['base_url']:
+        client = httpx.AsyncClient(base_url=params['base_url'], timeout=30.0)
+    else:
+        from server import app as asgi_app
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=asgi_app),
+                                   base_url='http://loadtest', timeout=30.0)
+
+    recorder = Recorder()
+    remaining = params['funnels']
+    completed = 0
+
+    async def virtual_user(user_index: int):
+        nonlocal remaining, completed
+        user_rng = random.Random(params['seed'] * 1000 + user_index)
+        while remaining > 0:
+            remaining -= 1
+            if await run_funnel(client, recorder, user_rng, seeded):
+                completed += 1
+
+    start = time.perf_counter()
+    async with client:
+        await asyncio.gather(*(virtual_user(i) for i in range(params['users'])))
+    elapsed = time.perf_counter() - start
+
+    if not params['keep_data']:
+        await database.client.drop_database(params['db_name'])
+    await database.close_mongo_connection()
+
+    return build_report(recorder, elapsed, completed, params['funnels'], params)
+
+@app.command()
+def run(
+    vendors: int = typer.Option(20, help="Approved vendors to seed"),
+    packages_per_vendor: int = typer.Option(3, help="Active packages per vendor"),
+    slots_per_vendor: int = typer.Option(12, help="Future time slots per vendor"),
+    slot_capacity: int = typer.Option(50, help="Seats per time slot"),
+    customers: int = typer.Option(200, help="Customer accounts to seed"),
+    users: int = typer.Option(20, help="Concurrent virtual users"),
+    funnels: int = typer.Option(500, help="Total funnel iterations across all users"),
+    seed: int = typer.Option(42, help="Random seed for seeding and the request mix"),
+    mongo_url: str = typer.Option("mongodb://localhost:27017", help="MongoDB connection string"),
+    db_name: str = typer.Option("marketplace_loadtest", help="Database to seed (dropped first)"),
+    base_url: Optional[str] = typer.Option(None, help="Drive a running server instead of in-process ASGI"),
+    output: Path = typer.Option(Path("benchmarks/results/load_test.json"), help="JSON report path"),
+    keep_data: bool = typer.Option(False, help="Keep the seeded database after the run"),
+):
+    """Seed a marketplace and run the booking funnel under load"""
+    params = {
+        'vendors': vendors, 'packages_per_vendor': packages_per_vendor,
+        'slots_per_vendor': slots_per_vendor, 'slot_capacity': slot_capacity,
+        'customers': customers, 'users': users, 'funnels': funnels, 'seed': seed,
+        'mongo_url': mongo_url, 'db_name': db_name, 'base_url': base_url, 'keep_data': keep_data,
+    }
+    report = asyncio.run(_run(params))
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+
+    typer.echo(f"{report['funnels_completed']}/{report['funnels_attempted']} funnels in "
+               f"{report['elapsed_seconds']}s ({report['requests_per_second']} req/s)")
+    for endpoint, stats in report['endpoints'].items():
+        typer.echo(f"  {endpoint:<26} p50={stats['p50_ms']:>8}ms p95={stats['p95_ms']:>8}ms "
+                   f"p99={stats['p99_ms']:>8}ms db_ops={stats['db_ops_per_request']} errors={stats['errors']}")
+    typer.echo(f"Report written to {output}")
+
+@app.command()
+def compare(baseline: Path, candidate: Path):
+    """Compare two load test reports endpoint by endpoint"""
+    base = json.loads(baseline.read_text())
+    cand = json.loads(candidate.read_text())
+    typer.echo(f"{base.get('commit')} -> {cand.get('commit')}")
+    for endpoint in sorted(set(base['endpoints']) | set(cand['endpoints'])):
+        b = base['endpoints'].get(endpoint)
+        c = cand['endpoints'].get(endpoint)
+        if not b or not c:
+            typer.echo(f"  {endpoint:<26} only in {'candidate' if c else 'baseline'}")
+            continue
+        delta = (c['p95_ms'] - b['p95_ms']) / b['p95_ms'] * 100 if b['p95_ms'] else 0.0
+        typer.echo(f"  {endpoint:<26} p95 {b['p95_ms']}ms -> {c['p95_ms']}ms ({delta:+.1f}%), "
+                   f"db_ops {b['db_ops_per_request']} -> {c['db_ops_per_request']}")
+
+if __name__ == "__main__":
+    app()
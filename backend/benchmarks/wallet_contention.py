@@ -0,0 +1,116 @@
+"""
+Wallet hot-document contention benchmark.
+
+Runs many concurrent booking confirmations (utils.update_wallet_on_booking)
+for a single vendor, once per shard setting, and reports throughput and
+latency. After each run the shards are folded and the balance is checked
+against the expected total.
+
+Usage:
+    python benchmarks/wallet_contention.py --confirmations 5000 --concurrency 64 --shards 0,8,32
+"""
+from pathlib import Path
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+
+import typer
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from load_test import percentile
+
+app = typer.Typer(help="Benchmark concurrent wallet updates for one vendor")
+
+async def _run_setting(shards: int, confirmations: int, concurrency: int) -> dict:
+    import database
+    import wallet_shards
+    from database import COLLECTIONS
+    from models import VendorWallet
+    from utils import update_wallet_on_booking, get_vendor_wallet
+
+    wallet_shards.WALLET_COUNTER_SHARDS = shards
+    db = database.get_database()
+    vendor_id = f"bench-vendor-{uuid.uuid4().hex[:8]}"
+    await db[COLLECTIONS['vendor_wallets']].insert_one(VendorWallet(vendor_id=vendor_id).dict())
+
+    latencies = []
+    remaining = confirmations
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            await update_wallet_on_booking(
+                vendor_id=vendor_id, booking_id=str(uuid.uuid4()),
+                total_amount=1000.0, commission_amount=150.0, vendor_amount=850.0
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    unfolded = await get_vendor_wallet(vendor_id)
+    await wallet_shards.fold_wallet_shards(vendor_id)
+    wallet_shards.WALLET_COUNTER_SHARDS = 0
+    folded = await get_vendor_wallet(vendor_id)
+
+    latencies.sort()
+    expected = round(850.0 * confirmations, 2)
+    return {
+        'shards': shards,
+        'confirmations': confirmations,
+        'concurrency': concurrency,
+        'elapsed_seconds': round(elapsed, 3),
+        'confirmations_per_second': round(confirmations / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p95_ms': round(percentile(latencies, 95), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'balance_before_fold_ok': abs(unfolded['balance'] - expected) < 0.01,
+        'balance_after_fold_ok': abs(folded['balance'] - expected) < 0.01,
+    }
+
+async def _run(settings: list, confirmations: int, concurrency: int, mongo_url: str, db_name: str) -> list:
+    os.environ['MONGO_URL'] = mongo_url
+    os.environ['DB_NAME'] = db_name
+    import database
+
+    await database.connect_to_mongo()
+    await database.client.drop_database(db_name)
+    await database.create_indexes()
+    results = []
+    for shards in settings:
+        results.append(await _run_setting(shards, confirmations, concurrency))
+    await database.client.drop_database(db_name)
+    await database.close_mongo_connection()
+    return results
+
+@app.command()
+def run(
+    confirmations: int = typer.Option(5000, help="Confirmations per shard setting"),
+    concurrency: int = typer.Option(64, help="Concurrent confirmations in flight"),
+    shards: str = typer.Option("0,8,32", help="Comma-separated shard counts (0 = unsharded)"),
+    mongo_url: str = typer.Option("mongodb://localhost:27017", help="MongoDB connection string"),
+    db_name: str = typer.Option("marketplace_wallet_bench", help="Scratch database (dropped)"),
+    output: Path = typer.Option(Path("benchmarks/results/wallet_contention.json"), help="JSON report path"),
+):
+    """Compare unsharded and sharded wallet counters under contention"""
+    settings = [int(s) for s in shards.split(',') if s.strip()]
+    results = asyncio.run(_run(settings, confirmations, concurrency, mongo_url, db_name))
+
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    for r in results:
+        typer.echo(f"  shards={r['shards']:<3} {r['confirmations_per_second']:>9}/s "
+                   f"p50={r['p50_ms']}ms p99={r['p99_ms']}ms "
+                   f"consistent={r['balance_before_fold_ok'] and r['balance_after_fold_ok']}")
+    typer.echo(f"Report written to {output}")
+
+if __name__ == "__main__":
+    app()
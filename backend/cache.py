@@ -0,0 +1,335 @@
+"""
+Shared read cache for public data.
+
+Two tiers:
+
+- a per-worker in-memory LRU (`MemoryCache`), always on, and
+- an optional shared Redis tier (`RedisCache`, CACHE_BACKEND=redis), so a
+  value loaded by one uvicorn worker serves all of them.
+
+Lookups go local -> shared -> loader. Writes that change cached data call
+`invalidate` / `invalidate_prefix`: the shared tier is cleared and the keys are
+published on INVALIDATION_CHANNEL, which every worker subscribes to and uses
+to drop its local copies. Pub/sub is best-effort, so local entries also expire
+after CACHE_LOCAL_SECONDS; with the memory backend alone, only the writing
+worker is invalidated and the others catch up within that TTL.
+
+`get_or_load` single-flights misses (concurrent loads of one key share one
+loader call) and, given `stale`, serves an expired value for that much longer
+while a single background call refreshes it. Invalidated keys are deleted,
+never served stale.
+
+Values are encoded with bson.json_util for Redis, so datetimes survive the
+round-trip.
+"""
+from typing import Any, Awaitable, Callable, Optional
+from collections import OrderedDict
+from bson import json_util
+import asyncio
+import contextvars
+import logging
+import os
+import time
+
+from metrics import registry, record_cache_hit, record_cache_miss
+from singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory')  # memory | redis
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+CACHE_PREFIX = os.environ.get('CACHE_PREFIX', 'marketplace:')
+CACHE_LOCAL_SECONDS = float(os.environ.get('CACHE_LOCAL_SECONDS', '10'))
+CACHE_LOCAL_MAX_ENTRIES = int(os.environ.get('CACHE_LOCAL_MAX_ENTRIES', '10000'))
+# Default TTLs for public read routes
+PUBLIC_CACHE_SECONDS = float(os.environ.get('PUBLIC_CACHE_SECONDS', '300'))
+PUBLIC_LIST_CACHE_SECONDS = float(os.environ.get('PUBLIC_LIST_CACHE_SECONDS', '30'))
+# How long an expired public entry may still be served while it is refreshed
+PUBLIC_STALE_SECONDS = float(os.environ.get('PUBLIC_STALE_SECONDS', '60'))
+INVALIDATION_CHANNEL = CACHE_PREFIX + 'invalidate'
+
+cache_stale_served_total = registry.counter(
+    'cache_stale_served_total',
+    'Reads answered with an expired entry while a background refresh reloads it',
+    ('cache',)
+)
+
+def _cache_name(key: str) -> str:
+    """Metrics label: the key's namespace (e.g. "package" for "package:123")"""
+    return key.split(':', 1)[0]
+
+# ============================================================
+# BACKENDS
+# ============================================================
+
+class MemoryCache:
+    """In-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries: int = CACHE_LOCAL_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()  # key -> (expires_at, value)
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    async def set(self, key: str, value: Any, ttl: float):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def delete(self, *keys: str):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def delete_prefix(self, prefix: str):
+        for key in [k for k in self._entries if k.startswith(prefix)]:
+            del self._entries[key]
+
+    async def clear(self):
+        self._entries.clear()
+
+class RedisCache:
+    """Shared tier on Redis (requires the `redis` package)"""
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = CACHE_PREFIX, client=None):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    async def get(self, key: str) -> Optional[Any]:
+        raw = await self.client.get(self.prefix + key)
+        return json_util.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, value: Any, ttl: float):
+        await self.client.set(self.prefix + key, json_util.dumps(value), px=int(ttl * 1000))
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self.client.delete(*(self.prefix + k for k in keys))
+
+    async def delete_prefix(self, prefix: str):
+        # Invalidations are rare next to reads, so a SCAN here is acceptable
+        batch = []
+        async for key in self.client.scan_iter(match=self.prefix + prefix + '*', count=500):
+            batch.append(key)
+            if len(batch) >= 500:
+                await self.client.delete(*batch)
+                batch = []
+        if batch:
+            await self.client.delete(*batch)
+
+    async def publish(self, message: str):
+        await self.client.publish(INVALIDATION_CHANNEL, message)
+
+    async def close(self):
+        await self.client.aclose()
+
+# ============================================================
+# TWO-TIER CACHE
+# ============================================================
+
+class TieredCache:
+    """Local LRU in front of an optional shared backend, with pub/sub invalidation"""
+
+    def __init__(self, shared: Optional[RedisCache] = None,
+                 local_ttl: float = CACHE_LOCAL_SECONDS):
+        self.local = MemoryCache()
+        self.shared = shared
+        self.local_ttl = local_ttl
+        self._subscriber: Optional[asyncio.Task] = None
+        self.flights = SingleFlight()
+        self._background: set = set()
+        self._refreshing: set = set()
+        self._generation = 0  # bumped by every invalidation
+
+    async def _get_entry(self, key: str) -> Optional[dict]:
+        entry = await self.local.get(key)
+        if entry is not None:
+            record_cache_hit(_cache_name(key))
+            return entry
+        if self.shared:
+            try:
+                entry = await self.shared.get(key)
+            except Exception as e:
+                logger.warning(f"Shared cache get failed for {key}: {e}")
+                entry = None
+            if entry is not None:
+                record_cache_hit(_cache_name(key))
+                await self.local.set(key, entry, self.local_ttl)
+                return entry
+        record_cache_miss(_cache_name(key))
+        return None
+
+    async def get(self, key: str) -> Optional[Any]:
+        """Cached value, fresh or stale"""
+        entry = await self._get_entry(key)
+        return entry['value'] if entry else None
+
+    async def set(self, key: str, value: Any, ttl: float, stale: float = 0.0):
+        """Cache value as fresh for ttl, then servable stale for another `stale` seconds"""
+        entry = {'value': value, 'fresh_until': time.time() + ttl}
+        await self.local.set(key, entry, min(ttl + stale, self.local_ttl) if self.shared else ttl + stale)
+        if self.shared:
+            try:
+                await self.shared.set(key, entry, ttl + stale)
+            except Exception as e:
+                logger.warning(f"Shared cache set failed for {key}: {e}")
+
+    async def get_or_load(self, key: str, ttl: float,
+                          loader: Callable[[], Awaitable[Optional[Any]]],
+                          stale: float = 0.0) -> Optional[Any]:
+        """Cached value, or the loader's result (cached unless None)
+
+        Concurrent misses for a key share one loader call. With `stale`, an
+        expired value is still returned for that long while one background
+        call refreshes it.
+        """
+        entry = await self._get_entry(key)
+        if entry is None:
+            return await self.flights.do(key, lambda: self._load(key, ttl, loader, stale))
+        if entry['fresh_until'] <= time.time():
+            self._refresh(key, ttl, loader, stale)
+        return entry['value']
+
+    async def _load(self, key: str, ttl: float, loader: Callable[[], Awaitable[Optional[Any]]],
+                    stale: float) -> Optional[Any]:
+        generation = self._generation
+        value = await loader()
+        # Don't cache a value read before an invalidation that landed meanwhile
+        if value is not None and generation == self._generation:
+            await self.set(key, value, ttl, stale)
+        return value
+
+    def _refresh(self, key: str, ttl: float, loader: Callable[[], Awaitable[Optional[Any]]],
+                 stale: float):
+        """Reload a stale key in the background, once however many readers see it"""
+        cache_stale_served_total.inc(cache=_cache_name(key))
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+
+        async def refresh():
+            try:
+                await self.flights.do(key, lambda: self._load(key, ttl, loader, stale))
+            except Exception as e:
+                # Keep serving the stale value until it expires
+                logger.warning(f"Background refresh failed for {key}: {e}")
+            finally:
+                self._refreshing.discard(key)
+
+        # Outside the request's context: the reader's response doesn't wait for it
+        task = asyncio.get_running_loop().create_task(refresh(), context=contextvars.Context())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def invalidate(self, *keys: str):
+        """Drop keys here, in the shared tier and (via pub/sub) in every other worker"""
+        self._generation += 1
+        await self.local.delete(*keys)
+        await self._invalidate_shared(self.shared.delete(*keys) if self.shared else None,
+                                      *('key:' + k for k in keys))
+
+    async def invalidate_prefix(self, prefix: str):
+        """Drop every key starting with prefix, everywhere"""
+        self._generation += 1
+        await self.local.delete_prefix(prefix)
+        await self._invalidate_shared(self.shared.delete_prefix(prefix) if self.shared else None,
+                                      'prefix:' + prefix)
+
+    async def _invalidate_shared(self, delete: Optional[Awaitable], *messages: str):
+        if not self.shared:
+            return
+        try:
+            await delete
+            for message in messages:
+                await self.shared.publish(message)
+        except Exception as e:
+            logger.warning(f"Shared cache invalidation failed: {e}")
+
+    async def _apply(self, message: str):
+        kind, _, key = message.partition(':')
+        self._generation += 1
+        if kind == 'key':
+            await self.local.delete(key)
+        elif kind == 'prefix':
+            await self.local.delete_prefix(key)
+
+    async def _listen(self):
+        while True:
+            try:
+                pubsub = self.shared.client.pubsub()
+                await pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Anything published while we were disconnected is lost
+                await self.local.clear()
+                async for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        data = message['data']
+                        await self._apply(data.decode() if isinstance(data, bytes) else data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Cache invalidation subscriber failed, reconnecting: {e}")
+                await asyncio.sleep(1)
+
+    def start(self):
+        """Subscribe to invalidations; call from the running event loop"""
+        if self.shared and (self._subscriber is None or self._subscriber.done()):
+            self._subscriber = asyncio.get_running_loop().create_task(self._listen())
+
+    async def stop(self):
+        for task in list(self._background):
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        if self._subscriber:
+            self._subscriber.cancel()
+            await asyncio.gather(self._subscriber, return_exceptions=True)
+            self._subscriber = None
+        if self.shared:
+            await self.shared.close()
+
+def build_cache() -> TieredCache:
+    if CACHE_BACKEND == 'redis':
+        return TieredCache(shared=RedisCache())
+    return TieredCache()
+
+cache = build_cache()
+
+def start_cache():
+    cache.start()
+
+async def stop_cache():
+    await cache.stop()
+
+# ============================================================
+# INVALIDATION
+# ============================================================
+
+async def invalidate_package(package_id: str):
+    """A package changed: its details and every package listing"""
+    await cache.invalidate(f"package:{package_id}")
+    await cache.invalidate_prefix("packages:")
+
+async def invalidate_vendor(vendor_id: str, visibility: bool = False):
+    """A vendor changed; with visibility, its approval did, which gates its packages and reviews too"""
+    await cache.invalidate(f"vendor:{vendor_id}")
+    await cache.invalidate_prefix("vendors:")
+    if visibility:
+        # Package keys don't carry the vendor id, so drop them all (approvals are rare)
+        await cache.invalidate_prefix("package:")
+        await cache.invalidate_prefix("packages:")
+        await cache.invalidate_prefix(f"reviews:{vendor_id}:")
+
+async def invalidate_reviews(vendor_id: str):
+    """A vendor's reviews changed: its review pages and rating summary"""
+    await cache.invalidate(f"rating:{vendor_id}")
+    await cache.invalidate_prefix(f"reviews:{vendor_id}:")
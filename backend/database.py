@@ -1,8 +1,20 @@
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReadPreference
+from pymongo.errors import CollectionInvalid
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import SecondaryPreferred, Secondary, Nearest, PrimaryPreferred
+from pymongo.write_concern import WriteConcern
+from bson import json_util
+from contextlib import asynccontextmanager
 from typing import Optional
+import base64
 import os
 from dotenv import load_dotenv
 from pathlib import Path
+import logging
+
+from db_monitoring import command_listener
+from request_context import get_request_context
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -10,28 +22,105 @@ load_dotenv(ROOT_DIR / '.env')
 # MongoDB connection
 mongo_url = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
 db_name = os.environ.get('DB_NAME', 'marketplace_db')
+slow_queries_capped_mb = int(os.environ.get('SLOW_QUERY_CAPPED_SIZE_MB', '64'))
+# Reads that tolerate replication lag (public browsing, dashboards, analytics)
+tolerant_read_preference = os.environ.get('TOLERANT_READ_PREFERENCE', 'secondaryPreferred')
+# Secondaries further behind than this are not read from (MongoDB minimum: 90)
+max_staleness_seconds = int(os.environ.get('MAX_STALENESS_SECONDS', '90'))
+
+logger = logging.getLogger(__name__)
 
 client: Optional[AsyncIOMotorClient] = None
 db = None
+read_db = None
+causal_db = None
+
+_READ_PREFERENCES = {
+    'secondaryPreferred': SecondaryPreferred,
+    'secondary': Secondary,
+    'nearest': Nearest,
+    'primaryPreferred': PrimaryPreferred,
+}
+
+def get_tolerant_read_preference():
+    """TOLERANT_READ_PREFERENCE, bounded by MAX_STALENESS_SECONDS"""
+    mode = _READ_PREFERENCES.get(tolerant_read_preference)
+    if mode is None:
+        return ReadPreference.PRIMARY
+    return mode(max_staleness=max_staleness_seconds)
 
 async def connect_to_mongo():
     """Connect to MongoDB"""
-    global client, db
-    client = AsyncIOMotorClient(mongo_url)
+    global client, db, read_db, causal_db
+    client = AsyncIOMotorClient(mongo_url, event_listeners=[command_listener])
     db = client[db_name]
-    print(f"Connected to MongoDB: {db_name}")
+    read_db = client.get_database(db_name, read_preference=get_tolerant_read_preference())
+    causal_db = client.get_database(
+        db_name, read_concern=ReadConcern('majority'), write_concern=WriteConcern('majority')
+    )
+    logger.info(f"Connected to MongoDB: {db_name} (tolerant reads: {tolerant_read_preference})")
 
 async def close_mongo_connection():
     """Close MongoDB connection"""
     global client
     if client:
         client.close()
-        print("Closed MongoDB connection")
+        logger.info("Closed MongoDB connection")
 
 def get_database():
     """Get database instance"""
     return db
 
+def get_read_database():
+    """Database for reads that tolerate replication lag (up to MAX_STALENESS_SECONDS)"""
+    return read_db if read_db is not None else db
+
+def get_causal_database():
+    """Primary with majority read/write concern, for use inside causal_session()"""
+    return causal_db if causal_db is not None else db
+
+# ============================================================
+# CAUSAL CONSISTENCY
+# ============================================================
+
+def encode_causal_token(cluster_time: dict, operation_time) -> str:
+    """Opaque X-Causal-Token value for a session's cluster and operation time"""
+    # Canonical JSON keeps the signed $clusterTime's Int64 keyId intact
+    raw = json_util.dumps({'cluster_time': cluster_time, 'operation_time': operation_time},
+                          json_options=json_util.CANONICAL_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_causal_token(token: Optional[str]) -> Optional[dict]:
+    """Inverse of encode_causal_token; None for a missing or malformed token"""
+    if not token:
+        return None
+    try:
+        data = json_util.loads(base64.urlsafe_b64decode(token.encode()))
+        return {'cluster_time': data['cluster_time'], 'operation_time': data['operation_time']}
+    except (ValueError, KeyError, TypeError):
+        return None
+
+@asynccontextmanager
+async def causal_session():
+    """Causally consistent session that continues from the request's X-Causal-Token
+
+    Reads in the session see every write made before the token was issued, even
+    across primary failover; the token is refreshed from the session on exit and
+    returned to the client by the HTTP middleware.
+    """
+    context = get_request_context()
+    async with await client.start_session(causal_consistency=True) as session:
+        token = context.causal_token if context else None
+        if token and token['cluster_time'] is not None:
+            session.advance_cluster_time(token['cluster_time'])
+        if token and token['operation_time'] is not None:
+            session.advance_operation_time(token['operation_time'])
+        yield session
+        if context and session.operation_time is not None:
+            context.causal_token = {'cluster_time': session.cluster_time,
+                                    'operation_time': session.operation_time}
+            context.causal_token_issued = True
+
 # Collection names
 COLLECTIONS = {
     'users': 'users',
@@ -46,8 +135,32 @@ COLLECTIONS = {
     'vendor_rating_summary': 'vendor_rating_summary',
     'notifications': 'notifications',
     'commission_settings': 'commission_settings',
+    'slow_queries': 'slow_queries',
+    'vendor_wallet_shards': 'vendor_wallet_shards',
+    'scheduler_leases': 'scheduler_leases',
+    'ledger_sequences': 'ledger_sequences',
+    'wallet_checkpoints': 'wallet_checkpoints',
+    'job_checkpoints': 'job_checkpoints',
+    'reconciliation_runs': 'reconciliation_runs',
+    'revenue_rollups': 'revenue_rollups',
+    'slot_holds': 'slot_holds',
+    'waitlist_entries': 'waitlist_entries',
+    'bookings_archive': 'bookings_archive',
+    'settlement_transactions_archive': 'settlement_transactions_archive',
+    'vendor_slot_utilization': 'vendor_slot_utilization',
+    'request_profiles': 'request_profiles',
 }
 
+async def create_capped_collection(name: str, size_bytes: int):
+    """Create a capped collection unless it already exists"""
+    if name in await db.list_collection_names():
+        return
+    try:
+        await db.create_collection(name, capped=True, size=size_bytes)
+    except CollectionInvalid:
+        # Another worker created it first
+        pass
+
 async def create_indexes():
     """Create database indexes for performance"""
     global db
@@ -55,44 +168,109 @@ async def create_indexes():
         return
     
     # Users indexes
+    await db[COLLECTIONS['users']].create_index('id', unique=True)
     await db[COLLECTIONS['users']].create_index('email', unique=True)
     await db[COLLECTIONS['users']].create_index('supabase_user_id')
     
     # Vendors indexes
+    await db[COLLECTIONS['vendors']].create_index('id', unique=True)
     await db[COLLECTIONS['vendors']].create_index('user_id')
     await db[COLLECTIONS['vendors']].create_index('status')
     await db[COLLECTIONS['vendors']].create_index('is_approved')
     
     # Packages indexes
+    await db[COLLECTIONS['packages']].create_index('id', unique=True)
     await db[COLLECTIONS['packages']].create_index('vendor_id')
     await db[COLLECTIONS['packages']].create_index('is_active')
     await db[COLLECTIONS['packages']].create_index([('vendor_id', 1), ('is_active', 1)])
     
     # Time slots indexes
+    await db[COLLECTIONS['time_slots']].create_index('id', unique=True)
     await db[COLLECTIONS['time_slots']].create_index('vendor_id')
     await db[COLLECTIONS['time_slots']].create_index('slot_date')
     await db[COLLECTIONS['time_slots']].create_index([('vendor_id', 1), ('slot_date', 1)])
+    await db[COLLECTIONS['time_slots']].create_index('ends_at')
+    await db[COLLECTIONS['time_slots']].create_index('compaction_run', sparse=True)
+    await db[COLLECTIONS['vendor_slot_utilization']].create_index([('vendor_id', 1), ('slot_date', 1)], unique=True)
     
     # Bookings indexes
+    await db[COLLECTIONS['bookings']].create_index('id', unique=True)
     await db[COLLECTIONS['bookings']].create_index('vendor_id')
     await db[COLLECTIONS['bookings']].create_index('customer_id')
     await db[COLLECTIONS['bookings']].create_index('package_id')
     await db[COLLECTIONS['bookings']].create_index('status')
     await db[COLLECTIONS['bookings']].create_index([('vendor_id', 1), ('status', 1)])
+    await db[COLLECTIONS['bookings']].create_index('created_at')
+    await db[COLLECTIONS['bookings']].create_index([('vendor_id', 1), ('created_at', 1)])
+    # Lifecycle jobs: stale pendings, bookings per ended slot, in-flight seat releases
+    await db[COLLECTIONS['bookings']].create_index([('status', 1), ('created_at', 1)])
+    await db[COLLECTIONS['bookings']].create_index([('time_slot_id', 1), ('status', 1)])
+    await db[COLLECTIONS['bookings']].create_index('release_run', sparse=True)
+    
+    # Slot holds indexes (TTL removes holds a day after expiry; the sweeper releases seats first)
+    await db[COLLECTIONS['slot_holds']].create_index('id', unique=True)
+    await db[COLLECTIONS['slot_holds']].create_index([('status', 1), ('expires_at', 1)])
+    await db[COLLECTIONS['slot_holds']].create_index('sweep_run', sparse=True)
+    await db[COLLECTIONS['slot_holds']].create_index('expires_at', expireAfterSeconds=86400)
+    
+    # Waitlist indexes (the head of a slot's queue is one index seek)
+    await db[COLLECTIONS['waitlist_entries']].create_index('id', unique=True)
+    await db[COLLECTIONS['waitlist_entries']].create_index([('time_slot_id', 1), ('position', 1)], unique=True)
+    await db[COLLECTIONS['waitlist_entries']].create_index([('time_slot_id', 1), ('status', 1), ('position', 1)])
     
     # Wallets indexes
     await db[COLLECTIONS['vendor_wallets']].create_index('vendor_id', unique=True)
+    await db[COLLECTIONS['vendor_wallet_shards']].create_index([('vendor_id', 1), ('shard', 1)], unique=True)
     
     # Payouts indexes
+    await db[COLLECTIONS['payouts']].create_index('id', unique=True)
     await db[COLLECTIONS['payouts']].create_index('vendor_id')
     await db[COLLECTIONS['payouts']].create_index('status')
     await db[COLLECTIONS['payouts']].create_index([('vendor_id', 1), ('status', 1)])
+    await db[COLLECTIONS['payouts']].create_index('payout_run_id', sparse=True)
+    await db[COLLECTIONS['payouts']].create_index('created_at')
+    await db[COLLECTIONS['payouts']].create_index([('vendor_id', 1), ('created_at', 1)])
     
     # Settlement transactions indexes
     await db[COLLECTIONS['settlement_transactions']].create_index('vendor_id')
     await db[COLLECTIONS['settlement_transactions']].create_index('booking_id')
+    await db[COLLECTIONS['settlement_transactions']].create_index(
+        [('vendor_id', 1), ('sequence', 1)], unique=True,
+        partialFilterExpression={'sequence': {'$exists': True}}
+    )
+    await db[COLLECTIONS['settlement_transactions']].create_index([('vendor_id', 1), ('created_at', 1)])
+    await db[COLLECTIONS['settlement_transactions']].create_index('created_at')
+    
+    # Archive indexes (history reads fan out here; see archive.py)
+    await db[COLLECTIONS['bookings_archive']].create_index('id', unique=True)
+    await db[COLLECTIONS['bookings_archive']].create_index([('vendor_id', 1), ('created_at', -1)])
+    await db[COLLECTIONS['bookings_archive']].create_index([('customer_id', 1), ('created_at', -1)])
+    await db[COLLECTIONS['bookings_archive']].create_index('created_at')
+    await db[COLLECTIONS['settlement_transactions_archive']].create_index([('vendor_id', 1), ('sequence', 1)])
+    await db[COLLECTIONS['settlement_transactions_archive']].create_index([('vendor_id', 1), ('created_at', 1)])
+    await db[COLLECTIONS['settlement_transactions_archive']].create_index('booking_id')
+    await db[COLLECTIONS['settlement_transactions_archive']].create_index('created_at')
+    
+    # Request profiles indexes (TTL removes them at expires_at)
+    await db[COLLECTIONS['request_profiles']].create_index('id', unique=True)
+    await db[COLLECTIONS['request_profiles']].create_index([('route', 1), ('created_at', -1)])
+    await db[COLLECTIONS['request_profiles']].create_index('created_at')
+    await db[COLLECTIONS['request_profiles']].create_index('expires_at', expireAfterSeconds=0)
+    
+    # Wallet checkpoints indexes
+    await db[COLLECTIONS['wallet_checkpoints']].create_index([('vendor_id', 1), ('sequence', 1)], unique=True)
+    await db[COLLECTIONS['wallet_checkpoints']].create_index([('vendor_id', 1), ('as_of', 1)])
+    
+    # Revenue rollups indexes ($merge matches on the unique key)
+    await db[COLLECTIONS['revenue_rollups']].create_index([('vendor_id', 1), ('day', 1), ('status', 1)], unique=True)
+    await db[COLLECTIONS['revenue_rollups']].create_index('day')
+    await db[COLLECTIONS['bookings']].create_index('updated_at')
+    
+    # Reconciliation runs indexes
+    await db[COLLECTIONS['reconciliation_runs']].create_index('started_at')
     
     # Reviews indexes
+    await db[COLLECTIONS['reviews']].create_index('id', unique=True)
     await db[COLLECTIONS['reviews']].create_index('vendor_id')
     await db[COLLECTIONS['reviews']].create_index('customer_id')
     await db[COLLECTIONS['reviews']].create_index('booking_id', unique=True)
@@ -104,4 +282,7 @@ async def create_indexes():
     await db[COLLECTIONS['notifications']].create_index('user_id')
     await db[COLLECTIONS['notifications']].create_index([('user_id', 1), ('is_read', 1)])
     
-    print("Created database indexes")
+    # Slow-query log (capped, oldest entries roll off)
+    await create_capped_collection(COLLECTIONS['slow_queries'], slow_queries_capped_mb * 1024 * 1024)
+    
+    logger.info("Created database indexes")
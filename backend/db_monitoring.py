@@ -0,0 +1,136 @@
+"""
+MongoDB command monitoring.
+
+A pymongo CommandListener registered on the Motor client. Motor runs pymongo
+on an executor thread, so these callbacks fire off the event loop and must
+stay cheap and thread-safe.
+"""
+from pymongo import monitoring
+from typing import Dict, Tuple, Callable, List, Optional
+import threading
+import time
+import logging
+
+from metrics import mongo_commands_total, mongo_command_duration_seconds
+from request_context import get_request_context
+
+logger = logging.getLogger(__name__)
+
+# Commands whose value is not a collection name
+_COLLECTIONLESS_COMMANDS = {
+    'ping', 'hello', 'ismaster', 'isMaster', 'buildInfo', 'buildinfo',
+    'endSessions', 'saslStart', 'saslContinue', 'getLastError',
+    'listCollections', 'listDatabases', 'serverStatus', 'explain',
+}
+
+def command_collection(command_name: str, command: dict) -> str:
+    """Extract the target collection from a command document"""
+    if command_name in _COLLECTIONLESS_COMMANDS:
+        return 'none'
+    if command_name == 'getMore':
+        return str(command.get('collection', 'none'))
+    value = command.get(command_name)
+    if isinstance(value, str):
+        return value
+    return 'none'
+
+def command_filter(command_name: str, command: dict) -> dict:
+    """Extract the query filter from a command document, if it has one"""
+    if command_name in ('find', 'delete', 'count', 'distinct'):
+        if command_name == 'delete':
+            deletes = command.get('deletes') or [{}]
+            return deletes[0].get('q') or {}
+        return command.get('filter') or command.get('query') or {}
+    if command_name == 'update':
+        updates = command.get('updates') or [{}]
+        return updates[0].get('q') or {}
+    if command_name == 'findAndModify':
+        return command.get('query') or {}
+    if command_name == 'aggregate':
+        pipeline = command.get('pipeline') or []
+        if pipeline and '$match' in pipeline[0]:
+            return pipeline[0]['$match']
+    return {}
+
+def query_shape(command_name: str, collection: str, command: dict) -> Tuple:
+    """Shape of a command ignoring parameter values, for N+1 detection"""
+    filter_doc = command_filter(command_name, command)
+    keys = tuple(sorted(filter_doc.keys())) if isinstance(filter_doc, dict) else ()
+    return (command_name, collection, keys)
+
+class CommandRecord:
+    """A finished MongoDB command, as handed to observers"""
+    __slots__ = ('command_name', 'collection', 'command', 'database_name',
+                 'started_at', 'duration', 'outcome', 'context')
+
+    def __init__(self, command_name: str, collection: str, command: dict, database_name: str,
+                 started_at: float, duration: float, outcome: str, context):
+        self.command_name = command_name
+        self.collection = collection
+        self.command = command
+        self.database_name = database_name
+        self.started_at = started_at  # wall clock, seconds since epoch
+        self.duration = duration  # seconds
+        self.outcome = outcome
+        self.context = context  # RequestContext or None
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Record latency and outcome of every MongoDB command"""
+
+    def __init__(self):
+        self._pending: Dict[Tuple, Tuple] = {}
+        self._lock = threading.Lock()
+        self._observers: List[Callable[[CommandRecord], None]] = []
+
+    def add_observer(self, observer: Callable[[CommandRecord], None]):
+        """Call observer(record) after every command; runs on executor threads"""
+        if observer not in self._observers:
+            self._observers.append(observer)
+
+    def remove_observer(self, observer: Callable[[CommandRecord], None]):
+        if observer in self._observers:
+            self._observers.remove(observer)
+
+    @staticmethod
+    def _event_key(event) -> Tuple:
+        return (event.connection_id, event.request_id)
+
+    def started(self, event):
+        collection = command_collection(event.command_name, event.command)
+        context = get_request_context()
+        if context is not None:
+            context.record_db_call(query_shape(event.command_name, collection, event.command))
+        with self._lock:
+            self._pending[self._event_key(event)] = (
+                collection, context, event.command, event.database_name, time.time()
+            )
+
+    def _finish(self, event, outcome: str):
+        with self._lock:
+            pending: Optional[Tuple] = self._pending.pop(self._event_key(event), None)
+        if pending is None:
+            return
+        collection, context, command, database_name, started_at = pending
+        duration = event.duration_micros / 1_000_000
+        if context is not None:
+            context.record_db_time(duration)
+        mongo_commands_total.inc(collection=collection, command=event.command_name, outcome=outcome)
+        mongo_command_duration_seconds.observe(duration, collection=collection, command=event.command_name)
+
+        if self._observers:
+            record = CommandRecord(event.command_name, collection, command, database_name,
+                                   started_at, duration, outcome, context)
+            for observer in list(self._observers):
+                try:
+                    observer(record)
+                except Exception:
+                    # Monitoring must never break the command that triggered it
+                    logger.debug("Command observer failed", exc_info=True)
+
+    def succeeded(self, event):
+        self._finish(event, 'success')
+
+    def failed(self, event):
+        self._finish(event, 'failure')
+
+command_listener = MongoCommandListener()
@@ -0,0 +1,230 @@
+"""
+Append-only wallet ledger with checkpointed running balances.
+
+Every credit and debit to a vendor wallet is recorded in
+`settlement_transactions` with a per-vendor `sequence`. The sequence and the
+entry's `created_at` are allocated together from `ledger_sequences`, so
+created_at never decreases as the sequence grows. A scheduled job writes a
+`wallet_checkpoints` document every LEDGER_CHECKPOINT_INTERVAL entries; the
+balance at any point is the nearest checkpoint plus a bounded tail of entries.
+"""
+from typing import Optional, List, Tuple, Dict
+from datetime import datetime, timedelta
+from pymongo import ReturnDocument, DESCENDING, ASCENDING
+import asyncio
+import os
+
+from database import get_database, COLLECTIONS
+from archive import find_with_archive, union_with_archive
+from models import SettlementTransaction, WalletCheckpoint, WalletStatement, WalletStatementEntry
+
+LEDGER_CHECKPOINT_INTERVAL = int(os.environ.get('LEDGER_CHECKPOINT_INTERVAL', '100'))
+LEDGER_CHECKPOINT_JOB_SECONDS = float(os.environ.get('LEDGER_CHECKPOINT_JOB_SECONDS', '300'))
+# Entries younger than this may still have lower-sequence writes in flight
+LEDGER_SETTLE_SECONDS = 60
+
+# ============================================================
+# RECORDING
+# ============================================================
+
+async def allocate_sequences(vendor_id: str, count: int = 1) -> Tuple[int, datetime]:
+    """Reserve `count` sequences; returns (first sequence, entry timestamp)"""
+    db = get_database()
+    counter = await db[COLLECTIONS['ledger_sequences']].find_one_and_update(
+        {'_id': vendor_id},
+        {'$inc': {'seq': count}, '$max': {'last_at': datetime.utcnow()}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter['seq'] - count + 1, counter['last_at']
+
+def build_ledger_entry(vendor_id: str, transaction_type: str, net_amount: float,
+                       gross_amount: float = 0.0, commission_amount: float = 0.0,
+                       booking_id: Optional[str] = None, payout_id: Optional[str] = None,
+                       settled_at: Optional[datetime] = None,
+                       reconciliation_run_id: Optional[str] = None) -> SettlementTransaction:
+    """Ledger entry without a sequence yet (see allocate_sequences)"""
+    return SettlementTransaction(
+        vendor_id=vendor_id,
+        booking_id=booking_id,
+        transaction_type=transaction_type,
+        gross_amount=gross_amount,
+        commission_amount=commission_amount,
+        net_amount=net_amount,
+        payout_id=payout_id,
+        reconciliation_run_id=reconciliation_run_id,
+        settled_at=settled_at
+    )
+
+async def record_ledger_entry(vendor_id: str, transaction_type: str, net_amount: float,
+                              gross_amount: float = 0.0, commission_amount: float = 0.0,
+                              booking_id: Optional[str] = None, payout_id: Optional[str] = None,
+                              settled_at: Optional[datetime] = None,
+                              reconciliation_run_id: Optional[str] = None) -> SettlementTransaction:
+    """Append one entry to a vendor's ledger"""
+    db = get_database()
+    entry = build_ledger_entry(vendor_id, transaction_type, net_amount, gross_amount,
+                               commission_amount, booking_id, payout_id, settled_at,
+                               reconciliation_run_id)
+    entry.sequence, entry.created_at = await allocate_sequences(vendor_id)
+    await db[COLLECTIONS['settlement_transactions']].insert_one(entry.dict())
+    return entry
+
+async def record_ledger_entries(entries: List[SettlementTransaction]):
+    """Append many entries: one sequence allocation per vendor and one insert"""
+    if not entries:
+        return
+    db = get_database()
+    by_vendor: Dict[str, List[SettlementTransaction]] = {}
+    for entry in entries:
+        by_vendor.setdefault(entry.vendor_id, []).append(entry)
+
+    vendor_ids = list(by_vendor)
+    allocations = await asyncio.gather(*(
+        allocate_sequences(vendor_id, len(by_vendor[vendor_id])) for vendor_id in vendor_ids
+    ))
+    for vendor_id, (first_sequence, created_at) in zip(vendor_ids, allocations):
+        for offset, entry in enumerate(by_vendor[vendor_id]):
+            entry.sequence = first_sequence + offset
+            entry.created_at = created_at
+    await db[COLLECTIONS['settlement_transactions']].insert_many(
+        [entry.dict() for entry in entries], ordered=False
+    )
+
+# ============================================================
+# CHECKPOINTS
+# ============================================================
+
+async def get_checkpoint(vendor_id: str, as_of: Optional[datetime] = None,
+                         max_sequence: Optional[int] = None) -> Optional[dict]:
+    """Latest checkpoint at or before a timestamp and/or sequence"""
+    db = get_database()
+    query = {'vendor_id': vendor_id}
+    if as_of is not None:
+        query['as_of'] = {'$lte': as_of}
+    if max_sequence is not None:
+        query['sequence'] = {'$lte': max_sequence}
+    return await db[COLLECTIONS['wallet_checkpoints']].find_one(
+        query, sort=[('sequence', DESCENDING)]
+    )
+
+async def checkpoint_vendor_ledger(vendor_id: str) -> int:
+    """Write checkpoints for a vendor's settled entries; returns how many"""
+    db = get_database()
+    checkpoint = await get_checkpoint(vendor_id)
+    balance = checkpoint['balance'] if checkpoint else 0.0
+    last_sequence = checkpoint['sequence'] if checkpoint else 0
+    settled_before = datetime.utcnow() - timedelta(seconds=LEDGER_SETTLE_SECONDS)
+
+    cursor = db[COLLECTIONS['settlement_transactions']].find(
+        {'vendor_id': vendor_id, 'sequence': {'$gt': last_sequence},
+         'created_at': {'$lte': settled_before}},
+        {'sequence': 1, 'net_amount': 1, 'created_at': 1}
+    ).sort('sequence', ASCENDING).batch_size(1000)
+
+    written = 0
+    since_checkpoint = 0
+    async for entry in cursor:
+        balance = round(balance + entry['net_amount'], 2)
+        since_checkpoint += 1
+        if since_checkpoint < LEDGER_CHECKPOINT_INTERVAL:
+            continue
+        await db[COLLECTIONS['wallet_checkpoints']].update_one(
+            {'vendor_id': vendor_id, 'sequence': entry['sequence']},
+            {'$setOnInsert': WalletCheckpoint(
+                vendor_id=vendor_id, sequence=entry['sequence'],
+                balance=balance, as_of=entry['created_at']
+            ).dict()},
+            upsert=True
+        )
+        last_sequence = entry['sequence']
+        since_checkpoint = 0
+        written += 1
+
+    if written:
+        await db[COLLECTIONS['ledger_sequences']].update_one(
+            {'_id': vendor_id}, {'$max': {'checkpointed_seq': last_sequence}}
+        )
+    return written
+
+async def checkpoint_ledgers() -> dict:
+    """Scheduled job: checkpoint every vendor with a long uncheckpointed tail"""
+    db = get_database()
+    cursor = db[COLLECTIONS['ledger_sequences']].find(
+        {'$expr': {'$gte': [
+            {'$subtract': ['$seq', {'$ifNull': ['$checkpointed_seq', 0]}]},
+            LEDGER_CHECKPOINT_INTERVAL
+        ]}},
+        {'_id': 1}
+    )
+    vendors = 0
+    checkpoints = 0
+    async for counter in cursor:
+        written = await checkpoint_vendor_ledger(counter['_id'])
+        vendors += 1 if written else 0
+        checkpoints += written
+    return {'vendors': vendors, 'checkpoints': checkpoints}
+
+# ============================================================
+# BALANCES & STATEMENTS
+# ============================================================
+
+async def ledger_balance(vendor_id: str, as_of: Optional[datetime] = None,
+                         max_sequence: Optional[int] = None) -> float:
+    """Balance after all entries up to as_of and/or max_sequence"""
+    db = get_database()
+    checkpoint = await get_checkpoint(vendor_id, as_of=as_of, max_sequence=max_sequence)
+    balance = checkpoint['balance'] if checkpoint else 0.0
+
+    tail_match = {'vendor_id': vendor_id,
+                  'sequence': {'$gt': checkpoint['sequence'] if checkpoint else 0}}
+    if max_sequence is not None:
+        tail_match['sequence']['$lte'] = max_sequence
+    if as_of is not None:
+        tail_match['created_at'] = {'$lte': as_of}
+
+    # An older checkpoint (as_of in the past) can leave archived rows in the tail
+    tail = await db[COLLECTIONS['settlement_transactions']].aggregate([
+        {'$match': tail_match},
+        union_with_archive('settlement_transactions', tail_match),
+        {'$group': {'_id': None, 'net': {'$sum': '$net_amount'}}},
+    ]).to_list(1)
+    if tail:
+        balance += tail[0]['net']
+    return round(balance, 2)
+
+async def get_wallet_statement(vendor_id: str, as_of: Optional[datetime] = None,
+                               cursor: Optional[int] = None, limit: int = 50) -> WalletStatement:
+    """Ledger entries up to as_of, newest first, with running balances"""
+    as_of = as_of or datetime.utcnow()
+
+    # Pre-ledger rows have no sequence; a range predicate also keeps the partial index usable
+    query = {'vendor_id': vendor_id, 'sequence': {'$gt': 0}, 'created_at': {'$lte': as_of}}
+    if cursor is not None:
+        query['sequence']['$lt'] = cursor
+    entries = await find_with_archive('settlement_transactions', query, 'sequence', limit=limit + 1)
+
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    balance = await ledger_balance(vendor_id, as_of=as_of)
+    if entries:
+        # Balance right after the newest entry on this page
+        running = balance if cursor is None else await ledger_balance(
+            vendor_id, as_of=as_of, max_sequence=entries[0]['sequence']
+        )
+    else:
+        running = balance
+
+    statement_entries: List[WalletStatementEntry] = []
+    for entry in entries:
+        statement_entries.append(WalletStatementEntry(**entry, balance_after=running))
+        running = round(running - entry['net_amount'], 2)
+
+    return WalletStatement(
+        vendor_id=vendor_id,
+        as_of=as_of,
+        balance=balance,
+        entries=statement_entries,
+        next_cursor=entries[-1]['sequence'] if has_more else None
+    )
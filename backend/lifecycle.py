@@ -0,0 +1,137 @@
+"""
+Booking lifecycle jobs.
+
+`expire_pending_bookings` cancels bookings still pending PENDING_BOOKING_TTL_HOURS
+after creation, found with a range query on the (status, created_at) index.
+The cancellation itself claims them (`release_run`), their seats are then
+released with one update per slot and the freed seats are offered to the
+slot's waitlist. Claims left behind by a crashed run are retaken after
+RELEASE_CLAIM_SECONDS, so seats are never leaked or released twice.
+
+`complete_flown_bookings` marks confirmed bookings completed once their slot
+has ended. It walks time slots by `ends_at` from a watermark in
+`job_checkpoints` and completes each batch of slots with one `bulk_write`.
+"""
+from typing import List
+from datetime import datetime, timedelta
+from pymongo import UpdateOne, UpdateMany
+import os
+import uuid
+
+from database import get_database, COLLECTIONS
+from models import BookingStatus
+from metrics import registry
+from waitlist import promote_waitlist
+
+PENDING_BOOKING_TTL_HOURS = float(os.environ.get('PENDING_BOOKING_TTL_HOURS', '24'))
+BOOKING_LIFECYCLE_INTERVAL_SECONDS = float(os.environ.get('BOOKING_LIFECYCLE_INTERVAL_SECONDS', '300'))
+# Time after a slot ends before its bookings count as flown
+COMPLETION_GRACE_MINUTES = float(os.environ.get('COMPLETION_GRACE_MINUTES', '60'))
+# Slots re-checked behind the watermark, for bookings confirmed after the slot ended
+COMPLETION_LOOKBACK_HOURS = 24
+COMPLETION_BATCH_SLOTS = 500
+RELEASE_CLAIM_SECONDS = 300
+COMPLETION_JOB = 'booking_completion'
+
+booking_lifecycle_total = registry.counter(
+    'booking_lifecycle_total',
+    'Bookings expired or completed by the lifecycle jobs',
+    ('action',)
+)
+
+async def _release_claimed_seats(run_id: str) -> dict:
+    """Release seats of bookings claimed by run_id, one update per slot"""
+    db = get_database()
+    bookings = db[COLLECTIONS['bookings']]
+    seats_by_slot = {}
+    async for booking in bookings.aggregate([
+        {'$match': {'release_run': run_id, 'time_slot_id': {'$ne': None}}},
+        {'$group': {'_id': '$time_slot_id', 'seats': {'$sum': {'$ifNull': ['$seats', 1]}}}},
+    ]):
+        seats_by_slot[booking['_id']] = booking['seats']
+
+    if seats_by_slot:
+        now = datetime.utcnow()
+        await db[COLLECTIONS['time_slots']].bulk_write([
+            UpdateOne({'id': slot_id},
+                      {'$inc': {'booked_count': -seats}, '$set': {'is_available': True, 'updated_at': now}})
+            for slot_id, seats in seats_by_slot.items()
+        ], ordered=False)
+    released = await bookings.update_many(
+        {'release_run': run_id}, {'$unset': {'release_run': '', 'release_claimed_at': ''}}
+    )
+    for slot_id in seats_by_slot:
+        await promote_waitlist(slot_id)
+    return {'bookings': released.modified_count, 'seats': sum(seats_by_slot.values()),
+            'slots': len(seats_by_slot)}
+
+async def expire_pending_bookings() -> dict:
+    """Scheduled job: cancel stale pending bookings and free their seats"""
+    db = get_database()
+    bookings = db[COLLECTIONS['bookings']]
+    now = datetime.utcnow()
+    run_id = str(uuid.uuid4())
+
+    # Retake releases abandoned by a crashed run
+    await bookings.update_many(
+        {'release_run': {'$exists': True},
+         'release_claimed_at': {'$lt': now - timedelta(seconds=RELEASE_CLAIM_SECONDS)}},
+        {'$set': {'release_run': run_id, 'release_claimed_at': now}}
+    )
+    expired = await bookings.update_many(
+        {'status': BookingStatus.pending.value,
+         'created_at': {'$lt': now - timedelta(hours=PENDING_BOOKING_TTL_HOURS)}},
+        {'$set': {'status': BookingStatus.cancelled.value,
+                  'cancelled_at': now,
+                  'updated_at': now,
+                  'cancellation_reason': 'Expired: not confirmed in time',
+                  'release_run': run_id,
+                  'release_claimed_at': now}}
+    )
+    released = await _release_claimed_seats(run_id)
+    booking_lifecycle_total.inc(expired.modified_count, action='expired')
+    return {'expired': expired.modified_count, 'released_seats': released['seats']}
+
+async def _complete_slots(slots: List[dict]) -> int:
+    """Complete confirmed bookings of ended slots in one bulk write"""
+    db = get_database()
+    now = datetime.utcnow()
+    result = await db[COLLECTIONS['bookings']].bulk_write([
+        UpdateMany({'time_slot_id': slot['id'], 'status': BookingStatus.confirmed.value},
+                   {'$set': {'status': BookingStatus.completed.value,
+                             'completed_at': slot['ends_at'],
+                             'updated_at': now}})
+        for slot in slots
+    ], ordered=False)
+    return result.modified_count
+
+async def complete_flown_bookings() -> dict:
+    """Scheduled job: mark confirmed bookings of ended slots completed"""
+    db = get_database()
+    checkpoints = db[COLLECTIONS['job_checkpoints']]
+    cutoff = datetime.utcnow() - timedelta(minutes=COMPLETION_GRACE_MINUTES)
+
+    state = await checkpoints.find_one({'_id': COMPLETION_JOB})
+    query = {'ends_at': {'$lt': cutoff}}
+    if state:
+        query['ends_at']['$gte'] = state['watermark'] - timedelta(hours=COMPLETION_LOOKBACK_HOURS)
+
+    cursor = db[COLLECTIONS['time_slots']].find(
+        query, {'_id': 0, 'id': 1, 'ends_at': 1}
+    ).sort('ends_at', 1).batch_size(COMPLETION_BATCH_SLOTS)
+
+    slots_checked = completed = 0
+    batch: List[dict] = []
+    async for slot in cursor:
+        batch.append(slot)
+        if len(batch) >= COMPLETION_BATCH_SLOTS:
+            completed += await _complete_slots(batch)
+            slots_checked += len(batch)
+            batch = []
+    if batch:
+        completed += await _complete_slots(batch)
+        slots_checked += len(batch)
+
+    await checkpoints.update_one({'_id': COMPLETION_JOB}, {'$set': {'watermark': cutoff}}, upsert=True)
+    booking_lifecycle_total.inc(completed, action='completed')
+    return {'slots_checked': slots_checked, 'completed': completed}
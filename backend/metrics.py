@@ -0,0 +1,250 @@
+"""
+In-process metrics registry with Prometheus text exposition.
+
+Counters, gauges and histograms are kept in memory per worker and rendered
+in the Prometheus text format (version 0.0.4) at /api/metrics. No client
+library is required.
+"""
+from typing import Dict, Tuple, Sequence
+import threading
+
+# Default latency buckets in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelValues = Tuple[str, ...]
+
+# ============================================================
+# METRIC TYPES
+# ============================================================
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Dict[str, str] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.extend(f'{n}="{_escape(v)}"' for n, v in extra.items())
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+class _Metric:
+    metric_type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # pymongo listeners fire from executor threads, so guard all writes
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(n, '')) for n in self.labelnames)
+
+    def header(self) -> list:
+        return [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.metric_type}',
+        ]
+
+class Counter(_Metric):
+    metric_type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        lines = self.header()
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+class Gauge(_Metric):
+    metric_type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def get(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> list:
+        with self._lock:
+            items = list(self._values.items())
+        lines = self.header()
+        for key, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+class Histogram(_Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = [0] * (len(self.buckets) + 1) + [0.0]
+                self._values[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self) -> list:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = self.header()
+        bounds = self.buckets + (float('inf'),)
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(bounds, series[:-1]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, {'le': _format_value(bound)})
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(series[-1])}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+# ============================================================
+# REGISTRY
+# ============================================================
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render all metrics in Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# ============================================================
+# APPLICATION METRICS
+# ============================================================
+
+http_requests_total = registry.counter(
+    'http_requests_total',
+    'Total HTTP requests by route template, method and status code',
+    ('method', 'route', 'status')
+)
+http_request_duration_seconds = registry.histogram(
+    'http_request_duration_seconds',
+    'HTTP request latency by route template',
+    ('method', 'route')
+)
+http_requests_in_flight = registry.gauge(
+    'http_requests_in_flight',
+    'HTTP requests currently being served'
+)
+mongo_commands_total = registry.counter(
+    'mongo_commands_total',
+    'MongoDB commands by collection, command name and outcome',
+    ('collection', 'command', 'outcome')
+)
+mongo_command_duration_seconds = registry.histogram(
+    'mongo_command_duration_seconds',
+    'MongoDB command latency by collection and command name',
+    ('collection', 'command')
+)
+cache_requests_total = registry.counter(
+    'cache_requests_total',
+    'Cache lookups by cache name and result (hit or miss)',
+    ('cache', 'result')
+)
+
+def record_cache_hit(cache: str):
+    """Count a cache hit for the named cache"""
+    cache_requests_total.inc(cache=cache, result='hit')
+
+def record_cache_miss(cache: str):
+    """Count a cache miss for the named cache"""
+    cache_requests_total.inc(cache=cache, result='miss')
+
+def _cache_hit_ratio_lines() -> list:
+    """Derive cache_hit_ratio gauges from the hit/miss counters"""
+    totals: Dict[str, list] = {}
+    with cache_requests_total._lock:
+        items = list(cache_requests_total._values.items())
+    for (cache, result), value in items:
+        entry = totals.setdefault(cache, [0.0, 0.0])
+        entry[0 if result == 'hit' else 1] += value
+
+    lines = [
+        '# HELP cache_hit_ratio Fraction of cache lookups served from cache',
+        '# TYPE cache_hit_ratio gauge',
+    ]
+    for cache, (hits, misses) in totals.items():
+        total = hits + misses
+        ratio = hits / total if total else 0.0
+        lines.append(f'cache_hit_ratio{_format_labels(("cache",), (cache,))} {_format_value(ratio)}')
+    return lines
+
+def render_metrics() -> str:
+    """Render the full metrics payload served at /api/metrics"""
+    return registry.render() + '\n'.join(_cache_hit_ratio_lines()) + '\n'
@@ -1,9 +1,14 @@
-from pydantic import BaseModel, Field, EmailStr, field_validator
-from typing import List, Optional, Literal
-from datetime import datetime
+from pydantic import BaseModel, Field, EmailStr, field_validator, model_validator
+from typing import List, Optional, Literal, Dict
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+import os
 import uuid
 from enum import Enum
 
+# Time zone that slot_date / start_time / end_time are given in
+SLOT_TIMEZONE = ZoneInfo(os.environ.get('SLOT_TIMEZONE', 'UTC'))
+
 # ============================================================
 # ENUMS
 # ============================================================
@@ -146,6 +151,11 @@ class PackageUpdate(BaseModel):
 # TIME SLOT / AVAILABILITY MODELS
 # ============================================================
 
+def slot_ends_at(slot_date: str, end_time: str) -> datetime:
+    """End of a slot as naive UTC (slot times are in SLOT_TIMEZONE)"""
+    local = datetime.strptime(f"{slot_date} {end_time}", "%Y-%m-%d %H:%M").replace(tzinfo=SLOT_TIMEZONE)
+    return local.astimezone(timezone.utc).replace(tzinfo=None)
+
 class TimeSlot(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     vendor_id: str
@@ -153,12 +163,19 @@ class TimeSlot(BaseModel):
     slot_date: str  # YYYY-MM-DD format
     start_time: str  # HH:MM format
     end_time: str  # HH:MM format
+    ends_at: Optional[datetime] = None  # slot_date + end_time in UTC, for range queries
     capacity: int
     booked_count: int = 0
     is_available: bool = True
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+    @model_validator(mode='after')
+    def fill_ends_at(self):
+        if self.ends_at is None:
+            self.ends_at = slot_ends_at(self.slot_date, self.end_time)
+        return self
+
 class TimeSlotCreate(BaseModel):
     vendor_id: str
     package_id: Optional[str] = None
@@ -171,10 +188,41 @@ class TimeSlotUpdate(BaseModel):
     capacity: Optional[int] = None
     is_available: Optional[bool] = None
 
+class SlotUtilizationDay(BaseModel):
+    slot_date: str
+    slots: int
+    capacity: int
+    booked: int
+    full_slots: int
+    utilization: float  # booked / capacity
+
+class SlotHoldStatus(str, Enum):
+    active = "active"
+    converted = "converted"
+    released = "released"
+    expiring = "expiring"  # Claimed by the sweeper
+    expired = "expired"
+
+class SlotHold(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    time_slot_id: str
+    seats: int
+    customer_id: Optional[str] = None
+    status: SlotHoldStatus = SlotHoldStatus.active
+    expires_at: datetime
+    booking_id: Optional[str] = None  # Set when converted
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class SlotHoldCreate(BaseModel):
+    time_slot_id: str
+    seats: int = Field(1, ge=1, le=20)
+
 # ============================================================
 # BOOKING MODELS
 # ============================================================
 
+MAX_SEATS_PER_BOOKING = 20
+
 class Booking(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     customer_id: Optional[str] = None  # User ID if logged in
@@ -186,9 +234,10 @@ class Booking(BaseModel):
     customer_name: str
     customer_email: EmailStr
     customer_phone: Optional[str] = None
+    seats: int = 1  # Passengers on this booking
     
     # Financial details
-    total_amount: float
+    total_amount: float  # package price x seats
     commission_amount: float  # Platform commission
     vendor_amount: float  # Amount vendor receives
     
@@ -216,6 +265,47 @@ class BookingCreate(BaseModel):
     customer_name: str
     customer_email: EmailStr
     customer_phone: Optional[str] = None
+    seats: int = Field(1, ge=1, le=MAX_SEATS_PER_BOOKING)
+    hold_id: Optional[str] = None  # Slot hold to convert instead of reserving seats
+    notes: Optional[str] = None
+
+class BookingBatchCreate(BaseModel):
+    bookings: List[BookingCreate] = Field(..., min_length=1, max_length=20)
+
+class WaitlistStatus(str, Enum):
+    waiting = "waiting"
+    promoting = "promoting"  # Claimed by a promotion in progress
+    promoted = "promoted"
+    left = "left"
+    skipped = "skipped"  # Package or vendor no longer bookable at promotion time
+
+class WaitlistEntry(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    time_slot_id: str
+    position: int  # FIFO order within the slot
+    customer_id: Optional[str] = None
+    vendor_id: str
+    package_id: str
+    customer_name: str
+    customer_email: EmailStr
+    customer_phone: Optional[str] = None
+    seats: int = 1
+    notes: Optional[str] = None
+    status: WaitlistStatus = WaitlistStatus.waiting
+    booking_id: Optional[str] = None  # Set when promoted (assigned up front while promoting)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    promoting_at: Optional[datetime] = None  # When the current promotion claimed the entry
+    seats_reserved: bool = False  # The promotion in progress has taken the seats
+    promoted_at: Optional[datetime] = None
+
+class WaitlistJoin(BaseModel):
+    vendor_id: str
+    package_id: str
+    time_slot_id: str
+    customer_name: str
+    customer_email: EmailStr
+    customer_phone: Optional[str] = None
+    seats: int = Field(1, ge=1, le=MAX_SEATS_PER_BOOKING)
     notes: Optional[str] = None
 
 class BookingUpdate(BaseModel):
@@ -262,6 +352,8 @@ class Payout(BaseModel):
     settlement_notes: Optional[str] = None
     payout_method: Optional[str] = None  # "bank_transfer", "stripe", etc.
     payout_reference: Optional[str] = None  # Transaction reference
+    payout_run_id: Optional[str] = None  # Set for payouts created by a payout run
+    wallet_debit_pending: bool = False  # Completed; wallet debit and ledger entry not yet applied
     
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
@@ -277,6 +369,43 @@ class PayoutSettle(BaseModel):
     payout_reference: Optional[str] = None
     status: Literal["completed", "failed"]
 
+class PayoutRunCreate(BaseModel):
+    min_balance: float = Field(500.0, gt=0)  # Pay out vendors with at least this much available
+    payout_method: Optional[str] = "bank_transfer"
+    dry_run: bool = False
+
+class PayoutRun(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    min_balance: float
+    dry_run: bool = False
+    vendor_count: int = 0
+    total_amount: float = 0.0
+    payouts: List[Payout] = []
+    created_by: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class PayoutBatchItem(BaseModel):
+    payout_id: str
+    status: Literal["completed", "failed"]
+    settlement_notes: Optional[str] = None
+    payout_reference: Optional[str] = None
+
+class PayoutBatchSettle(BaseModel):
+    items: List[PayoutBatchItem] = Field(..., min_length=1, max_length=5000)
+
+class PayoutItemResult(BaseModel):
+    payout_id: str
+    result: Literal["completed", "failed", "not_found", "already_settled"]
+    vendor_id: Optional[str] = None
+    amount: Optional[float] = None
+
+class PayoutBatchResult(BaseModel):
+    completed: int = 0
+    failed: int = 0
+    skipped: int = 0
+    total_paid_out: float = 0.0
+    results: List[PayoutItemResult] = []
+
 # ============================================================
 # SETTLEMENT TRANSACTION MODELS
 # ============================================================
@@ -284,18 +413,38 @@ class PayoutSettle(BaseModel):
 class SettlementTransaction(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     vendor_id: str
-    booking_id: str
+    booking_id: Optional[str] = None  # Not set for payouts and adjustments
     
-    transaction_type: Literal["booking_earnings", "commission_deducted", "payout"]
+    transaction_type: Literal["booking_earnings", "commission_deducted", "payout", "adjustment"]
     gross_amount: float
     commission_amount: float
-    net_amount: float
+    net_amount: float  # Signed change to the wallet balance (negative for payouts)
     
     payout_id: Optional[str] = None
+    reconciliation_run_id: Optional[str] = None  # Set for adjustments made by wallet reconciliation
     settled_at: Optional[datetime] = None
     
+    sequence: Optional[int] = None  # Per-vendor ledger position, monotonically increasing
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class WalletCheckpoint(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    vendor_id: str
+    sequence: int  # Balance includes every ledger entry up to this sequence
+    balance: float
+    as_of: datetime  # created_at of the entry at `sequence`
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
+class WalletStatementEntry(SettlementTransaction):
+    balance_after: float
+
+class WalletStatement(BaseModel):
+    vendor_id: str
+    as_of: datetime
+    balance: float  # Balance at `as_of`
+    entries: List[WalletStatementEntry]  # Newest first
+    next_cursor: Optional[int] = None  # Pass as `cursor` for the next (older) page
+
 # ============================================================
 # REVIEW MODELS
 # ============================================================
@@ -345,6 +494,7 @@ class NotificationType(str, Enum):
     booking_cancelled = "booking_cancelled"
     payout_processed = "payout_processed"
     system_alert = "system_alert"
+    waitlist_promoted = "waitlist_promoted"
 
 class Notification(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -404,3 +554,19 @@ class AdminDashboardStats(BaseModel):
     total_revenue: float
     total_commission: float
     pending_payouts: float
+
+class RevenuePoint(BaseModel):
+    period_start: datetime
+    bookings: int
+    seats: int = 0
+    gross: float
+    commission: float
+    vendor_net: float
+    by_status: Dict[str, int] = {}  # Booking count per status
+
+class RevenueSeries(BaseModel):
+    interval: Literal["day", "week", "month"]
+    start_date: datetime
+    end_date: datetime
+    vendor_id: Optional[str] = None
+    points: List[RevenuePoint]  # Oldest first; periods without bookings are omitted
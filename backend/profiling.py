@@ -0,0 +1,218 @@
+"""
+Opt-in per-request profiling for admins.
+
+A request sent with `X-Profile: 1` (or `?profile=1`) by an admin, checked
+through `auth.require_role`, is run under a stack sampler. A daemon thread
+captures the event loop thread's Python stack every
+PROFILE_SAMPLE_INTERVAL_MS. The result is stored in `request_profiles` for
+PROFILE_RETENTION_HOURS together with the MongoDB commands the request issued
+(offset, duration, query shape). Its id is returned in `X-Profile-Id`, and
+the stacks download in collapsed format (`a;b;c count` lines, as read by
+flamegraph.pl and speedscope).
+
+A sampler is used rather than cProfile: cProfile follows one thread's calls
+and attributes every coroutine the loop resumes to whoever is running, while
+a sampler costs nothing between samples and shows time spent waiting (samples
+in the selector are the loop idling on I/O). Other requests served
+concurrently by the same worker show up too, so only one request per worker
+is profiled at a time. Streaming bodies (exports) are profiled up to the
+first byte.
+"""
+from typing import Dict, List, Optional
+from collections import Counter
+from datetime import datetime, timedelta
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+import asyncio
+import contextvars
+import os
+import sys
+import threading
+import time
+import uuid
+
+from auth import get_current_user, require_role
+from database import get_database, COLLECTIONS
+from db_monitoring import command_listener, CommandRecord
+from metrics import registry
+from models import UserRole
+from request_context import get_request_context
+from slow_query_log import command_query_shape
+
+PROFILE_HEADER = 'x-profile'
+PROFILE_QUERY_PARAM = 'profile'
+PROFILE_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', '5'))
+# Sampling stops after this long; the request itself carries on
+PROFILE_MAX_SECONDS = float(os.environ.get('PROFILE_MAX_SECONDS', '30'))
+PROFILE_RETENTION_HOURS = float(os.environ.get('PROFILE_RETENTION_HOURS', '72'))
+PROFILE_MAX_DEPTH = 128
+
+request_profiles_total = registry.counter(
+    'request_profiles_total',
+    'Requests run under the profiler',
+    ('route',)
+)
+
+_require_admin = require_role([UserRole.admin])
+_active = threading.Lock()  # one profiled request per worker
+
+# ============================================================
+# STACK SAMPLER
+# ============================================================
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{code.co_name}"
+
+def collapse_stack(frame) -> str:
+    """Frame and its callers as 'outer;...;inner'"""
+    names = []
+    while frame is not None and len(names) < PROFILE_MAX_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread"""
+
+    def __init__(self, thread_id: int, interval: float = PROFILE_SAMPLE_INTERVAL_MS / 1000,
+                 max_seconds: float = PROFILE_MAX_SECONDS):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+                self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        """Samples in collapsed-stack format, heaviest first"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+# ============================================================
+# PROFILED REQUESTS
+# ============================================================
+
+class RequestProfile:
+    """Sampler plus DB command timeline for one request"""
+
+    def __init__(self, context):
+        self.id = str(uuid.uuid4())
+        self.context = context
+        self.started_at = time.time()
+        self.sampler = StackSampler(threading.get_ident())
+        self.timeline: List[dict] = []
+        self._lock = threading.Lock()
+
+    def on_command(self, record: CommandRecord):
+        """CommandListener observer; runs on a Motor executor thread"""
+        if record.context is not self.context:
+            return
+        entry = {
+            'offset_ms': round((record.started_at - self.started_at) * 1000, 3),
+            'duration_ms': round(record.duration * 1000, 3),
+            'command_name': record.command_name,
+            'collection': record.collection,
+            'shape': command_query_shape(record),
+            'outcome': record.outcome,
+        }
+        with self._lock:
+            self.timeline.append(entry)
+
+    def start(self):
+        command_listener.add_observer(self.on_command)
+        self.sampler.start()
+
+    def stop(self):
+        self.sampler.stop()
+        command_listener.remove_observer(self.on_command)
+
+    def to_document(self, user: dict, status: int) -> dict:
+        now = datetime.utcnow()
+        context = self.context
+        return {
+            'id': self.id,
+            'method': context.method,
+            'path': context.path,
+            'route': context.route,
+            'status': status,
+            'user_id': user['id'],
+            'duration_ms': round((time.time() - self.started_at) * 1000, 3),
+            'db_calls': context.db_calls,
+            'db_time_ms': round(context.db_time * 1000, 3),
+            'sample_interval_ms': PROFILE_SAMPLE_INTERVAL_MS,
+            'samples': self.sampler.samples,
+            'collapsed': self.sampler.collapsed(),
+            'timeline': sorted(self.timeline, key=lambda e: e['offset_ms']),
+            'created_at': now,
+            'expires_at': now + timedelta(hours=PROFILE_RETENTION_HOURS),
+        }
+
+def profiling_requested(request: Request) -> bool:
+    flag = request.headers.get(PROFILE_HEADER) or request.query_params.get(PROFILE_QUERY_PARAM)
+    return flag is not None and flag.lower() in ('1', 'true', 'yes')
+
+async def _store(document: dict):
+    await get_database()[COLLECTIONS['request_profiles']].insert_one(document)
+
+async def profile_requests(request: Request, call_next):
+    """HTTP middleware: profile requests that ask for it, if sent by an admin"""
+    if not profiling_requested(request):
+        return await call_next(request)
+
+    try:
+        user = await _require_admin(await get_current_user(request.headers.get('authorization')))
+    except HTTPException as e:
+        return JSONResponse({'detail': e.detail}, status_code=e.status_code)
+    if not _active.acquire(blocking=False):
+        return JSONResponse({'detail': 'Another request is being profiled on this worker'},
+                            status_code=429)
+
+    try:
+        profile = RequestProfile(get_request_context())
+        profile.start()
+        try:
+            response = await call_next(request)
+        finally:
+            profile.stop()
+        request_profiles_total.inc(route=profile.context.route)
+        # Stored outside the request's context so the insert isn't on its timeline or budget
+        await asyncio.get_running_loop().create_task(
+            _store(profile.to_document(user, response.status_code)), context=contextvars.Context()
+        )
+        response.headers['X-Profile-Id'] = profile.id
+        return response
+    finally:
+        _active.release()
+
+# ============================================================
+# DOWNLOAD
+# ============================================================
+
+async def list_profiles(limit: int = 20, route: Optional[str] = None) -> List[dict]:
+    """Most recent stored profiles, without their samples and timelines"""
+    db = get_database()
+    query = {'route': route} if route else {}
+    return await db[COLLECTIONS['request_profiles']].find(
+        query, {'_id': 0, 'collapsed': 0, 'timeline': 0}
+    ).sort('created_at', -1).limit(limit).to_list(limit)
+
+async def get_profile(profile_id: str) -> Optional[Dict]:
+    return await get_database()[COLLECTIONS['request_profiles']].find_one({'id': profile_id}, {'_id': 0})
@@ -0,0 +1,114 @@
+"""
+Per-request DB round-trip budget and N+1 query detection.
+
+Every MongoDB command issued while serving a request is counted on the
+RequestContext by the command listener. When the request finishes, the count
+is checked against the route's budget. Overruns are logged, or raised as
+QueryBudgetExceeded in strict mode (always on under pytest) so regressions in
+routes/ fail the test suite.
+"""
+from typing import Dict
+import os
+import logging
+
+from metrics import registry
+from request_context import RequestContext
+
+logger = logging.getLogger(__name__)
+
+# Default budget for any route without an explicit entry below
+DEFAULT_QUERY_BUDGET = int(os.environ.get('DB_QUERY_BUDGET', '10'))
+
+# Same query shape repeated this many times in one request looks like N+1
+N_PLUS_ONE_THRESHOLD = int(os.environ.get('DB_N_PLUS_ONE_THRESHOLD', '5'))
+
+# Route template -> max DB round-trips per request, as measured by the route tests in
+# tests/test_query_budget.py. Cached public reads are 0: their loads run through
+# single-flight outside the request (see singleflight.py).
+ROUTE_QUERY_BUDGETS: Dict[str, int] = {
+    '/api/bookings': 5,
+    '/api/bookings/batch': 5,
+    '/api/bookings/holds': 3,
+    '/api/bookings/{booking_id}/status': 9,
+    '/api/bookings/{booking_id}': 2,
+    '/api/bookings/my-bookings': 3,
+    '/api/packages': 0,
+    '/api/packages/{package_id}': 0,
+    '/api/time-slots/availability/{package_id}': 3,
+    '/api/vendors': 0,
+    '/api/vendors/{vendor_id}': 0,
+    '/api/vendors/dashboard': 7,
+    '/api/reviews/vendor/{vendor_id}': 0,
+    '/api/admin/dashboard': 5,
+    '/api/admin/payouts': 2,
+}
+
+db_queries_per_request = registry.histogram(
+    'db_queries_per_request',
+    'MongoDB round-trips per HTTP request by route template',
+    ('route',),
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50)
+)
+db_query_budget_exceeded_total = registry.counter(
+    'db_query_budget_exceeded_total',
+    'Requests that exceeded their DB round-trip budget',
+    ('route',)
+)
+
+class QueryBudgetExceeded(Exception):
+    """Raised in strict mode when a request exceeds its DB round-trip budget"""
+
+def is_strict() -> bool:
+    if 'PYTEST_CURRENT_TEST' in os.environ:
+        return True
+    return os.environ.get('DB_QUERY_BUDGET_STRICT', '').lower() in ('1', 'true', 'yes')
+
+def get_route_budget(route: str) -> int:
+    return ROUTE_QUERY_BUDGETS.get(route, DEFAULT_QUERY_BUDGET)
+
+# Route template -> [requests, total queries, max queries]
+_route_stats: Dict[str, list] = {}
+
+def query_report() -> Dict[str, dict]:
+    """Per-route queries-per-request breakdown for this worker"""
+    report = {}
+    for route, (requests, total, maximum) in sorted(_route_stats.items()):
+        report[route] = {
+            'requests': requests,
+            'avg_queries': round(total / requests, 2) if requests else 0.0,
+            'max_queries': maximum,
+            'budget': get_route_budget(route),
+        }
+    return report
+
+def reset_query_report():
+    _route_stats.clear()
+
+def check_query_budget(context: RequestContext):
+    """Record the request's DB call count and enforce its budget"""
+    route = context.route
+    calls = context.db_calls
+
+    stats = _route_stats.setdefault(route, [0, 0, 0])
+    stats[0] += 1
+    stats[1] += calls
+    stats[2] = max(stats[2], calls)
+    db_queries_per_request.observe(calls, route=route)
+
+    repeated = {shape: count for shape, count in context.query_shapes.items()
+                if count >= N_PLUS_ONE_THRESHOLD}
+    for (command, collection, keys), count in repeated.items():
+        logger.warning(
+            f"Possible N+1 on {context.method} {route}: {command} on {collection} "
+            f"with filter keys {list(keys)} ran {count} times"
+        )
+
+    budget = get_route_budget(route)
+    if calls <= budget:
+        return
+
+    db_query_budget_exceeded_total.inc(route=route)
+    message = f"{context.method} {route} made {calls} DB round-trips (budget {budget})"
+    if is_strict():
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
@@ -0,0 +1,190 @@
+"""
+Wallet reconciliation.
+
+Checks every vendor wallet against its history:
+
+    balance == sum(settlement net_amount, excluding payout and adjustment entries)
+               - sum(completed payout amounts whose wallet debit has been applied)
+
+With fix, a drifted wallet is moved onto that value, and the ledger gets an
+`adjustment` entry (tagged with the run id) for whatever it needs to agree
+with the wallet again: -drift when the ledger shared the wallet's error,
+nothing when only the wallet was off. Adjustments are left out of the history
+above, so a corrected vendor stays reconciled on the next run.
+
+Vendors are processed in vendor_id order in batches. Each batch runs one
+`$group` aggregation per source (settlements, payouts, wallet shards)
+restricted to the batch's vendor ids, so no transaction is ever loaded into
+the application. Batches run in waves of `concurrency`, and after each wave
+the last vendor_id is saved to `job_checkpoints`, so an interrupted run can
+resume where it stopped.
+"""
+from typing import Optional, List, Dict
+from datetime import datetime
+import asyncio
+import logging
+import uuid
+
+from database import get_database, COLLECTIONS
+from wallet_shards import increment_wallet, shard_amount
+from ledger import record_ledger_entry
+from archive import union_with_archive
+
+logger = logging.getLogger(__name__)
+
+RECONCILIATION_JOB = 'wallet_reconciliation'
+# Differences below this are rounding noise
+DRIFT_TOLERANCE = 0.01
+# Drifts kept on the run document; the rest are only counted
+MAX_REPORTED_DRIFTS = 1000
+
+async def _sum_by_vendor(collection: str, match: dict, field: str, archived: bool = False) -> Dict[str, float]:
+    db = get_database()
+    pipeline = [{'$match': match}]
+    if archived:
+        pipeline.append(union_with_archive(collection, match))
+    cursor = db[COLLECTIONS[collection]].aggregate(pipeline + [
+        {'$group': {'_id': '$vendor_id', 'total': {'$sum': field}}},
+    ], allowDiskUse=True)
+    return {row['_id']: row['total'] async for row in cursor}
+
+async def expected_balances(vendor_ids: List[str]) -> Dict[str, float]:
+    """Balance implied by settlements and completed payouts, per vendor"""
+    earnings, payouts = await asyncio.gather(
+        _sum_by_vendor('settlement_transactions',
+                       {'vendor_id': {'$in': vendor_ids}, 'transaction_type': {'$nin': ['payout', 'adjustment']}},
+                       '$net_amount', archived=True),
+        _sum_by_vendor('payouts',
+                       # A payout whose debit is still pending isn't in the wallet or ledger yet
+                       {'vendor_id': {'$in': vendor_ids}, 'status': 'completed',
+                        'wallet_debit_pending': {'$ne': True}},
+                       '$amount'),
+    )
+    return {v: round(earnings.get(v, 0.0) - payouts.get(v, 0.0), 2) for v in vendor_ids}
+
+async def wallet_balances(wallets: List[dict]) -> Dict[str, float]:
+    """Wallet balances including unfolded shard amounts"""
+    vendor_ids = [w['vendor_id'] for w in wallets]
+    shards = await _sum_by_vendor('vendor_wallet_shards',
+                                  {'vendor_id': {'$in': vendor_ids}}, shard_amount('balance'))
+    return {w['vendor_id']: round(w.get('balance', 0.0) + shards.get(w['vendor_id'], 0.0), 2)
+            for w in wallets}
+
+async def _find_drifts(wallets: List[dict]) -> List[dict]:
+    vendor_ids = [w['vendor_id'] for w in wallets]
+    expected, actual = await asyncio.gather(expected_balances(vendor_ids), wallet_balances(wallets))
+    return [
+        {'vendor_id': v, 'wallet_balance': actual[v], 'expected_balance': expected[v],
+         'drift': round(actual[v] - expected[v], 2)}
+        for v in vendor_ids if abs(actual[v] - expected[v]) >= DRIFT_TOLERANCE
+    ]
+
+async def reconcile_batch(wallets: List[dict], fix: bool = False, run_id: Optional[str] = None) -> List[dict]:
+    """Drifted vendors in a batch of wallet documents, optionally corrected"""
+    db = get_database()
+    drifts = await _find_drifts(wallets)
+    if not drifts:
+        return []
+
+    # A booking or payout landing between the two reads looks like drift;
+    # only keep vendors that show the same drift on a second look
+    drifted = {d['vendor_id']: d for d in drifts}
+    fresh = await db[COLLECTIONS['vendor_wallets']].find(
+        {'vendor_id': {'$in': list(drifted)}}, {'vendor_id': 1, 'balance': 1}
+    ).to_list(None)
+    confirmed = [d for d in await _find_drifts(fresh)
+                 if abs(d['drift'] - drifted[d['vendor_id']]['drift']) < DRIFT_TOLERANCE]
+
+    for drift in confirmed:
+        drift['corrected'] = False
+    if not fix or not confirmed:
+        return confirmed
+
+    # Ledger balances (every entry, payouts and earlier adjustments included)
+    ledger = await _sum_by_vendor('settlement_transactions',
+                                  {'vendor_id': {'$in': [d['vendor_id'] for d in confirmed]}},
+                                  '$net_amount', archived=True)
+    for drift in confirmed:
+        vendor_id = drift['vendor_id']
+        # The settlement/payout history is the source of truth; move the wallet onto it
+        await increment_wallet(vendor_id, {'balance': -drift['drift']})
+        adjustment = round(drift['expected_balance'] - ledger.get(vendor_id, 0.0), 2)
+        if abs(adjustment) < DRIFT_TOLERANCE:
+            adjustment = 0.0
+        else:
+            await record_ledger_entry(vendor_id, 'adjustment', adjustment,
+                                      settled_at=datetime.utcnow(), reconciliation_run_id=run_id)
+        drift['ledger_adjustment'] = adjustment
+        drift['corrected'] = True
+    return confirmed
+
+async def reconcile_wallets(batch_size: int = 500, concurrency: int = 4, fix: bool = False,
+                            resume: bool = False) -> dict:
+    """Reconcile all vendor wallets; returns the run summary"""
+    db = get_database()
+    checkpoints = db[COLLECTIONS['job_checkpoints']]
+    checkpoint = await checkpoints.find_one({'_id': RECONCILIATION_JOB}) if resume else None
+
+    run = {
+        'id': checkpoint['run_id'] if checkpoint else str(uuid.uuid4()),
+        'started_at': datetime.utcnow(),
+        'resumed_from': checkpoint['last_vendor_id'] if checkpoint else None,
+        'fix': fix,
+        'vendors_checked': checkpoint['vendors_checked'] if checkpoint else 0,
+        'drifted_vendors': checkpoint['drifted_vendors'] if checkpoint else 0,
+        'total_drift': checkpoint['total_drift'] if checkpoint else 0.0,
+        'drifts': [],
+    }
+
+    query = {'vendor_id': {'$gt': run['resumed_from']}} if run['resumed_from'] else {}
+    cursor = db[COLLECTIONS['vendor_wallets']].find(
+        query, {'vendor_id': 1, 'balance': 1}
+    ).sort('vendor_id', 1).batch_size(batch_size)
+
+    async def flush(wave: List[List[dict]]):
+        results = await asyncio.gather(*(reconcile_batch(batch, fix, run['id']) for batch in wave))
+        for batch, drifts in zip(wave, results):
+            run['vendors_checked'] += len(batch)
+            run['drifted_vendors'] += len(drifts)
+            run['total_drift'] = round(run['total_drift'] + sum(d['drift'] for d in drifts), 2)
+            run['drifts'].extend(drifts[:MAX_REPORTED_DRIFTS - len(run['drifts'])])
+        await checkpoints.update_one(
+            {'_id': RECONCILIATION_JOB},
+            {'$set': {'run_id': run['id'], 'last_vendor_id': wave[-1][-1]['vendor_id'],
+                      'vendors_checked': run['vendors_checked'],
+                      'drifted_vendors': run['drifted_vendors'],
+                      'total_drift': run['total_drift'],
+                      'updated_at': datetime.utcnow()}},
+            upsert=True
+        )
+
+    wave: List[List[dict]] = []
+    batch: List[dict] = []
+    async for wallet in cursor:
+        batch.append(wallet)
+        if len(batch) < batch_size:
+            continue
+        wave.append(batch)
+        batch = []
+        if len(wave) == concurrency:
+            await flush(wave)
+            wave = []
+    if batch:
+        wave.append(batch)
+    if wave:
+        await flush(wave)
+
+    run['finished_at'] = datetime.utcnow()
+    await checkpoints.delete_one({'_id': RECONCILIATION_JOB})
+    await db[COLLECTIONS['reconciliation_runs']].insert_one(dict(run))
+    if run['drifted_vendors']:
+        logger.warning(f"Wallet reconciliation found {run['drifted_vendors']} drifted wallets "
+                       f"(total drift {run['total_drift']})")
+    return run
+
+async def get_reconciliation_runs(limit: int = 10) -> List[dict]:
+    """Most recent reconciliation runs, newest first"""
+    db = get_database()
+    return await db[COLLECTIONS['reconciliation_runs']].find(
+        {}, {'_id': 0}
+    ).sort('started_at', -1).limit(limit).to_list(limit)
@@ -0,0 +1,134 @@
+"""
+Batched, request-scoped document loaders.
+
+`Loader` is a DataLoader over one collection and key field: every `load(key)`
+issued in the same event-loop tick is coalesced into a single
+`find({key: {'$in': [...]}})`, and results (including misses) are memoized
+for the rest of the request, so repeated lookups of the same vendor, user or
+package cost one query per request however many helpers ask for it.
+
+Loaders live on the RequestContext. Outside a request (scheduled jobs,
+scripts) each call gets a fresh loader, so nothing is memoized across runs.
+Code that writes a document it may read again in the same request should
+`prime` (post-image) or `clear` the key.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+import asyncio
+
+from database import get_database, COLLECTIONS
+from request_context import get_request_context
+
+class Loader:
+    """Coalesces concurrent lookups by one key field into one $in query"""
+
+    def __init__(self, collection: str, key: str = 'id'):
+        self.collection = collection
+        self.key = key
+        self._futures: Dict[Any, asyncio.Future] = {}
+        self._pending: Dict[Any, asyncio.Future] = {}
+
+    def load(self, key: Any) -> 'asyncio.Future[Optional[dict]]':
+        """Document with this key (None if missing), batched with this tick's other loads"""
+        future = self._futures.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._futures[key] = loop.create_future()
+            if not self._pending:
+                loop.call_soon(lambda: asyncio.ensure_future(self._dispatch()))
+            self._pending[key] = future
+        return future
+
+    async def load_many(self, keys: Iterable[Any]) -> List[Optional[dict]]:
+        return list(await asyncio.gather(*(self.load(k) for k in keys)))
+
+    def prime(self, document: dict):
+        """Seed (or refresh) the memo with a document already in hand"""
+        key = document[self.key]
+        future = self._futures.get(key)
+        if future is None or future.done():
+            future = self._futures[key] = asyncio.get_running_loop().create_future()
+        future.set_result(document)
+
+    def clear(self, key: Any):
+        self._futures.pop(key, None)
+
+    async def _dispatch(self):
+        batch, self._pending = self._pending, {}
+        try:
+            db = get_database()
+            documents = await db[self.collection].find({self.key: {'$in': list(batch)}}).to_list(None)
+        except Exception as error:
+            for key, future in batch.items():
+                # Don't memoize failures
+                if self._futures.get(key) is future:
+                    del self._futures[key]
+                if not future.done():
+                    future.set_exception(error)
+            return
+        found = {document[self.key]: document for document in documents}
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(found.get(key))
+
+def get_loader(collection: str, key: str = 'id') -> Loader:
+    """The current request's loader for (collection, key)"""
+    context = get_request_context()
+    if context is None:
+        return Loader(COLLECTIONS[collection], key)
+    loader = context.loaders.get((collection, key))
+    if loader is None:
+        loader = context.loaders[(collection, key)] = Loader(COLLECTIONS[collection], key)
+    return loader
+
+def prime(collection: str, document: Optional[dict]):
+    """Refresh the request's memo of a document (under every key loaded) after writing it"""
+    context = get_request_context()
+    if not document or context is None:
+        return
+    get_loader(collection)
+    for (name, key), loader in context.loaders.items():
+        if name == collection and key in document:
+            loader.prime(document)
+
+# ============================================================
+# TYPED LOOKUPS
+# ============================================================
+
+async def get_user(user_id: str) -> Optional[dict]:
+    return await get_loader('users').load(user_id)
+
+async def get_user_by_auth_id(supabase_user_id: str) -> Optional[dict]:
+    user = await get_loader('users', 'supabase_user_id').load(supabase_user_id)
+    prime('users', user)
+    return user
+
+async def get_vendor(vendor_id: str) -> Optional[dict]:
+    return await get_loader('vendors').load(vendor_id)
+
+async def get_vendors(vendor_ids: Iterable[str]) -> Dict[str, dict]:
+    """Vendors by id; missing ids are left out"""
+    vendors = await get_loader('vendors').load_many(vendor_ids)
+    return {v['id']: v for v in vendors if v}
+
+async def get_vendor_by_user(user_id: str) -> Optional[dict]:
+    vendor = await get_loader('vendors', 'user_id').load(user_id)
+    prime('vendors', vendor)
+    return vendor
+
+async def get_package(package_id: str) -> Optional[dict]:
+    return await get_loader('packages').load(package_id)
+
+async def get_packages(package_ids: Iterable[str]) -> Dict[str, dict]:
+    """Packages by id; missing ids are left out"""
+    packages = await get_loader('packages').load_many(package_ids)
+    return {p['id']: p for p in packages if p}
+
+async def get_booking(booking_id: str) -> Optional[dict]:
+    """Booking by id, falling back to the archive for old completed/cancelled ones"""
+    booking = await get_loader('bookings').load(booking_id)
+    if booking is None:
+        booking = await get_loader('bookings_archive').load(booking_id)
+    return booking
+
+async def get_review(review_id: str) -> Optional[dict]:
+    return await get_loader('reviews').load(review_id)
@@ -0,0 +1,61 @@
+"""
+Request-scoped context.
+
+The HTTP middleware installs a RequestContext in a ContextVar for the
+lifetime of each request. Motor copies the current context onto its executor
+threads, so the pymongo CommandListener can attribute commands to the
+request that issued them.
+"""
+from contextvars import ContextVar
+from typing import Any, Optional, Dict, Tuple
+import threading
+import time
+
+class RequestContext:
+    """Per-request bookkeeping shared by middleware and DB listeners"""
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.method = scope.get('method', '')
+        self.path = scope.get('path', '')
+        self.started_at = time.perf_counter()
+        self.db_calls = 0
+        self.db_time = 0.0
+        # (command, collection, filter shape) -> count, used for N+1 detection
+        self.query_shapes: Dict[Tuple, int] = {}
+        # (collection, key field) -> repository.Loader, memoized for the request
+        self.loaders: Dict[Tuple[str, str], Any] = {}
+        # Cluster/operation time from X-Causal-Token, advanced by database.causal_session
+        self.causal_token: Optional[dict] = None
+        self.causal_token_issued = False
+        self._lock = threading.Lock()
+
+    @property
+    def route(self) -> str:
+        """Matched route template, available once routing has happened"""
+        route = self.scope.get('route')
+        return getattr(route, 'path', self.path)
+
+    def record_db_call(self, shape: Tuple):
+        with self._lock:
+            self.db_calls += 1
+            self.query_shapes[shape] = self.query_shapes.get(shape, 0) + 1
+
+    def record_db_time(self, seconds: float):
+        with self._lock:
+            self.db_time += seconds
+
+_current_request: ContextVar[Optional[RequestContext]] = ContextVar('current_request', default=None)
+
+def get_request_context() -> Optional[RequestContext]:
+    """Return the context of the request being served, if any"""
+    return _current_request.get()
+
+def begin_request(scope: dict):
+    """Install a fresh RequestContext; returns (context, reset token)"""
+    context = RequestContext(scope)
+    token = _current_request.set(context)
+    return context, token
+
+def end_request(token):
+    _current_request.reset(token)
@@ -1,15 +1,28 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
-from typing import List, Optional
-from database import get_database, COLLECTIONS
+from fastapi.responses import PlainTextResponse
+from typing import List, Optional, Literal
+from database import get_database, get_read_database, COLLECTIONS
 from models import (
-    VendorApproval, Vendor, VendorStatus,
+    VendorApproval, Vendor, VendorStatus, BookingStatus,
     Payout, PayoutCreate, PayoutSettle, PayoutStatus,
-    CommissionSettings, AdminDashboardStats
+    PayoutRun, PayoutRunCreate, PayoutBatchSettle, PayoutBatchResult,
+    CommissionSettings, AdminDashboardStats, WalletStatement, RevenueSeries
 )
 from auth import get_current_user, require_role
 from models import UserRole, NotificationType
-from utils import create_vendor_wallet, create_notification, process_payout
-from datetime import datetime
+from utils import (
+    create_vendor_wallet, create_notification, process_payout, get_vendor_wallet,
+    create_payout_run, settle_payouts, invalidate_commission_cache, update_or_raise
+)
+from slow_query_log import get_top_slow_queries
+from profiling import list_profiles, get_profile
+from repository import get_vendor
+from cache import invalidate_vendor
+from archive import find_with_archive, get_booking_totals
+from ledger import get_wallet_statement
+from reconciliation import get_reconciliation_runs
+from analytics import get_revenue_series
+from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -37,12 +50,6 @@ async def approve_vendor(
     current_user: dict = Depends(require_role([UserRole.admin]))
 ):
     """Approve or reject a vendor"""
-    db = get_database()
-    
-    vendor = await db[COLLECTIONS['vendors']].find_one({'id': vendor_id})
-    if not vendor:
-        raise HTTPException(status_code=404, detail="Vendor not found")
-    
     # Update vendor status
     update_data = {
         'status': approval.status,
@@ -56,10 +63,13 @@ async def approve_vendor(
     elif approval.status in ['rejected', 'suspended']:
         update_data['is_approved'] = False
     
-    await db[COLLECTIONS['vendors']].update_one(
+    vendor = await update_or_raise(
+        COLLECTIONS['vendors'],
         {'id': vendor_id},
-        {'$set': update_data}
+        {'$set': update_data},
+        not_found="Vendor not found"
     )
+    await invalidate_vendor(vendor_id, visibility=True)
     
     # Create wallet if approved
     if approval.status == 'approved':
@@ -74,8 +84,7 @@ async def approve_vendor(
             related_vendor_id=vendor_id
         )
     
-    updated_vendor = await db[COLLECTIONS['vendors']].find_one({'id': vendor_id})
-    return updated_vendor
+    return vendor
 
 @router.put("/vendors/{vendor_id}/suspend")
 async def suspend_vendor(
@@ -85,11 +94,7 @@ async def suspend_vendor(
     """Suspend a vendor"""
     db = get_database()
     
-    vendor = await db[COLLECTIONS['vendors']].find_one({'id': vendor_id})
-    if not vendor:
-        raise HTTPException(status_code=404, detail="Vendor not found")
-    
-    await db[COLLECTIONS['vendors']].update_one(
+    result = await db[COLLECTIONS['vendors']].update_one(
         {'id': vendor_id},
         {
             '$set': {
@@ -99,6 +104,9 @@ async def suspend_vendor(
             }
         }
     )
+    if not result.matched_count:
+        raise HTTPException(status_code=404, detail="Vendor not found")
+    await invalidate_vendor(vendor_id, visibility=True)
     
     return {"message": "Vendor suspended successfully"}
 
@@ -148,6 +156,7 @@ async def update_commission_settings(
             updated_by=current_user['id']
         )
         await db[COLLECTIONS['commission_settings']].insert_one(settings.dict())
+    await invalidate_commission_cache()
     
     updated_settings = await db[COLLECTIONS['commission_settings']].find_one({})
     return updated_settings
@@ -159,16 +168,14 @@ async def set_vendor_commission_rate(
     current_user: dict = Depends(require_role([UserRole.admin]))
 ):
     """Set custom commission rate for a specific vendor"""
-    db = get_database()
-    
-    vendor = await db[COLLECTIONS['vendors']].find_one({'id': vendor_id})
-    if not vendor:
-        raise HTTPException(status_code=404, detail="Vendor not found")
-    
-    await db[COLLECTIONS['vendors']].update_one(
+    await update_or_raise(
+        COLLECTIONS['vendors'],
         {'id': vendor_id},
-        {'$set': {'commission_rate': commission_rate, 'updated_at': datetime.utcnow()}}
+        {'$set': {'commission_rate': commission_rate, 'updated_at': datetime.utcnow()}},
+        not_found="Vendor not found"
     )
+    await invalidate_commission_cache(vendor_id)
+    await invalidate_vendor(vendor_id)
     
     return {"message": f"Commission rate set to {commission_rate}% for vendor"}
 
@@ -203,12 +210,12 @@ async def create_payout(
     db = get_database()
     
     # Verify vendor exists
-    vendor = await db[COLLECTIONS['vendors']].find_one({'id': payout_data.vendor_id})
+    vendor = await get_vendor(payout_data.vendor_id)
     if not vendor:
         raise HTTPException(status_code=404, detail="Vendor not found")
     
     # Get vendor wallet
-    wallet = await db[COLLECTIONS['vendor_wallets']].find_one({'vendor_id': payout_data.vendor_id})
+    wallet = await get_vendor_wallet(payout_data.vendor_id)
     if not wallet:
         raise HTTPException(status_code=404, detail="Vendor wallet not found")
     
@@ -246,17 +253,53 @@ async def settle_payout(
     current_user: dict = Depends(require_role([UserRole.admin]))
 ):
     """Mark payout as completed or failed"""
-    await process_payout(
+    return await process_payout(
         payout_id=payout_id,
         settled_by=current_user['id'],
         settlement_notes=settlement.settlement_notes,
         payout_reference=settlement.payout_reference,
         status=settlement.status
     )
-    
-    db = get_database()
-    updated_payout = await db[COLLECTIONS['payouts']].find_one({'id': payout_id})
-    return updated_payout
+
+@router.post("/payout-runs", response_model=PayoutRun)
+async def run_payouts(
+    run_data: PayoutRunCreate,
+    current_user: dict = Depends(require_role([UserRole.admin]))
+):
+    """Create payouts for every vendor with at least min_balance available"""
+    return await create_payout_run(
+        min_balance=run_data.min_balance,
+        payout_method=run_data.payout_method,
+        created_by=current_user['id'],
+        dry_run=run_data.dry_run
+    )
+
+@router.post("/payouts/settle-batch", response_model=PayoutBatchResult)
+async def settle_payout_batch(
+    batch: PayoutBatchSettle,
+    current_user: dict = Depends(require_role([UserRole.admin]))
+):
+    """Mark many payouts as completed or failed in one call"""
+    return await settle_payouts(batch.items, settled_by=current_user['id'])
+
+@router.get("/vendors/{vendor_id}/statement", response_model=WalletStatement)
+async def get_vendor_statement(
+    vendor_id: str,
+    as_of: Optional[datetime] = Query(None),
+    cursor: Optional[int] = Query(None, ge=1),
+    limit: int = Query(50, ge=1, le=200),
+    current_user: dict = Depends(require_role([UserRole.admin]))
+):
+    """Get a vendor's wallet ledger entries with running balances"""
+    return await get_wallet_statement(vendor_id, as_of=as_of, cursor=cursor, limit=limit)
+
+@router.get("/wallet-reconciliations")
+async def get_wallet_reconciliations(
+    limit: int = Query(10, ge=1, le=50),
+    current_user: dict = Depends(require_role([UserRole.admin]))
+):
+    """Recent wallet reconciliation runs with drifted vendors (admin only)"""
+    return await get_reconciliation_runs(limit=limit)
 
 # ============================================================
 # ANALYTICS & REPORTING
@@ -267,7 +310,7 @@ async def get_admin_dashboard(
     current_user: dict = Depends(require_role([UserRole.admin]))
 ):
     """Get admin dashboard statistics"""
-    db = get_database()
+    db = get_read_database()
     
     # Vendor stats
     all_vendors = await db[COLLECTIONS['vendors']].find({}).to_list(1000)
@@ -275,11 +318,12 @@ async def get_admin_dashboard(
     pending_vendors = len([v for v in all_vendors if v['status'] == VendorStatus.pending.value])
     approved_vendors = len([v for v in all_vendors if v['is_approved']])
     
-    # Booking stats
-    all_bookings = await db[COLLECTIONS['bookings']].find({}).to_list(5000)
-    total_bookings = len(all_bookings)
-    total_revenue = sum(b['total_amount'] for b in all_bookings if b['status'] == 'completed')
-    total_commission = sum(b['commission_amount'] for b in all_bookings if b['status'] == 'completed')
+    # Booking stats (grouped per status, archive included)
+    booking_totals = await get_booking_totals()
+    completed = booking_totals.get(BookingStatus.completed.value, {})
+    total_bookings = sum(t['bookings'] for t in booking_totals.values())
+    total_revenue = completed.get('gross', 0.0)
+    total_commission = completed.get('commission', 0.0)
     
     # Payout stats
     pending_payouts = await db[COLLECTIONS['payouts']].find({'status': PayoutStatus.pending.value}).to_list(100)
@@ -295,6 +339,18 @@ async def get_admin_dashboard(
         pending_payouts=pending_payout_amount
     )
 
+@router.get("/analytics/revenue", response_model=RevenueSeries)
+async def get_revenue_analytics(
+    interval: Literal["day", "week", "month"] = Query("day"),
+    start_date: Optional[datetime] = Query(None),
+    end_date: Optional[datetime] = Query(None),
+    vendor_id: Optional[str] = Query(None),
+    status: Optional[List[str]] = Query(None),
+    current_user: dict = Depends(require_role([UserRole.admin]))
+):
+    """Platform (or one vendor's) revenue series from the rollups (admin only)"""
+    return await get_revenue_series(start_date, end_date, interval, vendor_id=vendor_id, statuses=status)
+
 @router.get("/bookings")
 async def get_all_bookings(
     status: Optional[str] = Query(None),
@@ -312,5 +368,49 @@ async def get_all_bookings(
     if vendor_id:
         query['vendor_id'] = vendor_id
     
-    bookings = await db[COLLECTIONS['bookings']].find(query).skip(skip).limit(limit).sort('created_at', -1).to_list(limit)
-    return bookings
+    return await find_with_archive('bookings', query, 'created_at', limit=limit, skip=skip,
+                                   projection={'_id': 0}, db=db)
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    limit: int = Query(20, ge=1, le=100),
+    since_hours: Optional[int] = Query(None, ge=1),
+    current_user: dict = Depends(require_role([UserRole.admin]))
+):
+    """Top slow query shapes by total time (admin only)"""
+    since = datetime.utcnow() - timedelta(hours=since_hours) if since_hours else None
+    return await get_top_slow_queries(limit=limit, since=since)
+
+@router.get("/profiles")
+async def get_request_profiles(
+    limit: int = Query(20, ge=1, le=100),
+    route: Optional[str] = Query(None),
+    current_user: dict = Depends(require_role([UserRole.admin]))
+):
+    """Recent request profiles (admin only)"""
+    return await list_profiles(limit=limit, route=route)
+
+@router.get("/profiles/{profile_id}")
+async def get_request_profile(
+    profile_id: str,
+    current_user: dict = Depends(require_role([UserRole.admin]))
+):
+    """A request profile with its collapsed stacks and DB timeline (admin only)"""
+    profile = await get_profile(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return profile
+
+@router.get("/profiles/{profile_id}/collapsed", response_class=PlainTextResponse)
+async def download_request_profile(
+    profile_id: str,
+    current_user: dict = Depends(require_role([UserRole.admin]))
+):
+    """A request profile's stacks in collapsed format, for flame graph tools (admin only)"""
+    profile = await get_profile(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(
+        profile['collapsed'],
+        headers={'Content-Disposition': f'attachment; filename="profile-{profile_id}.collapsed"'}
+    )
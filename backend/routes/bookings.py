@@ -1,58 +1,98 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
-from typing import List, Optional
-from database import get_database, COLLECTIONS
+from typing import List, Optional, Tuple, Callable, Awaitable
+from database import get_database, get_causal_database, causal_session, COLLECTIONS
 from models import (
-    BookingCreate, BookingUpdate, Booking, BookingStatus,
-    PaymentStatus
+    BookingCreate, BookingBatchCreate, BookingUpdate, Booking, BookingStatus,
+    PaymentStatus, SlotHold, SlotHoldCreate, WaitlistEntry, WaitlistJoin
 )
 from auth import get_current_user, optional_auth
+from slot_holds import create_hold, claim_hold, unclaim_hold, release_hold
+from waitlist import join_waitlist, leave_waitlist, promote_waitlist
+from archive import find_with_archive
+from repository import get_package, get_packages, get_vendor, get_vendors, get_booking, get_vendor_by_user, prime
 from utils import (
-    get_commission_rate, calculate_commission,
+    resolve_commission_rate, calculate_commission, calculate_commission_batch,
     update_wallet_on_booking, create_booking_notifications,
-    check_slot_availability, increment_slot_booking, decrement_slot_booking,
-    is_booking_participant, get_user_role
+    increment_slot_booking, decrement_slot_booking,
+    is_booking_participant, get_user_role, update_or_raise
 )
 from datetime import datetime
+import asyncio
 
 router = APIRouter(prefix="/bookings", tags=["bookings"])
 
+async def require_customer(customer_id: Optional[str], current_user: Optional[dict], detail: str):
+    """Guest records (no customer_id) are open to whoever has the id; a customer's
+    only to that customer or an admin"""
+    if customer_id is None:
+        return
+    if current_user and (current_user['id'] == customer_id
+                         or await get_user_role(current_user['id']) == 'admin'):
+        return
+    raise HTTPException(status_code=403, detail=detail)
+
 # ============================================================
 # CREATE BOOKING
 # ============================================================
 
+async def reserve_booking_seats(requests: List[Tuple[BookingCreate, str]]) -> Callable[[], Awaitable]:
+    """Convert holds and reserve seats for (booking data, booking id) pairs, all or none.
+    
+    Returns a coroutine function that undoes the reservations."""
+    held = [(data, booking_id) for data, booking_id in requests if data.hold_id]
+    for data, _ in held:
+        if not data.time_slot_id:
+            raise HTTPException(status_code=400, detail="hold_id requires a time_slot_id")
+    
+    # One reservation per slot for the combined seats of bookings without a hold
+    seats_by_slot = {}
+    for data, _ in requests:
+        if data.time_slot_id and not data.hold_id:
+            seats_by_slot[data.time_slot_id] = seats_by_slot.get(data.time_slot_id, 0) + data.seats
+    slot_ids = list(seats_by_slot)
+    
+    claimed, reserved = await asyncio.gather(
+        asyncio.gather(*(claim_hold(d.hold_id, d.time_slot_id, d.seats, booking_id) for d, booking_id in held)),
+        asyncio.gather(*(increment_slot_booking(s, seats_by_slot[s]) for s in slot_ids))
+    )
+    
+    async def undo():
+        await asyncio.gather(
+            *(unclaim_hold(d.hold_id) for (d, _), ok in zip(held, claimed) if ok),
+            *(decrement_slot_booking(s, seats_by_slot[s]) for s, ok in zip(slot_ids, reserved) if ok)
+        )
+    
+    if not all(claimed) or not all(reserved):
+        await undo()
+        if not all(claimed):
+            raise HTTPException(status_code=400, detail="Seat hold expired or does not match the booking")
+        unavailable = [s for s, ok in zip(slot_ids, reserved) if not ok]
+        raise HTTPException(status_code=400, detail="Time slot not available" if len(requests) == 1
+                            else f"Time slots not available: {', '.join(unavailable)}")
+    return undo
+
 @router.post("", response_model=Booking)
 async def create_booking(
     booking_data: BookingCreate,
     current_user: Optional[dict] = Depends(optional_auth)
 ):
     """Create a new booking (authenticated or guest)"""
-    db = get_database()
+    package, vendor = await asyncio.gather(
+        get_package(booking_data.package_id),
+        get_vendor(booking_data.vendor_id)
+    )
     
     # Verify package exists and is active
-    package = await db[COLLECTIONS['packages']].find_one({
-        'id': booking_data.package_id,
-        'is_active': True
-    })
-    if not package:
+    if not package or not package.get('is_active'):
         raise HTTPException(status_code=404, detail="Package not found")
     
     # Verify vendor is approved
-    vendor = await db[COLLECTIONS['vendors']].find_one({
-        'id': booking_data.vendor_id,
-        'is_approved': True
-    })
-    if not vendor:
+    if not vendor or not vendor.get('is_approved'):
         raise HTTPException(status_code=404, detail="Vendor not approved")
     
-    # Check time slot availability if provided
-    if booking_data.time_slot_id:
-        available = await check_slot_availability(booking_data.time_slot_id)
-        if not available:
-            raise HTTPException(status_code=400, detail="Time slot not available")
-    
     # Calculate commission
-    commission_rate = await get_commission_rate(vendor['id'])
-    financial_breakdown = calculate_commission(package['price'], commission_rate)
+    commission_rate = await resolve_commission_rate(vendor)
+    financial_breakdown = calculate_commission(round(package['price'] * booking_data.seats, 2), commission_rate)
     
     # Create booking
     booking = Booking(
@@ -63,6 +103,7 @@ async def create_booking(
         customer_name=booking_data.customer_name,
         customer_email=booking_data.customer_email,
         customer_phone=booking_data.customer_phone,
+        seats=booking_data.seats,
         total_amount=financial_breakdown['total_amount'],
         commission_amount=financial_breakdown['commission_amount'],
         vendor_amount=financial_breakdown['vendor_amount'],
@@ -70,14 +111,173 @@ async def create_booking(
         status=BookingStatus.pending
     )
     
-    await db[COLLECTIONS['bookings']].insert_one(booking.dict())
-    
-    # Increment time slot booking count if applicable
-    if booking_data.time_slot_id:
-        await increment_slot_booking(booking_data.time_slot_id)
+    # Reserve the seats (or convert the hold) before writing the booking
+    undo_reservations = await reserve_booking_seats([(booking_data, booking.id)])
+    try:
+        # Majority write in a causal session: the X-Causal-Token returned lets the
+        # client read this booking back even across a failover
+        async with causal_session() as session:
+            await get_causal_database()[COLLECTIONS['bookings']].insert_one(booking.dict(), session=session)
+    except Exception:
+        await undo_reservations()
+        raise
     
     return booking
 
+@router.post("/batch", response_model=List[Booking])
+async def create_booking_batch(
+    batch: BookingBatchCreate,
+    current_user: Optional[dict] = Depends(optional_auth)
+):
+    """Create several bookings at once (group checkout); all seats are reserved or none"""
+    items = batch.bookings
+    
+    # Load every package and vendor in one query each
+    packages, vendors = await asyncio.gather(
+        get_packages({b.package_id for b in items}),
+        get_vendors({b.vendor_id for b in items})
+    )
+    packages = {k: p for k, p in packages.items() if p.get('is_active')}
+    vendors = {k: v for k, v in vendors.items() if v.get('is_approved')}
+    
+    for item in items:
+        if item.package_id not in packages:
+            raise HTTPException(status_code=404, detail=f"Package not found: {item.package_id}")
+        if item.vendor_id not in vendors:
+            raise HTTPException(status_code=404, detail=f"Vendor not approved: {item.vendor_id}")
+    
+    # Price all bookings in one vectorized pass
+    rates = [await resolve_commission_rate(vendors[item.vendor_id]) for item in items]
+    breakdown = calculate_commission_batch(
+        [round(packages[item.package_id]['price'] * item.seats, 2) for item in items], rates
+    )
+    
+    bookings = [
+        Booking(
+            customer_id=current_user['id'] if current_user else None,
+            vendor_id=item.vendor_id,
+            package_id=item.package_id,
+            time_slot_id=item.time_slot_id,
+            customer_name=item.customer_name,
+            customer_email=item.customer_email,
+            customer_phone=item.customer_phone,
+            seats=item.seats,
+            total_amount=float(breakdown['total_amount'][i]),
+            commission_amount=float(breakdown['commission_amount'][i]),
+            vendor_amount=float(breakdown['vendor_amount'][i]),
+            notes=item.notes,
+            status=BookingStatus.pending
+        )
+        for i, item in enumerate(items)
+    ]
+    
+    # All seats and holds for the group, or none of them
+    undo_reservations = await reserve_booking_seats(list(zip(items, [b.id for b in bookings])))
+    try:
+        async with causal_session() as session:
+            await get_causal_database()[COLLECTIONS['bookings']].insert_many(
+                [b.dict() for b in bookings], session=session
+            )
+    except Exception:
+        await undo_reservations()
+        raise
+    
+    return bookings
+
+# ============================================================
+# SEAT HOLDS
+# ============================================================
+
+@router.post("/holds", response_model=SlotHold)
+async def hold_seats(
+    hold_data: SlotHoldCreate,
+    current_user: Optional[dict] = Depends(optional_auth)
+):
+    """Hold seats on a time slot during checkout; pass the hold id when booking"""
+    hold = await create_hold(
+        hold_data.time_slot_id,
+        hold_data.seats,
+        customer_id=current_user['id'] if current_user else None
+    )
+    if not hold:
+        raise HTTPException(status_code=400, detail="Time slot not available")
+    return hold
+
+@router.delete("/holds/{hold_id}")
+async def release_seats(
+    hold_id: str,
+    current_user: Optional[dict] = Depends(optional_auth)
+):
+    """Release a seat hold (checkout abandoned)"""
+    hold = await get_database()[COLLECTIONS['slot_holds']].find_one({'id': hold_id}, {'customer_id': 1})
+    if not hold:
+        raise HTTPException(status_code=404, detail="Active hold not found")
+    await require_customer(hold.get('customer_id'), current_user, "Not authorized to release this hold")
+    
+    hold = await release_hold(hold_id)
+    if not hold:
+        raise HTTPException(status_code=404, detail="Active hold not found")
+    return {"message": "Hold released"}
+
+# ============================================================
+# WAITLIST
+# ============================================================
+
+@router.post("/waitlist", response_model=WaitlistEntry)
+async def join_slot_waitlist(
+    entry_data: WaitlistJoin,
+    current_user: Optional[dict] = Depends(optional_auth)
+):
+    """Join a full time slot's waitlist; promoted to a pending booking when seats free up"""
+    db = get_database()
+    
+    package = await get_package(entry_data.package_id)
+    if not package or package['vendor_id'] != entry_data.vendor_id or not package.get('is_active'):
+        raise HTTPException(status_code=404, detail="Package not found")
+    
+    slot = await db[COLLECTIONS['time_slots']].find_one({'id': entry_data.time_slot_id})
+    if not slot:
+        raise HTTPException(status_code=404, detail="Time slot not found")
+    if slot['booked_count'] + entry_data.seats <= slot['capacity']:
+        raise HTTPException(status_code=400, detail="Seats are available; book the time slot directly")
+    
+    entry = await join_waitlist(entry_data, customer_id=current_user['id'] if current_user else None)
+    
+    # Seats freed between the check and the join would otherwise wait for the next cancellation
+    if await promote_waitlist(entry.time_slot_id):
+        entry = await db[COLLECTIONS['waitlist_entries']].find_one({'id': entry.id})
+    return entry
+
+@router.get("/waitlist/{entry_id}", response_model=WaitlistEntry)
+async def get_waitlist_entry(
+    entry_id: str,
+    current_user: Optional[dict] = Depends(optional_auth)
+):
+    """Waitlist entry status (position, or the booking once promoted)"""
+    db = get_database()
+    entry = await db[COLLECTIONS['waitlist_entries']].find_one({'id': entry_id})
+    if not entry:
+        raise HTTPException(status_code=404, detail="Waitlist entry not found")
+    await require_customer(entry.get('customer_id'), current_user, "Not authorized to view this waitlist entry")
+    return entry
+
+@router.delete("/waitlist/{entry_id}")
+async def leave_slot_waitlist(
+    entry_id: str,
+    current_user: Optional[dict] = Depends(optional_auth)
+):
+    """Leave a waitlist"""
+    db = get_database()
+    entry = await db[COLLECTIONS['waitlist_entries']].find_one({'id': entry_id}, {'customer_id': 1})
+    if not entry:
+        raise HTTPException(status_code=404, detail="Waiting entry not found")
+    await require_customer(entry.get('customer_id'), current_user, "Not authorized to leave this waitlist entry")
+    
+    entry = await leave_waitlist(entry_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail="Waiting entry not found")
+    return {"message": "Left the waitlist"}
+
 # ============================================================
 # UPDATE BOOKING STATUS
 # ============================================================
@@ -89,28 +289,25 @@ async def update_booking_status(
     current_user: dict = Depends(get_current_user)
 ):
     """Update booking status (customer, vendor, or admin)"""
-    db = get_database()
-    
     # Get booking
-    booking = await db[COLLECTIONS['bookings']].find_one({'id': booking_id})
+    booking = await get_booking(booking_id)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     
-    # Get user role
-    user_role = await get_user_role(current_user['id'])
+    # Get user role and vendor together
+    user_role, vendor = await asyncio.gather(
+        get_user_role(current_user['id']),
+        get_vendor(booking['vendor_id'])
+    )
     
     # Authorization checks
-    is_participant = await is_booking_participant(current_user['id'], booking_id)
+    is_vendor = vendor and vendor['user_id'] == current_user['id']
+    is_customer = booking.get('customer_id') == current_user['id']
     is_admin = user_role == 'admin'
     
-    if not is_participant and not is_admin:
+    if not is_customer and not is_vendor and not is_admin:
         raise HTTPException(status_code=403, detail="Not authorized to update this booking")
     
-    # Get vendor
-    vendor = await db[COLLECTIONS['vendors']].find_one({'id': booking['vendor_id']})
-    is_vendor = vendor and vendor['user_id'] == current_user['id']
-    is_customer = booking.get('customer_id') == current_user['id']
-    
     # Status transition rules
     if updates.status:
         current_status = booking['status']
@@ -142,6 +339,23 @@ async def update_booking_status(
         
         if new_status == BookingStatus.confirmed:
             update_data['confirmed_at'] = datetime.utcnow()
+        elif new_status == BookingStatus.completed:
+            update_data['completed_at'] = datetime.utcnow()
+        elif new_status == BookingStatus.cancelled:
+            update_data['cancelled_at'] = datetime.utcnow()
+        
+        # The transition only applies if nobody changed the status since it was read,
+        # so the side effects below run once per transition
+        booking = await update_or_raise(
+            COLLECTIONS['bookings'],
+            {'id': booking_id},
+            {'$set': update_data},
+            expect={'status': current_status},
+            not_found="Booking not found",
+            conflict="Booking status changed; reload and retry"
+        )
+        
+        if new_status == BookingStatus.confirmed:
             # Record earnings in wallet
             await update_wallet_on_booking(
                 vendor_id=booking['vendor_id'],
@@ -153,22 +367,13 @@ async def update_booking_status(
             # Send notifications
             await create_booking_notifications(booking, vendor)
         
-        elif new_status == BookingStatus.completed:
-            update_data['completed_at'] = datetime.utcnow()
-        
-        elif new_status == BookingStatus.cancelled:
-            update_data['cancelled_at'] = datetime.utcnow()
-            # Decrement time slot if applicable
-            if booking.get('time_slot_id'):
-                await decrement_slot_booking(booking['time_slot_id'])
-        
-        await db[COLLECTIONS['bookings']].update_one(
-            {'id': booking_id},
-            {'$set': update_data}
-        )
+        # Free the seats once the booking is cancelled, then hand them to the waitlist
+        elif new_status == BookingStatus.cancelled and current_status != BookingStatus.cancelled \
+                and booking.get('time_slot_id'):
+            await decrement_slot_booking(booking['time_slot_id'], booking.get('seats', 1))
+            await promote_waitlist(booking['time_slot_id'])
     
-    updated_booking = await db[COLLECTIONS['bookings']].find_one({'id': booking_id})
-    return updated_booking
+    return booking
 
 # ============================================================
 # GET BOOKINGS
@@ -180,13 +385,11 @@ async def get_my_bookings(
     current_user: dict = Depends(get_current_user)
 ):
     """Get bookings for current user (customer or vendor)"""
-    db = get_database()
-    
     user_role = await get_user_role(current_user['id'])
     
     if user_role == 'vendor':
         # Get vendor bookings
-        vendor = await db[COLLECTIONS['vendors']].find_one({'user_id': current_user['id']})
+        vendor = await get_vendor_by_user(current_user['id'])
         if not vendor:
             return []
         
@@ -198,8 +401,8 @@ async def get_my_bookings(
     if status:
         query['status'] = status.value
     
-    bookings = await db[COLLECTIONS['bookings']].find(query).sort('created_at', -1).to_list(100)
-    return bookings
+    # Newest first across recent and archived bookings
+    return await find_with_archive('bookings', query, 'created_at', limit=100)
 
 @router.get("/{booking_id}", response_model=Booking)
 async def get_booking_details(
@@ -207,15 +410,21 @@ async def get_booking_details(
     current_user: dict = Depends(get_current_user)
 ):
     """Get specific booking details"""
-    db = get_database()
-    
-    booking = await db[COLLECTIONS['bookings']].find_one({'id': booking_id})
+    # Read-your-writes: primary, after the writes named by the client's X-Causal-Token
+    async with causal_session() as session:
+        booking = await get_causal_database()[COLLECTIONS['bookings']].find_one({'id': booking_id}, session=session)
+    if booking:
+        prime('bookings', booking)
+    else:
+        booking = await get_booking(booking_id)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     
-    # Check authorization
-    user_role = await get_user_role(current_user['id'])
-    is_participant = await is_booking_participant(current_user['id'], booking_id)
+    # Check authorization (booking, user and vendor are already memoized for the request)
+    user_role, is_participant = await asyncio.gather(
+        get_user_role(current_user['id']),
+        is_booking_participant(current_user['id'], booking_id)
+    )
     
     if not is_participant and user_role != 'admin':
         raise HTTPException(status_code=403, detail="Not authorized to view this booking")
@@ -0,0 +1,136 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Optional
+from database import get_database, COLLECTIONS
+from models import Booking, Payout, SettlementTransaction
+from archive import ARCHIVES
+from auth import require_role
+from models import UserRole
+from datetime import datetime
+from enum import Enum
+import csv
+import io
+import json
+import zlib
+
+router = APIRouter(prefix="/admin/exports", tags=["exports"])
+
+# Exportable collections and their columns (model field order)
+EXPORTS = {
+    'bookings': ('bookings', list(Booking.model_fields)),
+    'payouts': ('payouts', list(Payout.model_fields)),
+    'settlements': ('settlement_transactions', list(SettlementTransaction.model_fields)),
+}
+
+class ExportFormat(str, Enum):
+    csv = "csv"
+    ndjson = "ndjson"
+
+# ============================================================
+# ENCODING
+# ============================================================
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, str) and value[:1] in ('=', '+', '-', '@'):
+        # Keep spreadsheets from evaluating customer-entered text as a formula
+        return "'" + value
+    return value
+
+def encode_rows(rows: List[dict], columns: List[str], export_format: ExportFormat) -> bytes:
+    """Encode one batch of documents"""
+    if export_format == ExportFormat.ndjson:
+        return ''.join(
+            json.dumps({c: row.get(c) for c in columns}, default=_json_default) + '\n' for row in rows
+        ).encode()
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([[_csv_value(row.get(c)) for c in columns] for row in rows])
+    return buffer.getvalue().encode()
+
+async def stream_export(collection: str, query: dict, columns: List[str],
+                        export_format: ExportFormat, batch_size: int,
+                        compress: bool) -> AsyncIterator[bytes]:
+    """Yield encoded chunks of at most batch_size rows straight off the cursor"""
+    db = get_database()
+    compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+
+    def emit(data: bytes) -> bytes:
+        return compressor.compress(data) if compressor else data
+
+    if export_format == ExportFormat.csv:
+        yield emit(encode_rows([{c: c for c in columns}], columns, export_format))
+
+    # Archived history first (it is all older), then the live collection
+    for name in ([ARCHIVES[collection], collection] if collection in ARCHIVES else [collection]):
+        cursor = db[COLLECTIONS[name]].find(
+            query, {c: 1 for c in columns} | {'_id': 0}
+        ).sort('created_at', 1).batch_size(batch_size)
+
+        rows = []
+        async for row in cursor:
+            rows.append(row)
+            if len(rows) >= batch_size:
+                chunk = emit(encode_rows(rows, columns, export_format))
+                rows = []
+                if chunk:
+                    yield chunk
+        if rows:
+            yield emit(encode_rows(rows, columns, export_format))
+    if compressor:
+        yield compressor.flush()
+
+# ============================================================
+# EXPORT ENDPOINTS
+# ============================================================
+
+@router.get("/{dataset}")
+async def export_dataset(
+    dataset: str,
+    format: ExportFormat = Query(ExportFormat.csv),
+    start_date: Optional[datetime] = Query(None, description="created_at >= start_date"),
+    end_date: Optional[datetime] = Query(None, description="created_at < end_date"),
+    vendor_id: Optional[str] = Query(None),
+    status: Optional[str] = Query(None, description="Bookings and payouts only"),
+    gzip: bool = Query(False),
+    batch_size: int = Query(1000, ge=100, le=10000),
+    current_user: dict = Depends(require_role([UserRole.admin]))
+):
+    """Stream bookings, payouts or settlements as CSV or NDJSON (admin only)"""
+    if dataset not in EXPORTS:
+        raise HTTPException(status_code=404, detail=f"Unknown export: {dataset}")
+    collection, columns = EXPORTS[dataset]
+
+    query = {}
+    if start_date or end_date:
+        query['created_at'] = {}
+        if start_date:
+            query['created_at']['$gte'] = start_date
+        if end_date:
+            query['created_at']['$lt'] = end_date
+    if vendor_id:
+        query['vendor_id'] = vendor_id
+    if status:
+        if dataset == 'settlements':
+            raise HTTPException(status_code=400, detail="Settlements have no status")
+        query['status'] = status
+
+    filename = f"{dataset}-{datetime.utcnow():%Y%m%d%H%M%S}.{format.value}"
+    media_type = 'text/csv' if format == ExportFormat.csv else 'application/x-ndjson'
+    if gzip:
+        filename += '.gz'
+        media_type = 'application/gzip'
+
+    return StreamingResponse(
+        stream_export(collection, query, columns, format, batch_size, gzip),
+        media_type=media_type,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
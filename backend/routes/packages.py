@@ -1,8 +1,13 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
 from typing import List, Optional
-from database import get_database, COLLECTIONS
+from database import get_database, get_read_database, COLLECTIONS
 from models import PackageCreate, PackageUpdate, Package
 from auth import get_current_user, require_approved_vendor
+from utils import update_or_raise
+from repository import get_package, get_vendor
+from cache import (
+    cache, invalidate_package, PUBLIC_CACHE_SECONDS, PUBLIC_LIST_CACHE_SECONDS, PUBLIC_STALE_SECONDS
+)
 from datetime import datetime
 
 router = APIRouter(prefix="/packages", tags=["packages"])
@@ -25,6 +30,7 @@ async def create_package(
     
     package = Package(**package_data.dict())
     await db[COLLECTIONS['packages']].insert_one(package.dict())
+    await invalidate_package(package.id)
     
     return package
 
@@ -46,27 +52,21 @@ async def update_package(
     current_vendor: dict = Depends(require_approved_vendor)
 ):
     """Update a package (vendor only, own packages)"""
-    db = get_database()
-    
-    # Check package exists and belongs to vendor
-    package = await db[COLLECTIONS['packages']].find_one({'id': package_id})
-    if not package:
-        raise HTTPException(status_code=404, detail="Package not found")
-    
-    if package['vendor_id'] != current_vendor['id']:
-        raise HTTPException(status_code=403, detail="Can only update your own packages")
-    
-    # Update package
     update_data = {k: v for k, v in updates.dict(exclude_unset=True).items()}
     update_data['updated_at'] = datetime.utcnow()
     
-    await db[COLLECTIONS['packages']].update_one(
+    # Ownership is part of the update filter
+    package = await update_or_raise(
+        COLLECTIONS['packages'],
         {'id': package_id},
-        {'$set': update_data}
+        {'$set': update_data},
+        owner={'vendor_id': current_vendor['id']},
+        not_found="Package not found",
+        forbidden="Can only update your own packages"
     )
+    await invalidate_package(package_id)
     
-    updated_package = await db[COLLECTIONS['packages']].find_one({'id': package_id})
-    return updated_package
+    return package
 
 @router.delete("/{package_id}")
 async def delete_package(
@@ -74,21 +74,16 @@ async def delete_package(
     current_vendor: dict = Depends(require_approved_vendor)
 ):
     """Delete a package (vendor only, own packages)"""
-    db = get_database()
-    
-    # Check package exists and belongs to vendor
-    package = await db[COLLECTIONS['packages']].find_one({'id': package_id})
-    if not package:
-        raise HTTPException(status_code=404, detail="Package not found")
-    
-    if package['vendor_id'] != current_vendor['id']:
-        raise HTTPException(status_code=403, detail="Can only delete your own packages")
-    
     # Soft delete - set is_active to False
-    await db[COLLECTIONS['packages']].update_one(
+    await update_or_raise(
+        COLLECTIONS['packages'],
         {'id': package_id},
-        {'$set': {'is_active': False, 'updated_at': datetime.utcnow()}}
+        {'$set': {'is_active': False, 'updated_at': datetime.utcnow()}},
+        owner={'vendor_id': current_vendor['id']},
+        not_found="Package not found",
+        forbidden="Can only delete your own packages"
     )
+    await invalidate_package(package_id)
     
     return {"message": "Package deleted successfully"}
 
@@ -105,23 +100,29 @@ async def browse_packages(
     limit: int = Query(20, ge=1, le=100)
 ):
     """Browse all active packages from approved vendors (public)"""
-    db = get_database()
+    key = f"packages:list:{vendor_id}:{min_price}:{max_price}:{skip}:{limit}"
+    return await cache.get_or_load(
+        key, PUBLIC_LIST_CACHE_SECONDS,
+        lambda: _load_packages(vendor_id, min_price, max_price, skip, limit),
+        stale=PUBLIC_STALE_SECONDS
+    )
+
+async def _load_packages(vendor_id: Optional[str], min_price: Optional[float],
+                         max_price: Optional[float], skip: int, limit: int) -> List[dict]:
+    db = get_read_database()
     
     # Build query
     query = {'is_active': True}
     
     if vendor_id:
         # Verify vendor is approved
-        vendor = await db[COLLECTIONS['vendors']].find_one({
-            'id': vendor_id,
-            'is_approved': True
-        })
-        if not vendor:
+        vendor = await get_vendor(vendor_id)
+        if not vendor or not vendor.get('is_approved'):
             raise HTTPException(status_code=404, detail="Vendor not found or not approved")
         query['vendor_id'] = vendor_id
     else:
         # Only show packages from approved vendors
-        approved_vendors = await db[COLLECTIONS['vendors']].find({'is_approved': True}).to_list(1000)
+        approved_vendors = await db[COLLECTIONS['vendors']].find({'is_approved': True}, {'id': 1}).to_list(1000)
         approved_vendor_ids = [v['id'] for v in approved_vendors]
         query['vendor_id'] = {'$in': approved_vendor_ids}
     
@@ -133,29 +134,28 @@ async def browse_packages(
         query['price'] = query.get('price', {})
         query['price']['$lte'] = max_price
     
-    packages = await db[COLLECTIONS['packages']].find(query).skip(skip).limit(limit).to_list(limit)
+    packages = await db[COLLECTIONS['packages']].find(query, {'_id': 0}).skip(skip).limit(limit).to_list(limit)
     return packages
 
 @router.get("/{package_id}", response_model=Package)
 async def get_package_details(package_id: str):
     """Get specific package details (public)"""
-    db = get_database()
-    
-    package = await db[COLLECTIONS['packages']].find_one({
-        'id': package_id,
-        'is_active': True
-    })
+    return await cache.get_or_load(
+        f"package:{package_id}", PUBLIC_CACHE_SECONDS,
+        lambda: _load_public_package(package_id),
+        stale=PUBLIC_STALE_SECONDS
+    )
+
+async def _load_public_package(package_id: str) -> dict:
+    package = await get_package(package_id)
     
-    if not package:
+    if not package or not package.get('is_active'):
         raise HTTPException(status_code=404, detail="Package not found")
     
     # Verify vendor is approved
-    vendor = await db[COLLECTIONS['vendors']].find_one({
-        'id': package['vendor_id'],
-        'is_approved': True
-    })
+    vendor = await get_vendor(package['vendor_id'])
     
-    if not vendor:
+    if not vendor or not vendor.get('is_approved'):
         raise HTTPException(status_code=404, detail="Package vendor not approved")
     
-    return package
+    return {k: v for k, v in package.items() if k != '_id'}
@@ -1,9 +1,13 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
 from typing import List, Optional
-from database import get_database, COLLECTIONS
+from database import get_database, get_read_database, COLLECTIONS
 from models import ReviewCreate, Review, VendorRatingSummary
 from auth import get_current_user
-from utils import update_vendor_rating, is_booking_participant
+from utils import update_vendor_rating, is_booking_participant, update_or_raise
+from repository import get_booking, get_vendor, get_review
+from cache import (
+    cache, PUBLIC_CACHE_SECONDS, PUBLIC_LIST_CACHE_SECONDS, PUBLIC_STALE_SECONDS
+)
 from datetime import datetime
 
 router = APIRouter(prefix="/reviews", tags=["reviews"])
@@ -21,7 +25,7 @@ async def create_review(
     db = get_database()
     
     # Get booking
-    booking = await db[COLLECTIONS['bookings']].find_one({'id': review_data.booking_id})
+    booking = await get_booking(review_data.booking_id)
     if not booking:
         raise HTTPException(status_code=404, detail="Booking not found")
     
@@ -75,18 +79,22 @@ async def get_vendor_reviews(
     limit: int = Query(20, ge=1, le=100)
 ):
     """Get all reviews for a vendor (public)"""
-    db = get_database()
+    return await cache.get_or_load(
+        f"reviews:{vendor_id}:{skip}:{limit}", PUBLIC_LIST_CACHE_SECONDS,
+        lambda: _load_vendor_reviews(vendor_id, skip, limit),
+        stale=PUBLIC_STALE_SECONDS
+    )
+
+async def _load_vendor_reviews(vendor_id: str, skip: int, limit: int) -> List[dict]:
+    db = get_read_database()
     
     # Verify vendor exists and is approved
-    vendor = await db[COLLECTIONS['vendors']].find_one({
-        'id': vendor_id,
-        'is_approved': True
-    })
-    if not vendor:
+    vendor = await get_vendor(vendor_id)
+    if not vendor or not vendor.get('is_approved'):
         raise HTTPException(status_code=404, detail="Vendor not found or not approved")
     
     reviews = await db[COLLECTIONS['reviews']].find(
-        {'vendor_id': vendor_id}
+        {'vendor_id': vendor_id}, {'_id': 0}
     ).skip(skip).limit(limit).sort('created_at', -1).to_list(limit)
     
     return reviews
@@ -94,9 +102,16 @@ async def get_vendor_reviews(
 @router.get("/vendor/{vendor_id}/summary", response_model=VendorRatingSummary)
 async def get_vendor_rating_summary(vendor_id: str):
     """Get vendor rating summary (public)"""
-    db = get_database()
+    return await cache.get_or_load(
+        f"rating:{vendor_id}", PUBLIC_CACHE_SECONDS,
+        lambda: _load_rating_summary(vendor_id),
+        stale=PUBLIC_STALE_SECONDS
+    )
+
+async def _load_rating_summary(vendor_id: str) -> dict:
+    db = get_read_database()
     
-    summary = await db[COLLECTIONS['vendor_rating_summary']].find_one({'vendor_id': vendor_id})
+    summary = await db[COLLECTIONS['vendor_rating_summary']].find_one({'vendor_id': vendor_id}, {'_id': 0})
     
     if not summary:
         # Return default summary
@@ -104,7 +119,7 @@ async def get_vendor_rating_summary(vendor_id: str):
             vendor_id=vendor_id,
             average_rating=0.0,
             total_reviews=0
-        )
+        ).dict()
     
     return summary
 
@@ -121,18 +136,6 @@ async def update_review(
     current_user: dict = Depends(get_current_user)
 ):
     """Update a review (author only)"""
-    db = get_database()
-    
-    # Get review
-    review = await db[COLLECTIONS['reviews']].find_one({'id': review_id})
-    if not review:
-        raise HTTPException(status_code=404, detail="Review not found")
-    
-    # Check user is the author
-    if review['customer_id'] != current_user['id']:
-        raise HTTPException(status_code=403, detail="Can only update your own reviews")
-    
-    # Update review
     update_data = {'updated_at': datetime.utcnow()}
     if rating is not None:
         update_data['rating'] = rating
@@ -141,15 +144,19 @@ async def update_review(
     if content is not None:
         update_data['content'] = content
     
-    await db[COLLECTIONS['reviews']].update_one(
+    # Only the author's review matches
+    updated_review = await update_or_raise(
+        COLLECTIONS['reviews'],
         {'id': review_id},
-        {'$set': update_data}
+        {'$set': update_data},
+        owner={'customer_id': current_user['id']},
+        not_found="Review not found",
+        forbidden="Can only update your own reviews"
     )
     
     # Update vendor rating
-    await update_vendor_rating(review['vendor_id'])
+    await update_vendor_rating(updated_review['vendor_id'])
     
-    updated_review = await db[COLLECTIONS['reviews']].find_one({'id': review_id})
     return updated_review
 
 @router.delete("/{review_id}")
@@ -161,7 +168,7 @@ async def delete_review(
     db = get_database()
     
     # Get review
-    review = await db[COLLECTIONS['reviews']].find_one({'id': review_id})
+    review = await get_review(review_id)
     if not review:
         raise HTTPException(status_code=404, detail="Review not found")
     
@@ -1,8 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
 from typing import List, Optional
 from database import get_database, COLLECTIONS
-from models import TimeSlotCreate, TimeSlotUpdate, TimeSlot
+from models import TimeSlotCreate, TimeSlotUpdate, TimeSlot, SlotUtilizationDay
 from auth import require_approved_vendor
+from utils import update_or_raise
+from repository import get_package, get_vendor
+from slot_compaction import get_slot_utilization
 from datetime import datetime
 
 router = APIRouter(prefix="/time-slots", tags=["time_slots"])
@@ -43,6 +46,15 @@ async def get_my_time_slots(
     slots = await db[COLLECTIONS['time_slots']].find(query).sort('slot_date', 1).to_list(200)
     return slots
 
+@router.get("/utilization", response_model=List[SlotUtilizationDay])
+async def get_my_slot_utilization(
+    start_date: Optional[str] = Query(None),
+    end_date: Optional[str] = Query(None),
+    current_vendor: dict = Depends(require_approved_vendor)
+):
+    """Daily slot capacity vs booked seats for current vendor, including compacted history"""
+    return await get_slot_utilization(current_vendor['id'], start_date, end_date)
+
 @router.put("/{slot_id}", response_model=TimeSlot)
 async def update_time_slot(
     slot_id: str,
@@ -50,27 +62,18 @@ async def update_time_slot(
     current_vendor: dict = Depends(require_approved_vendor)
 ):
     """Update a time slot (vendor only, own slots)"""
-    db = get_database()
-    
-    # Check slot exists and belongs to vendor
-    slot = await db[COLLECTIONS['time_slots']].find_one({'id': slot_id})
-    if not slot:
-        raise HTTPException(status_code=404, detail="Time slot not found")
-    
-    if slot['vendor_id'] != current_vendor['id']:
-        raise HTTPException(status_code=403, detail="Can only update your own time slots")
-    
-    # Update slot
     update_data = {k: v for k, v in updates.dict(exclude_unset=True).items()}
     update_data['updated_at'] = datetime.utcnow()
     
-    await db[COLLECTIONS['time_slots']].update_one(
+    # Ownership is part of the update filter
+    return await update_or_raise(
+        COLLECTIONS['time_slots'],
         {'id': slot_id},
-        {'$set': update_data}
+        {'$set': update_data},
+        owner={'vendor_id': current_vendor['id']},
+        not_found="Time slot not found",
+        forbidden="Can only update your own time slots"
     )
-    
-    updated_slot = await db[COLLECTIONS['time_slots']].find_one({'id': slot_id})
-    return updated_slot
 
 @router.delete("/{slot_id}")
 async def delete_time_slot(
@@ -110,15 +113,12 @@ async def get_package_availability(
     db = get_database()
     
     # Get package and vendor
-    package = await db[COLLECTIONS['packages']].find_one({'id': package_id, 'is_active': True})
-    if not package:
+    package = await get_package(package_id)
+    if not package or not package.get('is_active'):
         raise HTTPException(status_code=404, detail="Package not found")
     
-    vendor = await db[COLLECTIONS['vendors']].find_one({
-        'id': package['vendor_id'],
-        'is_approved': True
-    })
-    if not vendor:
+    vendor = await get_vendor(package['vendor_id'])
+    if not vendor or not vendor.get('is_approved'):
         raise HTTPException(status_code=404, detail="Vendor not approved")
     
     # Build query for time slots
@@ -1,17 +1,24 @@
 from fastapi import APIRouter, HTTPException, Depends, Query
-from typing import List, Optional
-from database import get_database, COLLECTIONS
+from typing import List, Optional, Literal
+from database import get_database, get_read_database, COLLECTIONS
 from models import (
     VendorCreate, VendorUpdate, VendorApproval,
-    Vendor, VendorStatus, Package, VendorDashboardStats
+    Vendor, VendorStatus, Package, VendorDashboardStats, WalletStatement, RevenueSeries
 )
 from auth import get_current_user, require_role, get_current_vendor, require_approved_vendor
 from models import UserRole
 from utils import (
     create_vendor_wallet, get_vendor_wallet,
-    create_notification, get_vendor_by_user_id
+    create_notification, get_vendor_by_user_id, update_or_raise
 )
 from models import NotificationType
+from ledger import get_wallet_statement
+from analytics import get_revenue_series
+from repository import get_vendor
+from archive import get_booking_totals
+from cache import (
+    cache, invalidate_vendor, PUBLIC_CACHE_SECONDS, PUBLIC_LIST_CACHE_SECONDS, PUBLIC_STALE_SECONDS
+)
 from datetime import datetime
 
 router = APIRouter(prefix="/vendors", tags=["vendors"])
@@ -68,35 +75,38 @@ async def update_vendor_profile(
     current_vendor: dict = Depends(get_current_vendor)
 ):
     """Update vendor profile"""
-    db = get_database()
-    
     update_data = {k: v for k, v in updates.dict(exclude_unset=True).items()}
     update_data['updated_at'] = datetime.utcnow()
     
-    await db[COLLECTIONS['vendors']].update_one(
+    vendor = await update_or_raise(
+        COLLECTIONS['vendors'],
         {'id': current_vendor['id']},
-        {'$set': update_data}
+        {'$set': update_data},
+        not_found="Vendor not found"
     )
+    await invalidate_vendor(current_vendor['id'])
     
-    updated_vendor = await db[COLLECTIONS['vendors']].find_one({'id': current_vendor['id']})
-    return updated_vendor
+    return vendor
 
 @router.get("/dashboard", response_model=VendorDashboardStats)
 async def get_vendor_dashboard(current_vendor: dict = Depends(require_approved_vendor)):
     """Get vendor dashboard statistics"""
-    db = get_database()
+    db = get_read_database()
     vendor_id = current_vendor['id']
     
-    # Get bookings stats
-    all_bookings = await db[COLLECTIONS['bookings']].find({'vendor_id': vendor_id}).to_list(1000)
+    # Get bookings stats (grouped per status, archive included)
+    booking_totals = await get_booking_totals(vendor_id)
     
-    total_bookings = len(all_bookings)
-    pending_bookings = len([b for b in all_bookings if b['status'] == 'pending'])
-    confirmed_bookings = len([b for b in all_bookings if b['status'] == 'confirmed'])
-    completed_bookings = len([b for b in all_bookings if b['status'] == 'completed'])
+    def count(status: str) -> int:
+        return booking_totals.get(status, {}).get('bookings', 0)
+    
+    total_bookings = sum(t['bookings'] for t in booking_totals.values())
+    pending_bookings = count('pending')
+    confirmed_bookings = count('confirmed')
+    completed_bookings = count('completed')
     
     # Calculate total revenue (from completed bookings)
-    total_revenue = sum(b['vendor_amount'] for b in all_bookings if b['status'] == 'completed')
+    total_revenue = booking_totals.get('completed', {}).get('vendor_net', 0.0)
     
     # Get wallet info
     wallet = await get_vendor_wallet(vendor_id)
@@ -125,6 +135,28 @@ async def get_vendor_dashboard(current_vendor: dict = Depends(require_approved_v
         total_reviews=total_reviews
     )
 
+@router.get("/wallet/statement", response_model=WalletStatement)
+async def get_my_wallet_statement(
+    as_of: Optional[datetime] = Query(None),
+    cursor: Optional[int] = Query(None, ge=1),
+    limit: int = Query(50, ge=1, le=200),
+    current_vendor: dict = Depends(require_approved_vendor)
+):
+    """Get wallet ledger entries with running balances"""
+    return await get_wallet_statement(current_vendor['id'], as_of=as_of, cursor=cursor, limit=limit)
+
+@router.get("/analytics/revenue", response_model=RevenueSeries)
+async def get_my_revenue_analytics(
+    interval: Literal["day", "week", "month"] = Query("day"),
+    start_date: Optional[datetime] = Query(None),
+    end_date: Optional[datetime] = Query(None),
+    status: Optional[List[str]] = Query(None),
+    current_vendor: dict = Depends(require_approved_vendor)
+):
+    """Get revenue per day/week/month from the rollups"""
+    return await get_revenue_series(start_date, end_date, interval,
+                                    vendor_id=current_vendor['id'], statuses=status)
+
 # ============================================================
 # PUBLIC VENDOR BROWSING
 # ============================================================
@@ -136,27 +168,35 @@ async def browse_vendors(
     limit: int = Query(20, ge=1, le=100)
 ):
     """Browse all approved vendors (public)"""
-    db = get_database()
+    return await cache.get_or_load(
+        f"vendors:list:{location}:{skip}:{limit}", PUBLIC_LIST_CACHE_SECONDS,
+        lambda: _load_vendors(location, skip, limit),
+        stale=PUBLIC_STALE_SECONDS
+    )
+
+async def _load_vendors(location: Optional[str], skip: int, limit: int) -> List[dict]:
+    db = get_read_database()
     
     query = {'is_approved': True, 'status': VendorStatus.approved.value}
     if location:
         query['location'] = {'$regex': location, '$options': 'i'}
     
-    vendors = await db[COLLECTIONS['vendors']].find(query).skip(skip).limit(limit).to_list(limit)
+    vendors = await db[COLLECTIONS['vendors']].find(query, {'_id': 0}).skip(skip).limit(limit).to_list(limit)
     return vendors
 
 @router.get("/{vendor_id}", response_model=Vendor)
 async def get_vendor_details(vendor_id: str):
     """Get specific vendor details (public)"""
-    db = get_database()
-    
-    vendor = await db[COLLECTIONS['vendors']].find_one({
-        'id': vendor_id,
-        'is_approved': True,
-        'status': VendorStatus.approved.value
-    })
+    return await cache.get_or_load(
+        f"vendor:{vendor_id}", PUBLIC_CACHE_SECONDS,
+        lambda: _load_public_vendor(vendor_id),
+        stale=PUBLIC_STALE_SECONDS
+    )
+
+async def _load_public_vendor(vendor_id: str) -> dict:
+    vendor = await get_vendor(vendor_id)
     
-    if not vendor:
+    if not vendor or not vendor.get('is_approved') or vendor.get('status') != VendorStatus.approved.value:
         raise HTTPException(status_code=404, detail="Vendor not found")
     
-    return vendor
+    return {k: v for k, v in vendor.items() if k != '_id'}
@@ -0,0 +1,136 @@
+"""
+In-app periodic job scheduler.
+
+Jobs run as asyncio tasks inside each worker. Before every run a job takes a
+lease in the `scheduler_leases` collection, so with several uvicorn workers
+only one of them runs a given job per interval.
+"""
+from typing import Callable, Awaitable, Dict, Optional
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+
+from database import get_database, COLLECTIONS
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_ENABLED = os.environ.get('SCHEDULER_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+
+# Identifies this worker in lease documents
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+job_runs_total = registry.counter(
+    'scheduler_job_runs_total',
+    'Scheduled job runs by job and outcome',
+    ('job', 'outcome')
+)
+job_duration_seconds = registry.histogram(
+    'scheduler_job_duration_seconds',
+    'Scheduled job run time',
+    ('job',),
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+)
+
+class PeriodicJob:
+    def __init__(self, name: str, interval_seconds: float, func: Callable[[], Awaitable],
+                 run_at_startup: bool = False):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.func = func
+        self.run_at_startup = run_at_startup
+        self.task: Optional[asyncio.Task] = None
+        self.last_run_at: Optional[datetime] = None
+        self.last_result = None
+        self.last_error: Optional[str] = None
+
+_jobs: Dict[str, PeriodicJob] = {}
+
+def register_job(name: str, interval_seconds: float, func: Callable[[], Awaitable],
+                 run_at_startup: bool = False) -> PeriodicJob:
+    """Register a coroutine function to run every interval_seconds"""
+    job = PeriodicJob(name, interval_seconds, func, run_at_startup)
+    _jobs[name] = job
+    return job
+
+def get_jobs() -> Dict[str, PeriodicJob]:
+    return dict(_jobs)
+
+async def acquire_lease(name: str, duration_seconds: float, owner: str = WORKER_ID) -> bool:
+    """Take the cluster-wide lease for a job; False if another owner holds it"""
+    db = get_database()
+    now = datetime.utcnow()
+    try:
+        await db[COLLECTIONS['scheduler_leases']].find_one_and_update(
+            {'_id': name, '$or': [{'locked_until': {'$lte': now}}, {'owner': owner}]},
+            {'$set': {'owner': owner, 'locked_until': now + timedelta(seconds=duration_seconds),
+                      'acquired_at': now}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The lease exists and is held by someone else, so the upsert collided
+        return False
+    return True
+
+async def release_lease(name: str, owner: str = WORKER_ID):
+    """Give up a lease early, if still held by owner"""
+    db = get_database()
+    await db[COLLECTIONS['scheduler_leases']].update_one(
+        {'_id': name, 'owner': owner},
+        {'$set': {'locked_until': datetime.utcnow()}}
+    )
+
+async def run_job(name: str):
+    """Run a registered job once, now, in the calling task"""
+    job = _jobs[name]
+    start = time.perf_counter()
+    try:
+        job.last_result = await job.func()
+        job.last_error = None
+        job_runs_total.inc(job=name, outcome='success')
+    except Exception as e:
+        job.last_error = str(e)
+        job_runs_total.inc(job=name, outcome='failure')
+        logger.exception(f"Scheduled job {name} failed")
+    finally:
+        job.last_run_at = datetime.utcnow()
+        job_duration_seconds.observe(time.perf_counter() - start, job=name)
+    return job.last_result
+
+async def _job_loop(job: PeriodicJob):
+    if not job.run_at_startup:
+        # Spread workers out so they don't all wake at the same moment
+        await asyncio.sleep(job.interval_seconds * random.uniform(0.5, 1.0))
+    while True:
+        try:
+            if await acquire_lease(job.name, job.interval_seconds * 0.9):
+                await run_job(job.name)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception(f"Scheduler loop error in {job.name}")
+        await asyncio.sleep(job.interval_seconds)
+
+def start_scheduler():
+    """Start all registered jobs; call from the running event loop"""
+    if not SCHEDULER_ENABLED:
+        logger.info("Scheduler disabled")
+        return
+    for job in _jobs.values():
+        if job.task is None or job.task.done():
+            job.task = asyncio.get_running_loop().create_task(_job_loop(job))
+    logger.info(f"Scheduler started with jobs: {', '.join(_jobs) or 'none'}")
+
+async def stop_scheduler():
+    tasks = [job.task for job in _jobs.values() if job.task and not job.task.done()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for job in _jobs.values():
+        job.task = None
@@ -0,0 +1,114 @@
+"""
+Backfill the wallet ledger for data written before sequences existed.
+
+For every vendor with unsequenced settlement transactions, this script:
+
+- adds a "payout" ledger entry for each completed payout that has none
+- renumbers all of the vendor's ledger entries 1..n in created_at order
+- resets the vendor's `ledger_sequences` counter and drops its checkpoints
+
+Run it once during the deploy that introduces the ledger, before traffic
+reaches the new code. The next checkpoint job run rebuilds the checkpoints.
+
+Usage:
+    python scripts/backfill_ledger.py --mongo-url mongodb://localhost:27017 --db-name marketplace
+"""
+from pathlib import Path
+import asyncio
+import sys
+
+import typer
+from pymongo import UpdateOne
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+app = typer.Typer(help="Assign ledger sequences to pre-ledger wallet history")
+
+async def _backfill_vendor(db, vendor_id: str, dry_run: bool) -> dict:
+    from database import COLLECTIONS
+    from ledger import build_ledger_entry
+
+    transactions = db[COLLECTIONS['settlement_transactions']]
+    recorded = set(await transactions.distinct('payout_id', {'vendor_id': vendor_id, 'payout_id': {'$ne': None}}))
+    payouts = await db[COLLECTIONS['payouts']].find(
+        {'vendor_id': vendor_id, 'status': 'completed'}
+    ).to_list(None)
+
+    missing = []
+    for payout in payouts:
+        if payout['id'] in recorded:
+            continue
+        entry = build_ledger_entry(vendor_id, "payout", -payout['amount'],
+                                   payout_id=payout['id'], settled_at=payout.get('settled_at'))
+        entry.created_at = payout.get('settled_at') or payout['created_at']
+        missing.append(entry.dict())
+
+    if dry_run:
+        return {'payout_entries': len(missing)}
+
+    if missing:
+        await transactions.insert_many(missing)
+
+    entries = await transactions.find(
+        {'vendor_id': vendor_id}, {'_id': 1, 'created_at': 1}
+    ).sort([('created_at', 1), ('_id', 1)]).to_list(None)
+    # Clear first so renumbering never collides on the unique (vendor_id, sequence) index
+    await transactions.update_many({'vendor_id': vendor_id}, {'$unset': {'sequence': ''}})
+    if entries:
+        await transactions.bulk_write([
+            UpdateOne({'_id': e['_id']}, {'$set': {'sequence': n}})
+            for n, e in enumerate(entries, start=1)
+        ], ordered=False)
+
+    await db[COLLECTIONS['wallet_checkpoints']].delete_many({'vendor_id': vendor_id})
+    await db[COLLECTIONS['ledger_sequences']].update_one(
+        {'_id': vendor_id},
+        {'$set': {'seq': len(entries), 'last_at': entries[-1]['created_at'] if entries else None},
+         '$unset': {'checkpointed_seq': ''}},
+        upsert=True
+    )
+    return {'payout_entries': len(missing), 'entries': len(entries)}
+
+async def _run(mongo_url: str, db_name: str, concurrency: int, dry_run: bool) -> dict:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from database import COLLECTIONS
+
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[db_name]
+    vendor_ids = await db[COLLECTIONS['settlement_transactions']].distinct(
+        'vendor_id', {'sequence': {'$exists': False}}
+    )
+    # Vendors whose only history is completed payouts
+    vendor_ids = set(vendor_ids) | set(await db[COLLECTIONS['payouts']].distinct(
+        'vendor_id', {'status': 'completed'}
+    )) - set(await db[COLLECTIONS['ledger_sequences']].distinct('_id'))
+
+    semaphore = asyncio.Semaphore(concurrency)
+    totals = {'vendors': 0, 'payout_entries': 0, 'entries': 0}
+
+    async def backfill(vendor_id: str):
+        async with semaphore:
+            result = await _backfill_vendor(db, vendor_id, dry_run)
+        totals['vendors'] += 1
+        for key, value in result.items():
+            totals[key] += value
+
+    await asyncio.gather(*(backfill(v) for v in sorted(vendor_ids)))
+    client.close()
+    return totals
+
+@app.command()
+def backfill(
+    mongo_url: str = typer.Option("mongodb://localhost:27017", help="MongoDB connection string"),
+    db_name: str = typer.Option("marketplace", help="Database to migrate"),
+    concurrency: int = typer.Option(8, help="Vendors migrated in parallel"),
+    dry_run: bool = typer.Option(False, help="Only count the payout entries that would be added"),
+):
+    """Sequence legacy ledger entries and add missing payout entries"""
+    totals = asyncio.run(_run(mongo_url, db_name, concurrency, dry_run))
+    for key, value in totals.items():
+        typer.echo(f"  {key:<16} {value:>10}")
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,67 @@
+"""
+Backfill `ends_at` on time slots created before the field existed.
+
+`ends_at` is slot_date + end_time converted from SLOT_TIMEZONE to UTC; the
+booking completion job finds ended slots by it. Slots without it are never
+auto-completed, so run this once during the deploy that introduces the field
+(set SLOT_TIMEZONE the same as the API).
+
+Usage:
+    python scripts/backfill_slot_end_times.py --mongo-url mongodb://localhost:27017 --db-name marketplace
+"""
+from pathlib import Path
+import asyncio
+import sys
+
+import typer
+from pymongo import UpdateOne
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+app = typer.Typer(help="Set ends_at on time slots that lack it")
+
+async def _run(mongo_url: str, db_name: str, batch_size: int, dry_run: bool) -> dict:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    from database import COLLECTIONS
+    from models import slot_ends_at
+
+    client = AsyncIOMotorClient(mongo_url)
+    slots = client[db_name][COLLECTIONS['time_slots']]
+    totals = {'slots': 0, 'invalid': 0}
+
+    cursor = slots.find(
+        {'ends_at': None}, {'_id': 1, 'slot_date': 1, 'end_time': 1}
+    ).batch_size(batch_size)
+    updates = []
+    async for slot in cursor:
+        try:
+            ends_at = slot_ends_at(slot['slot_date'], slot['end_time'])
+        except (KeyError, ValueError):
+            totals['invalid'] += 1
+            continue
+        updates.append(UpdateOne({'_id': slot['_id']}, {'$set': {'ends_at': ends_at}}))
+        totals['slots'] += 1
+        if len(updates) >= batch_size and not dry_run:
+            await slots.bulk_write(updates, ordered=False)
+            updates = []
+    if updates and not dry_run:
+        await slots.bulk_write(updates, ordered=False)
+
+    client.close()
+    return totals
+
+@app.command()
+def backfill(
+    mongo_url: str = typer.Option("mongodb://localhost:27017", help="MongoDB connection string"),
+    db_name: str = typer.Option("marketplace", help="Database to migrate"),
+    batch_size: int = typer.Option(1000, help="Slots per bulk write"),
+    dry_run: bool = typer.Option(False, help="Only count the slots that would be updated"),
+):
+    """Compute ends_at for legacy time slots"""
+    totals = asyncio.run(_run(mongo_url, db_name, batch_size, dry_run))
+    for key, value in totals.items():
+        typer.echo(f"  {key:<16} {value:>10}")
+
+if __name__ == "__main__":
+    app()
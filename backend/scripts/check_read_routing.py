@@ -0,0 +1,89 @@
+"""
+Check read routing against a replica set.
+
+Runs a tolerant read and reports which member served it, then writes a probe
+document in a causal session and reads it back from a secondary in the same
+session, which must see it. Point it at a local 3-node replica set:
+
+    mongod --replSet rs0 --port 27017 --dbpath /tmp/rs0-0
+    mongod --replSet rs0 --port 27018 --dbpath /tmp/rs0-1
+    mongod --replSet rs0 --port 27019 --dbpath /tmp/rs0-2
+    mongosh --eval 'rs.initiate({_id: "rs0", members: [
+        {_id: 0, host: "localhost:27017"}, {_id: 1, host: "localhost:27018"},
+        {_id: 2, host: "localhost:27019"}]})'
+
+Usage:
+    python scripts/check_read_routing.py --mongo-url "mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0"
+"""
+from pathlib import Path
+import asyncio
+import sys
+import uuid
+
+import typer
+from pymongo import monitoring
+from pymongo.read_concern import ReadConcern
+from pymongo.read_preferences import Secondary
+from pymongo.write_concern import WriteConcern
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+app = typer.Typer(help="Show where tolerant and causal reads are served")
+
+class _ServedBy(monitoring.CommandListener):
+    """Remembers the member that answered the last command of each name"""
+
+    def __init__(self):
+        self.last = {}
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self.last[event.command_name] = '%s:%s' % event.connection_id
+
+    def failed(self, event):
+        pass
+
+async def _run(mongo_url: str, db_name: str) -> dict:
+    from motor.motor_asyncio import AsyncIOMotorClient
+    import database
+
+    served_by = _ServedBy()
+    client = AsyncIOMotorClient(mongo_url, event_listeners=[served_by])
+    await client.admin.command('ping')
+    primary = '%s:%s' % client.primary if client.primary else None
+    report = {'primary': primary, 'secondaries': ', '.join('%s:%s' % s for s in client.secondaries)}
+
+    tolerant = client.get_database(db_name, read_preference=database.get_tolerant_read_preference())
+    await tolerant[database.COLLECTIONS['packages']].find_one({})
+    report['tolerant read'] = served_by.last.get('find')
+
+    probes = client.get_database(db_name, read_concern=ReadConcern('majority'),
+                                 write_concern=WriteConcern('majority'))['read_routing_probes']
+    probe_id = str(uuid.uuid4())
+    async with await client.start_session(causal_consistency=True) as session:
+        await probes.insert_one({'id': probe_id}, session=session)
+        found = await probes.with_options(read_preference=Secondary()).find_one({'id': probe_id}, session=session)
+    report['causal read'] = served_by.last.get('find')
+    report['causal read saw write'] = found is not None
+    await probes.delete_many({})
+
+    client.close()
+    return report
+
+@app.command()
+def check(
+    mongo_url: str = typer.Option("mongodb://localhost:27017/?replicaSet=rs0", help="Replica set connection string"),
+    db_name: str = typer.Option("marketplace", help="Database to read from"),
+):
+    """Report the members serving tolerant and causal reads"""
+    report = asyncio.run(_run(mongo_url, db_name))
+    for key, value in report.items():
+        typer.echo(f"  {key:<24} {value}")
+    if not report['causal read saw write']:
+        raise typer.Exit(code=1)
+
+if __name__ == "__main__":
+    app()
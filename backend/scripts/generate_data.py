@@ -0,0 +1,505 @@
+"""
+Synthetic marketplace data generator for scale testing.
+
+Generates users, vendors, packages, time slots, bookings, settlement
+transactions, payouts, wallets, reviews and rating summaries that respect the
+invariants the application relies on:
+
+- vendor_wallets.balance == sum(settlement net_amount) - sum(completed payouts)
+- time_slots.booked_count == number of non-cancelled bookings on the slot
+- settlements exist exactly for confirmed/completed bookings
+- reviews only for completed bookings, one per booking
+
+Vendors are split into shards that run in parallel worker processes. Every
+vendor draws from its own seeded RNG, so the output only depends on --seed and
+--anchor-date, not on scheduling. Documents are streamed with insert_many in
+batches, or written as NDJSON files (one file per collection per shard).
+
+Usage:
+    python scripts/generate_data.py --vendors 10000 --packages 100000 \\
+        --slots 5000000 --bookings 1000000 --workers 8 --db-name marketplace_scale
+    python scripts/generate_data.py --output ndjson --out-dir data/scale --vendors 100
+"""
+from typing import Optional, Dict, List
+from datetime import datetime, date, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import uuid
+import warnings
+
+import typer
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from models import (
+    User, UserRole, Vendor, VendorStatus, Package, TimeSlot, Booking, BookingStatus,
+    PaymentStatus, VendorWallet, Payout, PayoutStatus, SettlementTransaction,
+    Review, VendorRatingSummary
+)
+from utils import calculate_commission
+
+# Models are serialized with .dict() like the rest of the app; keep the CLI output readable
+warnings.filterwarnings('ignore', category=DeprecationWarning)
+
+LOCATIONS = ["Bir Billing", "Manali", "Dharamshala", "Kamshet", "Nainital", "Shillong", "Vagamon"]
+PACKAGE_NAMES = ["Tandem Joyride", "Cross Country", "Sunset Flight", "Acro Tandem", "High Altitude"]
+SLOT_HOURS = [7, 8, 9, 10, 11, 13, 14, 15, 16]
+
+app = typer.Typer(help="Generate a synthetic marketplace dataset")
+
+# ============================================================
+# HELPERS
+# ============================================================
+
+def share(total: int, parts: int, index: int) -> int:
+    """Split total into parts as evenly as possible; size of part `index`"""
+    return total // parts + (1 if index < total % parts else 0)
+
+def vendor_status(index: int) -> VendorStatus:
+    """Deterministic status mix: 5% pending, 5% suspended, rest approved"""
+    if index % 20 == 0:
+        return VendorStatus.pending
+    if index % 20 == 1:
+        return VendorStatus.suspended
+    return VendorStatus.approved
+
+def active_vendor_ordinal(index: int) -> Optional[int]:
+    """Position of a vendor among those that have bookings (non-pending)"""
+    if vendor_status(index) == VendorStatus.pending:
+        return None
+    # Pending vendors are the multiples of 20 below index
+    return index - (index + 19) // 20
+
+def count_active_vendors(vendors: int) -> int:
+    return sum(1 for i in range(vendors) if vendor_status(i) != VendorStatus.pending)
+
+class IdFactory:
+    """uuid4-formatted ids drawn from a seeded RNG"""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+
+    def __call__(self) -> str:
+        return str(uuid.UUID(int=self.rng.getrandbits(128), version=4))
+
+# ============================================================
+# SINKS
+# ============================================================
+
+class MongoSink:
+    """Buffers documents per collection and flushes them with insert_many"""
+
+    def __init__(self, mongo_url: str, db_name: str, batch_size: int):
+        from pymongo import MongoClient
+        self.client = MongoClient(mongo_url)
+        self.db = self.client[db_name]
+        self.batch_size = batch_size
+        self.buffers: Dict[str, list] = {}
+        self.counts: Dict[str, int] = {}
+
+    def add(self, collection: str, doc: dict):
+        buffer = self.buffers.setdefault(collection, [])
+        buffer.append(doc)
+        if len(buffer) >= self.batch_size:
+            self.flush(collection)
+
+    def flush(self, collection: str):
+        buffer = self.buffers.get(collection)
+        if not buffer:
+            return
+        self.db[collection].insert_many(buffer, ordered=False)
+        self.counts[collection] = self.counts.get(collection, 0) + len(buffer)
+        self.buffers[collection] = []
+
+    def close(self) -> Dict[str, int]:
+        for collection in list(self.buffers):
+            self.flush(collection)
+        self.client.close()
+        return self.counts
+
+class NdjsonSink:
+    """Writes one <collection>.part-<shard>.ndjson file per collection"""
+
+    def __init__(self, out_dir: Path, shard: int):
+        self.out_dir = out_dir
+        self.shard = shard
+        self.files = {}
+        self.counts: Dict[str, int] = {}
+
+    def add(self, collection: str, doc: dict):
+        handle = self.files.get(collection)
+        if handle is None:
+            handle = open(self.out_dir / f"{collection}.part-{self.shard:03d}.ndjson", 'w')
+            self.files[collection] = handle
+        handle.write(json.dumps(doc, default=_json_default))
+        handle.write('\n')
+        self.counts[collection] = self.counts.get(collection, 0) + 1
+
+    def close(self) -> Dict[str, int]:
+        for handle in self.files.values():
+            handle.close()
+        return self.counts
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        # Extended JSON so mongoimport restores real dates
+        return {'$date': value.isoformat() + 'Z'}
+    raise TypeError(f"Cannot serialize {type(value)}")
+
+# ============================================================
+# GENERATION
+# ============================================================
+
+def generate_vendor(index: int, config: dict, sink, customer_ids: List[str]):
+    """Generate one vendor and everything it owns"""
+    rng = random.Random(config['seed'] * 1_000_003 + index)
+    new_id = IdFactory(rng)
+    anchor = datetime.combine(config['anchor_date'], datetime.min.time())
+    vendors = config['vendors']
+
+    status = vendor_status(index)
+    joined_at = anchor - timedelta(days=rng.randint(200, 900))
+    user = User(
+        id=new_id(),
+        email=f"vendor{index}@scale.example.com",
+        name=f"Vendor {index}",
+        role=UserRole.vendor,
+        supabase_user_id=f"scale-vendor-{index}",
+        created_at=joined_at,
+        updated_at=joined_at,
+    )
+    approved = status != VendorStatus.pending
+    vendor = Vendor(
+        id=new_id(),
+        user_id=user.id,
+        company_name=f"{rng.choice(LOCATIONS)} Paragliding Co. {index}",
+        contact_email=user.email,
+        contact_phone=f"+91{rng.randint(7000000000, 9999999999)}",
+        location=rng.choice(LOCATIONS),
+        status=status,
+        is_approved=status == VendorStatus.approved,
+        commission_rate=rng.choice([10.0, 12.5, 15.0, 15.0, 18.0]),
+        created_at=joined_at,
+        updated_at=joined_at,
+        approved_at=joined_at + timedelta(days=2) if approved else None,
+    )
+    sink.add('users', user.dict())
+    sink.add('vendors', vendor.dict())
+
+    packages = []
+    for p in range(share(config['packages'], vendors, index)):
+        package = Package(
+            id=new_id(),
+            vendor_id=vendor.id,
+            name=f"{rng.choice(PACKAGE_NAMES)} {p + 1}",
+            price=float(rng.choice([2000, 2500, 3000, 3500, 4500, 6000, 8500])),
+            duration_minutes=rng.choice([10, 15, 20, 30, 45]),
+            max_altitude=f"{rng.choice([1500, 2000, 2400])}m",
+            includes=["Pilot", "Equipment", "Transport"],
+            is_active=rng.random() > 0.1,
+            created_at=joined_at,
+            updated_at=joined_at,
+        )
+        packages.append(package)
+        sink.add('packages', package.dict())
+
+    # Slots spread over [anchor - days_back, anchor + days_forward)
+    slot_count = share(config['slots'], vendors, index)
+    span_days = config['days_back'] + config['days_forward']
+    slots = []
+    for s in range(slot_count):
+        day_offset = (s * span_days) // max(slot_count, 1) - config['days_back']
+        slot_date = config['anchor_date'] + timedelta(days=day_offset)
+        hour = SLOT_HOURS[s % len(SLOT_HOURS)]
+        slots.append({
+            'id': new_id(),
+            'slot_date': slot_date.isoformat(),
+            'start_time': f"{hour:02d}:00",
+            'end_time': f"{hour + 1:02d}:00",
+            'capacity': rng.randint(4, 12),
+            'booked_count': 0,
+            'created_at': anchor - timedelta(days=config['days_back'] + 30),
+        })
+
+    ordinal = active_vendor_ordinal(index)
+    booking_count = 0
+    if ordinal is not None and slots and packages:
+        booking_count = share(config['bookings'], config['active_vendors'], ordinal)
+
+    earned = commission = net = 0.0
+    completed_reviews = []
+    for _ in range(booking_count):
+        # Find a slot with spare capacity; grow capacity if the vendor is oversubscribed
+        slot = slots[rng.randrange(len(slots))]
+        for _attempt in range(8):
+            if slot['booked_count'] < slot['capacity']:
+                break
+            slot = slots[rng.randrange(len(slots))]
+        else:
+            slot['capacity'] += 1
+
+        package = packages[rng.randrange(len(packages))]
+        slot_start = datetime.fromisoformat(f"{slot['slot_date']}T{slot['start_time']}")
+        created_at = slot_start - timedelta(days=rng.randint(1, 30), minutes=rng.randint(0, 1440))
+        in_past = slot_start < anchor
+        roll = rng.random()
+        if in_past:
+            booking_status = BookingStatus.completed if roll < 0.85 else BookingStatus.cancelled
+        else:
+            booking_status = (BookingStatus.pending if roll < 0.3
+                              else BookingStatus.confirmed if roll < 0.85
+                              else BookingStatus.cancelled)
+
+        breakdown = calculate_commission(package.price, vendor.commission_rate)
+        booking = Booking(
+            id=new_id(),
+            customer_id=customer_ids[rng.randrange(len(customer_ids))] if customer_ids else None,
+            vendor_id=vendor.id,
+            package_id=package.id,
+            time_slot_id=slot['id'],
+            customer_name=f"Customer {rng.randint(1, 10**6)}",
+            customer_email=f"customer{rng.randint(1, 10**6)}@scale.example.com",
+            total_amount=breakdown['total_amount'],
+            commission_amount=breakdown['commission_amount'],
+            vendor_amount=breakdown['vendor_amount'],
+            status=booking_status,
+            payment_status=PaymentStatus.paid if booking_status in (BookingStatus.confirmed, BookingStatus.completed)
+            else PaymentStatus.unpaid,
+            created_at=created_at,
+            updated_at=created_at,
+        )
+        if booking_status == BookingStatus.cancelled:
+            # Cancelled while still pending: no earnings, seat released
+            booking.cancelled_at = created_at + timedelta(hours=rng.randint(1, 48))
+            booking.updated_at = booking.cancelled_at
+        else:
+            slot['booked_count'] += 1
+
+        if booking_status in (BookingStatus.confirmed, BookingStatus.completed):
+            booking.confirmed_at = created_at + timedelta(hours=rng.randint(1, 24))
+            booking.updated_at = booking.confirmed_at
+            sink.add('settlement_transactions', SettlementTransaction(
+                id=new_id(),
+                vendor_id=vendor.id,
+                booking_id=booking.id,
+                transaction_type="booking_earnings",
+                gross_amount=booking.total_amount,
+                commission_amount=booking.commission_amount,
+                net_amount=booking.vendor_amount,
+                created_at=booking.confirmed_at,
+            ).dict())
+            earned += booking.total_amount
+            commission += booking.commission_amount
+            net += booking.vendor_amount
+
+        if booking_status == BookingStatus.completed:
+            booking.completed_at = slot_start + timedelta(hours=2)
+            booking.updated_at = booking.completed_at
+            if booking.customer_id and rng.random() < config['review_rate']:
+                completed_reviews.append(booking)
+
+        sink.add('bookings', booking.dict())
+
+    for slot in slots:
+        sink.add('time_slots', TimeSlot(
+            id=slot['id'],
+            vendor_id=vendor.id,
+            slot_date=slot['slot_date'],
+            start_time=slot['start_time'],
+            end_time=slot['end_time'],
+            capacity=slot['capacity'],
+            booked_count=slot['booked_count'],
+            is_available=slot['booked_count'] < slot['capacity'],
+            created_at=slot['created_at'],
+            updated_at=slot['created_at'],
+        ).dict())
+
+    ratings = []
+    for booking in completed_reviews:
+        rating = rng.choices([1, 2, 3, 4, 5], weights=[2, 3, 10, 35, 50])[0]
+        ratings.append(rating)
+        reviewed_at = booking.completed_at + timedelta(days=rng.randint(0, 5))
+        sink.add('reviews', Review(
+            id=new_id(),
+            booking_id=booking.id,
+            vendor_id=vendor.id,
+            customer_id=booking.customer_id,
+            rating=rating,
+            title="Amazing flight" if rating >= 4 else "Could be better",
+            created_at=reviewed_at,
+            updated_at=reviewed_at,
+        ).dict())
+    if approved:
+        sink.add('vendor_rating_summary', VendorRatingSummary(
+            id=new_id(),
+            vendor_id=vendor.id,
+            average_rating=round(sum(ratings) / len(ratings), 2) if ratings else 0.0,
+            total_reviews=len(ratings),
+            calculated_at=anchor,
+            updated_at=anchor,
+        ).dict())
+
+    if not approved:
+        return
+
+    # Pay out part of the net earnings; payouts never exceed the balance
+    paid_out = 0.0
+    remaining = round(net, 2)
+    for p in range(rng.randint(0, 6)):
+        amount = round(remaining * rng.uniform(0.2, 0.6), 2)
+        if amount <= 0:
+            break
+        settled_at = anchor - timedelta(days=rng.randint(1, 180))
+        sink.add('payouts', Payout(
+            id=new_id(),
+            vendor_id=vendor.id,
+            amount=amount,
+            status=PayoutStatus.completed,
+            settled_by="scale-admin",
+            settled_at=settled_at,
+            payout_method="bank_transfer",
+            payout_reference=f"UTR{rng.randint(10**11, 10**12 - 1)}",
+            created_at=settled_at - timedelta(days=2),
+            updated_at=settled_at,
+        ).dict())
+        paid_out = round(paid_out + amount, 2)
+        remaining = round(remaining - amount, 2)
+
+    if remaining > 0 and rng.random() < 0.3:
+        # An open payout request; does not affect the balance until settled
+        sink.add('payouts', Payout(
+            id=new_id(),
+            vendor_id=vendor.id,
+            amount=round(remaining * 0.5, 2),
+            status=PayoutStatus.pending,
+            payout_method="bank_transfer",
+            created_at=anchor,
+            updated_at=anchor,
+        ).dict())
+
+    sink.add('vendor_wallets', VendorWallet(
+        id=new_id(),
+        vendor_id=vendor.id,
+        balance=round(net - paid_out, 2),
+        total_earned=round(earned, 2),
+        total_commission=round(commission, 2),
+        total_paid_out=paid_out,
+        created_at=vendor.approved_at,
+        updated_at=anchor,
+    ).dict())
+
+def customer_ids_for(config: dict) -> List[str]:
+    """Customer ids are derived from the seed, so every shard agrees on them"""
+    rng = random.Random(config['seed'] * 7919 + 1)
+    new_id = IdFactory(rng)
+    return [new_id() for _ in range(config['customers'])]
+
+def generate_customers(config: dict, sink):
+    anchor = datetime.combine(config['anchor_date'], datetime.min.time())
+    for i, customer_id in enumerate(customer_ids_for(config)):
+        sink.add('users', User(
+            id=customer_id,
+            email=f"customer{i}@scale.example.com",
+            name=f"Customer {i}",
+            role=UserRole.customer,
+            supabase_user_id=f"scale-customer-{i}",
+            created_at=anchor - timedelta(days=365),
+            updated_at=anchor - timedelta(days=365),
+        ).dict())
+
+def generate_shard(shard: int, config: dict) -> Dict[str, int]:
+    """Worker entry point: generate vendors shard, shard + W, shard + 2W, ..."""
+    if config['output'] == 'mongo':
+        sink = MongoSink(config['mongo_url'], config['db_name'], config['batch_size'])
+    else:
+        sink = NdjsonSink(Path(config['out_dir']), shard)
+
+    customer_ids = customer_ids_for(config)
+    if shard == 0:
+        generate_customers(config, sink)
+    for index in range(shard, config['vendors'], config['workers']):
+        generate_vendor(index, config, sink, customer_ids)
+    return sink.close()
+
+# ============================================================
+# CLI
+# ============================================================
+
+@app.command()
+def generate(
+    vendors: int = typer.Option(10_000, help="Vendors (5% pending, 5% suspended)"),
+    packages: int = typer.Option(100_000, help="Packages across all vendors"),
+    slots: int = typer.Option(5_000_000, help="Time slots across all vendors"),
+    bookings: int = typer.Option(1_000_000, help="Bookings across non-pending vendors"),
+    customers: int = typer.Option(200_000, help="Customer accounts"),
+    review_rate: float = typer.Option(0.4, help="Share of completed bookings that get a review"),
+    days_back: int = typer.Option(365, help="Days of slot history before the anchor date"),
+    days_forward: int = typer.Option(60, help="Days of future inventory after the anchor date"),
+    anchor_date: Optional[str] = typer.Option(None, help="'Today' for the dataset (YYYY-MM-DD); defaults to today"),
+    seed: int = typer.Option(1, help="Random seed; same seed + anchor date gives identical data"),
+    workers: int = typer.Option(os.cpu_count() or 4, help="Parallel worker processes"),
+    batch_size: int = typer.Option(5_000, help="Documents per insert_many"),
+    output: str = typer.Option("mongo", help="'mongo' to insert directly, 'ndjson' to write files"),
+    mongo_url: str = typer.Option("mongodb://localhost:27017", help="MongoDB connection string"),
+    db_name: str = typer.Option("marketplace_scale", help="Target database for --output mongo"),
+    drop: bool = typer.Option(False, help="Drop the target database first"),
+    out_dir: Path = typer.Option(Path("data/scale"), help="Directory for --output ndjson"),
+):
+    """Generate the dataset"""
+    if output not in ('mongo', 'ndjson'):
+        raise typer.BadParameter("output must be 'mongo' or 'ndjson'")
+
+    config = {
+        'vendors': vendors, 'packages': packages, 'slots': slots, 'bookings': bookings,
+        'customers': customers, 'review_rate': review_rate,
+        'days_back': days_back, 'days_forward': days_forward,
+        'anchor_date': date.fromisoformat(anchor_date) if anchor_date else date.today(),
+        'seed': seed, 'workers': max(1, min(workers, vendors)), 'batch_size': batch_size,
+        'output': output, 'mongo_url': mongo_url, 'db_name': db_name, 'out_dir': str(out_dir),
+        'active_vendors': count_active_vendors(vendors),
+    }
+
+    if output == 'mongo' and drop:
+        from pymongo import MongoClient
+        with MongoClient(mongo_url) as client:
+            client.drop_database(db_name)
+    if output == 'ndjson':
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    totals: Dict[str, int] = {}
+    with ProcessPoolExecutor(max_workers=config['workers']) as pool:
+        futures = [pool.submit(generate_shard, shard, config) for shard in range(config['workers'])]
+        for future in futures:
+            for collection, count in future.result().items():
+                totals[collection] = totals.get(collection, 0) + count
+    elapsed = time.perf_counter() - start
+
+    if output == 'mongo':
+        # Build the application's indexes after the bulk load, not during it
+        os.environ['MONGO_URL'] = mongo_url
+        os.environ['DB_NAME'] = db_name
+        asyncio.run(_create_indexes(mongo_url, db_name))
+
+    for collection, count in sorted(totals.items()):
+        typer.echo(f"  {collection:<26} {count:>10}")
+    total = sum(totals.values())
+    typer.echo(f"Generated {total} documents in {elapsed:.1f}s ({total / elapsed:,.0f} docs/s)")
+
+async def _create_indexes(mongo_url: str, db_name: str):
+    import database
+    database.mongo_url = mongo_url
+    database.db_name = db_name
+    await database.connect_to_mongo()
+    await database.create_indexes()
+    await database.close_mongo_connection()
+
+if __name__ == "__main__":
+    app()
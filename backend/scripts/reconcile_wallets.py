@@ -0,0 +1,74 @@
+"""
+Reconcile vendor wallets against settlements and completed payouts.
+
+Reports every wallet whose balance differs from its history and, with --fix,
+moves the wallet balance onto the value the history implies, recording a
+ledger `adjustment` tagged with the run id where the ledger needs one. Progress is
+checkpointed after every wave of batches; --resume continues an interrupted
+run. Each run is stored in `reconciliation_runs` (see
+GET /api/admin/wallet-reconciliations).
+
+Usage:
+    python scripts/reconcile_wallets.py --db-name marketplace --concurrency 8
+    python scripts/reconcile_wallets.py --db-name marketplace --resume --fix --report drift.json
+"""
+from typing import Optional
+from pathlib import Path
+import asyncio
+import json
+import os
+import sys
+import time
+
+import typer
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+app = typer.Typer(help="Check wallet balances against settlement history")
+
+async def _run(mongo_url: str, db_name: str, batch_size: int, concurrency: int,
+               fix: bool, resume: bool) -> dict:
+    os.environ['MONGO_URL'] = mongo_url
+    os.environ['DB_NAME'] = db_name
+    import database
+    from reconciliation import reconcile_wallets
+
+    await database.connect_to_mongo()
+    try:
+        return await reconcile_wallets(batch_size=batch_size, concurrency=concurrency,
+                                       fix=fix, resume=resume)
+    finally:
+        await database.close_mongo_connection()
+
+@app.command()
+def reconcile(
+    mongo_url: str = typer.Option("mongodb://localhost:27017", help="MongoDB connection string"),
+    db_name: str = typer.Option("marketplace", help="Database to check"),
+    batch_size: int = typer.Option(500, help="Vendors per aggregation batch"),
+    concurrency: int = typer.Option(4, help="Batches reconciled in parallel"),
+    fix: bool = typer.Option(False, help="Correct drifted wallet balances"),
+    resume: bool = typer.Option(False, help="Continue from the last checkpoint"),
+    report: Optional[Path] = typer.Option(None, help="Write the run summary as JSON"),
+):
+    """Reconcile every vendor wallet"""
+    start = time.perf_counter()
+    run = asyncio.run(_run(mongo_url, db_name, batch_size, concurrency, fix, resume))
+    elapsed = time.perf_counter() - start
+
+    typer.echo(f"Checked {run['vendors_checked']} wallets in {elapsed:.1f}s"
+               + (f" (resumed after {run['resumed_from']})" if run['resumed_from'] else ""))
+    typer.echo(f"Drifted wallets: {run['drifted_vendors']}, total drift: {run['total_drift']}")
+    for drift in run['drifts'][:20]:
+        typer.echo(f"  {drift['vendor_id']}: wallet={drift['wallet_balance']} "
+                   f"expected={drift['expected_balance']} drift={drift['drift']}"
+                   + (" (corrected)" if drift['corrected'] else ""))
+    if report:
+        report.parent.mkdir(parents=True, exist_ok=True)
+        report.write_text(json.dumps(run, indent=2, default=str))
+        typer.echo(f"Report written to {report}")
+    if run['drifted_vendors'] and not fix:
+        raise typer.Exit(code=1)
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,104 @@
+"""
+Print an exported trace as a waterfall.
+
+Reads the OTLP/JSON lines written by tracing.py and shows one trace's spans
+as an indented timeline, so sequential awaits (and what could overlap) stand
+out. Sample every request while investigating:
+
+    TRACE_SAMPLE_RATE=1 uvicorn server:app
+
+Usage:
+    python scripts/show_trace.py                                   # latest trace
+    python scripts/show_trace.py --route "/api/bookings/{booking_id}/status"
+    python scripts/show_trace.py --trace-id 4bf92f3577b34da6a3ce929d0e0e4736
+"""
+from pathlib import Path
+from typing import Dict, List, Optional
+import json
+import sys
+
+import typer
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+app = typer.Typer(help="Show an exported request trace as a waterfall")
+
+BAR_WIDTH = 40
+
+def _spans(line: str) -> List[dict]:
+    request = json.loads(line)
+    return [span for resource in request['resourceSpans']
+            for scope in resource['scopeSpans'] for span in scope['spans']]
+
+def _route(spans: List[dict]) -> Optional[str]:
+    for span in spans:
+        if span['kind'] == 2:  # the request's root span
+            for attribute in span['attributes']:
+                if attribute['key'] == 'http.route':
+                    return attribute['value']['stringValue']
+    return None
+
+def _find(path: Path, trace_id: Optional[str], route: Optional[str]) -> Optional[List[dict]]:
+    """Last trace in the file matching the filters"""
+    found = None
+    with open(path) as f:
+        for line in f:
+            if trace_id and trace_id not in line:
+                continue
+            spans = _spans(line)
+            if trace_id and spans[0]['traceId'] != trace_id:
+                continue
+            if route and _route(spans) != route:
+                continue
+            found = spans
+    return found
+
+def _print_waterfall(spans: List[dict]):
+    start = min(int(s['startTimeUnixNano']) for s in spans)
+    end = max(int(s['endTimeUnixNano']) for s in spans)
+    total = max(end - start, 1)
+    children: Dict[Optional[str], List[dict]] = {}
+    ids = {s['spanId'] for s in spans}
+    for span in spans:
+        parent = span.get('parentSpanId')
+        children.setdefault(parent if parent in ids else None, []).append(span)
+
+    typer.echo(f"trace {spans[0]['traceId']}  {total / 1e6:.1f}ms  {len(spans)} spans")
+    typer.echo(f"  {'start':>9} {'ms':>8}  span")
+
+    def show(span: dict, depth: int):
+        offset = int(span['startTimeUnixNano']) - start
+        duration = int(span['endTimeUnixNano']) - int(span['startTimeUnixNano'])
+        left = int(offset / total * BAR_WIDTH)
+        bar = ' ' * left + '#' * max(1, int(duration / total * BAR_WIDTH))
+        error = '  !' if span['status'].get('code') == 2 else ''
+        typer.echo(f"  {offset / 1e6:>9.1f} {duration / 1e6:>8.1f}  |{bar:<{BAR_WIDTH}}| "
+                   f"{'  ' * depth}{span['name']}{error}")
+        for child in sorted(children.get(span['spanId'], []), key=lambda s: int(s['startTimeUnixNano'])):
+            show(child, depth + 1)
+
+    for root in sorted(children.get(None, []), key=lambda s: int(s['startTimeUnixNano'])):
+        show(root, 0)
+
+@app.command()
+def show(
+    trace_id: Optional[str] = typer.Option(None, help="Trace to show (default: the latest)"),
+    route: Optional[str] = typer.Option(None, help="Latest trace of this route template"),
+    file: Optional[Path] = typer.Option(None, help="Trace export file (default: TRACE_EXPORT_FILE)"),
+):
+    """Print one trace's spans as an indented timeline"""
+    if file is None:
+        from tracing import TRACE_EXPORT_FILE
+        file = Path(TRACE_EXPORT_FILE)
+    if not file.exists():
+        typer.echo(f"No trace export at {file}")
+        raise typer.Exit(code=1)
+    spans = _find(file, trace_id, route)
+    if not spans:
+        typer.echo("No matching trace")
+        raise typer.Exit(code=1)
+    _print_waterfall(spans)
+
+if __name__ == "__main__":
+    app()
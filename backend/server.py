@@ -1,15 +1,42 @@
-from fastapi import FastAPI, APIRouter
+from fastapi import FastAPI, APIRouter, Request, Depends
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response
 from dotenv import load_dotenv
 from pathlib import Path
 import os
+import time
 import logging
 
 # Import database functions
-from database import connect_to_mongo, close_mongo_connection, create_indexes
+from database import (
+    connect_to_mongo, close_mongo_connection, create_indexes, encode_causal_token, decode_causal_token
+)
+
+# Import metrics
+from metrics import (
+    render_metrics, PROMETHEUS_CONTENT_TYPE,
+    http_requests_total, http_request_duration_seconds, http_requests_in_flight
+)
+from request_context import begin_request, end_request
+from auth import require_role
+from models import UserRole
+from query_budget import check_query_budget, query_report
+from slow_query_log import start_slow_query_log, stop_slow_query_log
+from scheduler import register_job, start_scheduler, stop_scheduler
+from cache import start_cache, stop_cache
+from profiling import profile_requests
+from tracing import trace_requests, start_tracing, stop_tracing
+from wallet_shards import fold_wallet_shards, WALLET_FOLD_INTERVAL_SECONDS
+from ledger import checkpoint_ledgers, LEDGER_CHECKPOINT_JOB_SECONDS
+from analytics import refresh_revenue_rollups, REVENUE_ROLLUP_INTERVAL_SECONDS
+from slot_holds import sweep_expired_holds, SLOT_HOLD_SWEEP_SECONDS
+from lifecycle import expire_pending_bookings, complete_flown_bookings, BOOKING_LIFECYCLE_INTERVAL_SECONDS
+from archive import archive_history, ARCHIVE_INTERVAL_SECONDS
+from slot_compaction import compact_past_slots, SLOT_COMPACTION_INTERVAL_SECONDS
+from utils import finish_payout_debits, PAYOUT_CLAIM_SECONDS
 
 # Import route modules
-from routes import vendors, packages, time_slots, bookings, admin, reviews
+from routes import vendors, packages, time_slots, bookings, admin, reviews, exports
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -31,12 +58,23 @@ api_router.include_router(time_slots.router)
 api_router.include_router(bookings.router)
 api_router.include_router(admin.router)
 api_router.include_router(reviews.router)
+api_router.include_router(exports.router)
 
 # Health check endpoint
 @api_router.get("/health")
 async def health_check():
     return {"status": "healthy", "message": "Marketplace API is running"}
 
+# Metrics endpoint (Prometheus text format)
+@api_router.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    return Response(content=render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+# Per-route DB round-trips breakdown for this worker (admin only: it exposes query shapes)
+@api_router.get("/metrics/queries", include_in_schema=False)
+async def query_report_endpoint(current_user: dict = Depends(require_role([UserRole.admin]))):
+    return query_report()
+
 # Root endpoint
 @api_router.get("/")
 async def root():
@@ -49,6 +87,39 @@ async def root():
 # Include the router in the main app
 app.include_router(api_router)
 
+# Admin profiling; registered first so it runs inside the request context set up below
+app.middleware("http")(profile_requests)
+
+# Request metrics middleware
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Record latency per route template, in-flight requests and DB round-trips"""
+    http_requests_in_flight.inc()
+    context, token = begin_request(request.scope)
+    context.causal_token = decode_causal_token(request.headers.get('x-causal-token'))
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers['X-DB-Query-Count'] = str(context.db_calls)
+        if context.causal_token_issued:
+            response.headers['X-Causal-Token'] = encode_causal_token(**context.causal_token)
+        check_query_budget(context)
+        return response
+    finally:
+        end_request(token)
+        duration = time.perf_counter() - start
+        http_requests_in_flight.dec()
+        # Label by route template (e.g. /api/bookings/{booking_id}) to bound cardinality
+        route = request.scope.get('route')
+        route_path = getattr(route, 'path', 'unmatched')
+        http_requests_total.inc(method=request.method, route=route_path, status=str(status))
+        http_request_duration_seconds.observe(duration, method=request.method, route=route_path)
+
+# Tracing; registered after the metrics middleware so the root span covers it
+app.middleware("http")(trace_requests)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -56,8 +127,21 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Causal-Token", "X-Trace-Id"],
 )
 
+# Background jobs
+register_job('fold_wallet_shards', WALLET_FOLD_INTERVAL_SECONDS, fold_wallet_shards)
+register_job('checkpoint_wallet_ledgers', LEDGER_CHECKPOINT_JOB_SECONDS, checkpoint_ledgers)
+register_job('sweep_expired_holds', SLOT_HOLD_SWEEP_SECONDS, sweep_expired_holds)
+register_job('expire_pending_bookings', BOOKING_LIFECYCLE_INTERVAL_SECONDS, expire_pending_bookings)
+register_job('complete_flown_bookings', BOOKING_LIFECYCLE_INTERVAL_SECONDS, complete_flown_bookings)
+register_job('archive_history', ARCHIVE_INTERVAL_SECONDS, archive_history)
+register_job('compact_past_slots', SLOT_COMPACTION_INTERVAL_SECONDS, compact_past_slots)
+register_job('finish_payout_debits', PAYOUT_CLAIM_SECONDS, finish_payout_debits)
+register_job('refresh_revenue_rollups', REVENUE_ROLLUP_INTERVAL_SECONDS, refresh_revenue_rollups,
+             run_at_startup=True)
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -72,6 +156,10 @@ async def startup_event():
     logger.info("Starting up Marketplace API...")
     await connect_to_mongo()
     await create_indexes()
+    start_slow_query_log()
+    start_tracing()
+    start_scheduler()
+    start_cache()
     logger.info("Database connected and indexes created")
 
 # Shutdown event
@@ -79,5 +167,9 @@ async def startup_event():
 async def shutdown_event():
     """Close database connection on shutdown"""
     logger.info("Shutting down Marketplace API...")
+    stop_slow_query_log()
+    stop_tracing()
+    await stop_scheduler()
+    await stop_cache()
     await close_mongo_connection()
     logger.info("Database connection closed")
@@ -0,0 +1,55 @@
+"""
+Single-flight: concurrent calls for the same key share one execution.
+
+When a hot key misses the cache, every request that arrives before the first
+load finishes would otherwise run the same DB queries. `SingleFlight.do(key,
+fn)` runs `fn` once per key at a time; callers arriving while it runs await
+the same result (or exception) and are counted as
+`singleflight_calls_total{result="coalesced"}`.
+
+The shared call runs as its own task, so a caller that disconnects doesn't
+cancel it for the others. The task gets an empty context rather than the
+first caller's: its DB round-trips, request-scoped loaders and trace spans
+belong to no single request, so they aren't charged to (or cached in)
+whichever request happened to start it.
+"""
+from typing import Any, Awaitable, Callable, Dict
+import asyncio
+import contextvars
+
+from metrics import registry
+
+singleflight_calls_total = registry.counter(
+    'singleflight_calls_total',
+    'Calls through single-flight by group and whether they ran or joined an in-flight call',
+    ('group', 'result')
+)
+
+def _group(key: str) -> str:
+    return key.split(':', 1)[0]
+
+class SingleFlight:
+    """Deduplicates concurrent calls by key"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Result of fn(), shared with any concurrent call for the same key"""
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.get_running_loop().create_task(
+                fn(), context=contextvars.Context()
+            )
+            task.add_done_callback(lambda t: self._forget(key, t))
+            singleflight_calls_total.inc(group=_group(key), result='executed')
+        else:
+            singleflight_calls_total.inc(group=_group(key), result='coalesced')
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the exception retrieved when every caller has gone away
+            task.exception()
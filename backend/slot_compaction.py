@@ -0,0 +1,165 @@
+"""
+Compaction of past time slots.
+
+`compact_past_slots` rolls time slots that ended more than
+SLOT_RETENTION_DAYS ago into `vendor_slot_utilization` (one document per
+vendor and slot_date: slots, capacity, booked seats, full slots) and deletes
+them, so `time_slots` only holds upcoming and recent inventory.
+
+Only slots the booking completion job has already passed (its watermark minus
+its lookback) are compacted. Each run claims its slots (`compaction_run`),
+adds their totals with one upsert per vendor-day, and deletes them. Each
+summary records the runs applied to it, so a run that crashed half-way is
+retried under the same id without counting its slots twice.
+"""
+from typing import Dict, List, Optional
+from datetime import datetime, timedelta
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+import os
+import uuid
+
+from database import get_database, get_read_database, COLLECTIONS
+from lifecycle import COMPLETION_JOB, COMPLETION_LOOKBACK_HOURS
+from models import SlotUtilizationDay
+from metrics import registry
+
+SLOT_RETENTION_DAYS = float(os.environ.get('SLOT_RETENTION_DAYS', '7'))
+SLOT_COMPACTION_INTERVAL_SECONDS = float(os.environ.get('SLOT_COMPACTION_INTERVAL_SECONDS', '3600'))
+SLOT_COMPACTION_BATCH_SIZE = 1000
+COMPACTION_CLAIM_SECONDS = 600
+# Runs remembered per summary, for retrying crashed runs
+APPLIED_RUNS_KEPT = 20
+DUPLICATE_KEY = 11000
+
+compacted_slots_total = registry.counter(
+    'compacted_slots_total',
+    'Past time slots rolled into vendor_slot_utilization'
+)
+
+async def _compaction_cutoff() -> Optional[datetime]:
+    """Slots ending before this are safe to compact; None until completion has run"""
+    db = get_database()
+    state = await db[COLLECTIONS['job_checkpoints']].find_one({'_id': COMPLETION_JOB})
+    if not state:
+        return None
+    return min(datetime.utcnow() - timedelta(days=SLOT_RETENTION_DAYS),
+               state['watermark'] - timedelta(hours=COMPLETION_LOOKBACK_HOURS))
+
+async def _apply_run(run_id: str) -> int:
+    """Add a run's claimed slots to the summaries and delete them"""
+    db = get_database()
+    slots = db[COLLECTIONS['time_slots']]
+    rows = await slots.aggregate([
+        {'$match': {'compaction_run': run_id}},
+        {'$group': {
+            '_id': {'vendor_id': '$vendor_id', 'slot_date': '$slot_date'},
+            'slots': {'$sum': 1},
+            'capacity': {'$sum': '$capacity'},
+            'booked': {'$sum': '$booked_count'},
+            'full_slots': {'$sum': {'$cond': [{'$gte': ['$booked_count', '$capacity']}, 1, 0]}},
+        }},
+    ]).to_list(None)
+    if not rows:
+        return 0
+
+    now = datetime.utcnow()
+    try:
+        await db[COLLECTIONS['vendor_slot_utilization']].bulk_write([
+            # Already-applied runs don't match, and the upsert then hits the unique key
+            UpdateOne(
+                {**row['_id'], 'applied_runs': {'$ne': run_id}},
+                {'$inc': {k: row[k] for k in ('slots', 'capacity', 'booked', 'full_slots')},
+                 '$push': {'applied_runs': {'$each': [run_id], '$slice': -APPLIED_RUNS_KEPT}},
+                 '$set': {'updated_at': now}},
+                upsert=True
+            )
+            for row in rows
+        ], ordered=False)
+    except BulkWriteError as e:
+        if any(error['code'] != DUPLICATE_KEY for error in e.details['writeErrors']):
+            raise
+
+    result = await slots.delete_many({'compaction_run': run_id})
+    compacted_slots_total.inc(result.deleted_count)
+    return result.deleted_count
+
+async def compact_past_slots() -> dict:
+    """Scheduled job: roll ended time slots into daily utilization and delete them"""
+    db = get_database()
+    slots = db[COLLECTIONS['time_slots']]
+    now = datetime.utcnow()
+    compacted = 0
+
+    # Finish runs that crashed after claiming, under their own run id
+    stale_runs = await slots.distinct('compaction_run', {
+        'compaction_run': {'$exists': True},
+        'compaction_claimed_at': {'$lt': now - timedelta(seconds=COMPACTION_CLAIM_SECONDS)},
+    })
+    for run_id in stale_runs:
+        compacted += await _apply_run(run_id)
+
+    cutoff = await _compaction_cutoff()
+    if cutoff is None:
+        return {'compacted': compacted}
+
+    while True:
+        run_id = str(uuid.uuid4())
+        batch = await slots.find(
+            {'ends_at': {'$lt': cutoff}, 'compaction_run': {'$exists': False}}, {'_id': 1}
+        ).limit(SLOT_COMPACTION_BATCH_SIZE).to_list(SLOT_COMPACTION_BATCH_SIZE)
+        if not batch:
+            break
+        await slots.update_many(
+            {'_id': {'$in': [s['_id'] for s in batch]}, 'compaction_run': {'$exists': False}},
+            {'$set': {'compaction_run': run_id, 'compaction_claimed_at': now}}
+        )
+        compacted += await _apply_run(run_id)
+        if len(batch) < SLOT_COMPACTION_BATCH_SIZE:
+            break
+    return {'compacted': compacted}
+
+# ============================================================
+# UTILIZATION HISTORY
+# ============================================================
+
+async def get_slot_utilization(vendor_id: str, start_date: Optional[str] = None,
+                               end_date: Optional[str] = None) -> List[SlotUtilizationDay]:
+    """Daily capacity vs booked seats: compacted summaries plus slots not yet compacted"""
+    db = get_read_database()
+    match = {'vendor_id': vendor_id}
+    if start_date or end_date:
+        match['slot_date'] = {}
+        if start_date:
+            match['slot_date']['$gte'] = start_date
+        if end_date:
+            match['slot_date']['$lte'] = end_date
+
+    days: Dict[str, dict] = {}
+    summaries = db[COLLECTIONS['vendor_slot_utilization']].find(
+        match, {'_id': 0, 'slot_date': 1, 'slots': 1, 'capacity': 1, 'booked': 1, 'full_slots': 1}
+    )
+    live = db[COLLECTIONS['time_slots']].aggregate([
+        {'$match': match},
+        {'$group': {
+            '_id': '$slot_date',
+            'slots': {'$sum': 1},
+            'capacity': {'$sum': '$capacity'},
+            'booked': {'$sum': '$booked_count'},
+            'full_slots': {'$sum': {'$cond': [{'$gte': ['$booked_count', '$capacity']}, 1, 0]}},
+        }},
+    ])
+    for cursor, date_field in ((summaries, 'slot_date'), (live, '_id')):
+        async for row in cursor:
+            day = days.setdefault(row[date_field], {'slots': 0, 'capacity': 0, 'booked': 0, 'full_slots': 0})
+            for field in day:
+                day[field] += row[field]
+
+    return [
+        SlotUtilizationDay(
+            slot_date=slot_date,
+            utilization=round(day['booked'] / day['capacity'], 4) if day['capacity'] else 0.0,
+            **day
+        )
+        for slot_date, day in sorted(days.items())
+    ]
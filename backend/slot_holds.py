@@ -0,0 +1,140 @@
+"""
+Short-lived seat holds on time slots.
+
+A hold reserves seats the moment a customer picks a slot: the seats are added
+to the slot's booked_count, so availability drops for everyone else, and a
+`slot_holds` document records them until `expires_at`. Submitting the booking
+with the hold_id converts the hold instead of reserving seats again.
+
+A scheduled sweeper returns the seats of expired holds. It claims them first
+(status "expiring"), releases the seats per slot in one bulk write, then
+marks them expired. Seats given back by a hold go to the slot's waitlist.
+The sweeper also recovers waitlist promotions interrupted partway.
+A TTL index removes hold documents a day after they expire, long after the
+sweeper has run.
+"""
+from typing import Optional
+from datetime import datetime, timedelta
+from pymongo import UpdateOne, ReturnDocument
+import os
+import uuid
+
+from database import get_database, COLLECTIONS
+from models import SlotHold, SlotHoldStatus
+from metrics import registry
+from utils import increment_slot_booking, decrement_slot_booking
+from waitlist import promote_waitlist, recover_stale_promotions
+
+SLOT_HOLD_SECONDS = int(os.environ.get('SLOT_HOLD_SECONDS', '600'))
+SLOT_HOLD_SWEEP_SECONDS = float(os.environ.get('SLOT_HOLD_SWEEP_SECONDS', '30'))
+# Sweeps that crashed after claiming are retaken after this long
+SWEEP_CLAIM_SECONDS = 300
+# Hold documents are deleted by the TTL index this long after expiry
+HOLD_RETENTION_SECONDS = 86400
+
+slot_holds_total = registry.counter(
+    'slot_holds_total',
+    'Slot hold outcomes',
+    ('outcome',)
+)
+
+async def create_hold(time_slot_id: str, seats: int, customer_id: Optional[str] = None) -> Optional[SlotHold]:
+    """Reserve seats for SLOT_HOLD_SECONDS; None if the slot lacks capacity"""
+    db = get_database()
+    if not await increment_slot_booking(time_slot_id, seats):
+        slot_holds_total.inc(outcome='rejected')
+        return None
+
+    hold = SlotHold(
+        time_slot_id=time_slot_id,
+        seats=seats,
+        customer_id=customer_id,
+        expires_at=datetime.utcnow() + timedelta(seconds=SLOT_HOLD_SECONDS)
+    )
+    try:
+        await db[COLLECTIONS['slot_holds']].insert_one(hold.dict())
+    except Exception:
+        await decrement_slot_booking(time_slot_id, seats)
+        raise
+    slot_holds_total.inc(outcome='created')
+    return hold
+
+async def claim_hold(hold_id: str, time_slot_id: str, seats: int, booking_id: str) -> bool:
+    """Convert an unexpired hold matching the booking; False if there is none"""
+    db = get_database()
+    hold = await db[COLLECTIONS['slot_holds']].find_one_and_update(
+        {
+            'id': hold_id,
+            'time_slot_id': time_slot_id,
+            'seats': seats,
+            'status': SlotHoldStatus.active.value,
+            'expires_at': {'$gt': datetime.utcnow()}
+        },
+        {'$set': {'status': SlotHoldStatus.converted.value, 'booking_id': booking_id}},
+        projection={'_id': 1}
+    )
+    if hold is not None:
+        slot_holds_total.inc(outcome='converted')
+    return hold is not None
+
+async def unclaim_hold(hold_id: str):
+    """Undo claim_hold when the booking could not be written"""
+    db = get_database()
+    await db[COLLECTIONS['slot_holds']].update_one(
+        {'id': hold_id, 'status': SlotHoldStatus.converted.value},
+        {'$set': {'status': SlotHoldStatus.active.value, 'booking_id': None}}
+    )
+
+async def release_hold(hold_id: str) -> Optional[dict]:
+    """Give an active hold's seats back; None if it isn't active"""
+    db = get_database()
+    hold = await db[COLLECTIONS['slot_holds']].find_one_and_update(
+        {'id': hold_id, 'status': SlotHoldStatus.active.value},
+        {'$set': {'status': SlotHoldStatus.released.value}},
+        return_document=ReturnDocument.AFTER
+    )
+    if hold:
+        await decrement_slot_booking(hold['time_slot_id'], hold['seats'])
+        slot_holds_total.inc(outcome='released')
+        await promote_waitlist(hold['time_slot_id'])
+    return hold
+
+async def sweep_expired_holds() -> dict:
+    """Scheduled job: return the seats of expired holds to their slots"""
+    db = get_database()
+    holds = db[COLLECTIONS['slot_holds']]
+    now = datetime.utcnow()
+    run_id = str(uuid.uuid4())
+    recovered = await recover_stale_promotions()
+
+    await holds.update_many(
+        {'$or': [
+            {'status': SlotHoldStatus.active.value, 'expires_at': {'$lte': now}},
+            {'status': SlotHoldStatus.expiring.value,
+             'sweep_claimed_at': {'$lt': now - timedelta(seconds=SWEEP_CLAIM_SECONDS)}},
+        ]},
+        {'$set': {'status': SlotHoldStatus.expiring.value, 'sweep_run': run_id, 'sweep_claimed_at': now}}
+    )
+    claimed = await holds.find(
+        {'sweep_run': run_id, 'status': SlotHoldStatus.expiring.value},
+        {'time_slot_id': 1, 'seats': 1}
+    ).to_list(None)
+    if not claimed:
+        return {'expired': 0, 'recovered_promotions': recovered}
+
+    seats_by_slot = {}
+    for hold in claimed:
+        seats_by_slot[hold['time_slot_id']] = seats_by_slot.get(hold['time_slot_id'], 0) + hold['seats']
+    await db[COLLECTIONS['time_slots']].bulk_write([
+        UpdateOne({'id': slot_id},
+                  {'$inc': {'booked_count': -seats}, '$set': {'is_available': True, 'updated_at': now}})
+        for slot_id, seats in seats_by_slot.items()
+    ], ordered=False)
+    await holds.update_many(
+        {'sweep_run': run_id, 'status': SlotHoldStatus.expiring.value},
+        {'$set': {'status': SlotHoldStatus.expired.value}}
+    )
+    slot_holds_total.inc(len(claimed), outcome='expired')
+    for slot_id in seats_by_slot:
+        await promote_waitlist(slot_id)
+    return {'expired': len(claimed), 'slots': len(seats_by_slot), 'recovered_promotions': recovered}
@@ -0,0 +1,269 @@
+"""
+Slow-query log with sampled explain capture.
+
+Commands slower than SLOW_QUERY_THRESHOLD_MS are written to a rotating local
+log file and to the capped `slow_queries` collection, together with the route
+that issued them. A sample of them is re-run as explain("executionStats") so
+the stored entry carries the winning plan and docs/keys examined.
+"""
+from typing import Optional, Any
+from collections import OrderedDict
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from database import get_database, COLLECTIONS
+from db_monitoring import command_listener, CommandRecord
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', '100'))
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_SAMPLE_RATE', '0.1'))
+# Explain the same query shape at most once per interval
+SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS = float(os.environ.get('SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS', '60'))
+# Query shapes remembered for that interval; the least recently explained are forgotten first
+SLOW_QUERY_EXPLAIN_MAX_SHAPES = 1000
+SLOW_QUERY_LOG_FILE = os.environ.get(
+    'SLOW_QUERY_LOG_FILE', str(Path(__file__).parent / 'logs' / 'slow_queries.log')
+)
+
+# Commands that can be wrapped in an explain
+EXPLAINABLE_COMMANDS = {'find', 'aggregate', 'count', 'distinct', 'update', 'delete', 'findAndModify'}
+
+# Driver/session fields that must not be echoed back into explain or stored
+_DRIVER_FIELDS = {'lsid', '$db', '$clusterTime', 'txnNumber', 'autocommit', 'startTransaction',
+                  '$readPreference', 'readConcern', 'writeConcern', 'signature'}
+
+slow_queries_total = registry.counter(
+    'mongo_slow_queries_total',
+    'MongoDB commands slower than the slow-query threshold',
+    ('collection', 'command')
+)
+
+_file_logger = logging.getLogger('slow_queries')
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_last_explained: 'OrderedDict[tuple, float]' = OrderedDict()
+_explain_lock = threading.Lock()
+
+# ============================================================
+# QUERY NORMALIZATION
+# ============================================================
+
+def normalize_query(value: Any) -> Any:
+    """Replace literal values with '?' so queries group by shape"""
+    if isinstance(value, dict):
+        return {k: normalize_query(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Arrays of operators (e.g. $and/$or) keep structure, literal arrays collapse
+        if value and all(isinstance(v, dict) for v in value):
+            return [normalize_query(v) for v in value]
+        return '?'
+    return '?'
+
+def command_query_shape(record: CommandRecord) -> str:
+    """Stable string describing the query shape of a command"""
+    command = record.command
+    name = record.command_name
+    if name == 'aggregate':
+        shape = [{stage: normalize_query(spec) if stage in ('$match', '$lookup') else '…'}
+                 for stage_doc in command.get('pipeline', [])
+                 for stage, spec in stage_doc.items()]
+    elif name in ('update', 'delete'):
+        key = 'updates' if name == 'update' else 'deletes'
+        statements = command.get(key) or [{}]
+        shape = {'q': normalize_query(statements[0].get('q', {}))}
+    elif name == 'findAndModify':
+        shape = {'query': normalize_query(command.get('query', {})),
+                 'sort': command.get('sort')}
+    else:
+        shape = {'filter': normalize_query(command.get('filter') or command.get('query') or {}),
+                 'sort': command.get('sort')}
+    return json.dumps(shape, sort_keys=True, default=str)
+
+def _sanitize_command(command: dict) -> dict:
+    """Copy of a command without driver fields and bulky insert payloads"""
+    cleaned = {k: v for k, v in command.items() if k not in _DRIVER_FIELDS}
+    if 'documents' in cleaned:
+        cleaned['documents'] = f"<{len(cleaned['documents'])} documents>"
+    return cleaned
+
+# ============================================================
+# EXPLAIN
+# ============================================================
+
+def _plan_stages(plan: dict) -> list:
+    """Flatten a winning plan into 'STAGE(index)' strings, outermost first"""
+    stages = []
+    while plan:
+        stage = plan.get('stage', '?')
+        if plan.get('indexName'):
+            stage = f"{stage}({plan['indexName']})"
+        stages.append(stage)
+        plan = plan.get('inputStage') or (plan.get('inputStages') or [None])[0]
+    return stages
+
+def summarize_explain(explain: dict) -> dict:
+    """Reduce explain output to the fields that matter for index tuning"""
+    planner = explain.get('queryPlanner')
+    stats = explain.get('executionStats')
+    if planner is None:
+        # Aggregations nest the cursor stage explain under 'stages'
+        for stage in explain.get('stages', []):
+            cursor = stage.get('$cursor')
+            if cursor:
+                planner = cursor.get('queryPlanner')
+                stats = cursor.get('executionStats')
+                break
+    planner = planner or {}
+    stats = stats or {}
+    winning_plan = planner.get('winningPlan', {})
+    # Slot-based engine wraps the classic plan in 'queryPlan'
+    winning_plan = winning_plan.get('queryPlan', winning_plan)
+    return {
+        'plan': _plan_stages(winning_plan),
+        'n_returned': stats.get('nReturned'),
+        'keys_examined': stats.get('totalKeysExamined'),
+        'docs_examined': stats.get('totalDocsExamined'),
+        'execution_time_ms': stats.get('executionTimeMillis'),
+    }
+
+def _should_explain(record: CommandRecord, shape: str) -> bool:
+    if record.command_name not in EXPLAINABLE_COMMANDS:
+        return False
+    if random.random() >= SLOW_QUERY_EXPLAIN_SAMPLE_RATE:
+        return False
+    key = (record.collection, record.command_name, shape)
+    now = time.monotonic()
+    with _explain_lock:
+        last = _last_explained.get(key)
+        if last is not None and now - last < SLOW_QUERY_EXPLAIN_INTERVAL_SECONDS:
+            return False
+        _last_explained[key] = now
+        _last_explained.move_to_end(key)
+        while len(_last_explained) > SLOW_QUERY_EXPLAIN_MAX_SHAPES:
+            _last_explained.popitem(last=False)
+    return True
+
+async def _persist(entry: dict, command: Optional[dict], database_name: str):
+    db = get_database()
+    if db is None:
+        return
+    if command is not None:
+        try:
+            explain = await db.client[database_name].command({'explain': command, 'verbosity': 'executionStats'})
+            entry['explain'] = summarize_explain(explain)
+        except Exception as e:
+            entry['explain_error'] = str(e)
+    try:
+        await db[COLLECTIONS['slow_queries']].insert_one(entry)
+    except Exception:
+        logger.debug("Failed to store slow query entry", exc_info=True)
+
+# ============================================================
+# LISTENER HOOK
+# ============================================================
+
+def _on_command(record: CommandRecord):
+    """CommandListener observer; runs on a Motor executor thread"""
+    duration_ms = record.duration * 1000
+    if duration_ms < SLOW_QUERY_THRESHOLD_MS or record.outcome != 'success':
+        return
+    # Never log our own bookkeeping, or we'd feed back into ourselves
+    if record.collection == COLLECTIONS['slow_queries'] or record.command_name == 'explain':
+        return
+
+    context = record.context
+    shape = command_query_shape(record)
+    entry = {
+        'ts': datetime.utcnow(),
+        'collection': record.collection,
+        'command_name': record.command_name,
+        'duration_ms': round(duration_ms, 3),
+        'shape': shape,
+        # Stored as JSON text: raw operators can't be field names on older servers
+        'command': json.dumps(_sanitize_command(record.command), default=str),
+        'route': context.route if context else 'background',
+        'method': context.method if context else None,
+    }
+    slow_queries_total.inc(collection=record.collection, command=record.command_name)
+    _file_logger.info(json.dumps(entry, default=str))
+
+    loop = _loop
+    if loop is None or loop.is_closed():
+        return
+    command = _sanitize_command(record.command) if _should_explain(record, shape) else None
+    # Schedule on the event loop in an empty context so the explain and the
+    # insert are not counted against the request that triggered them
+    loop.call_soon_threadsafe(
+        lambda: loop.create_task(_persist(entry, command, record.database_name)),
+        context=contextvars.Context()
+    )
+
+def start_slow_query_log():
+    """Attach the slow-query observer; call from the running event loop"""
+    global _loop
+    _loop = asyncio.get_running_loop()
+
+    if not _file_logger.handlers:
+        log_path = Path(SLOW_QUERY_LOG_FILE)
+        log_path.parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(log_path, maxBytes=10 * 1024 * 1024, backupCount=5)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _file_logger.addHandler(handler)
+        _file_logger.setLevel(logging.INFO)
+        _file_logger.propagate = False
+
+    command_listener.add_observer(_on_command)
+    logger.info(f"Slow-query log enabled (threshold {SLOW_QUERY_THRESHOLD_MS}ms)")
+
+def stop_slow_query_log():
+    global _loop
+    command_listener.remove_observer(_on_command)
+    _loop = None
+
+# ============================================================
+# REPORTING
+# ============================================================
+
+async def get_top_slow_queries(limit: int = 20, since: Optional[datetime] = None) -> list:
+    """Top query shapes by total time spent above the threshold"""
+    db = get_database()
+    match = {'ts': {'$gte': since}} if since else {}
+    pipeline = [
+        {'$match': match},
+        {'$sort': {'ts': 1}},
+        {'$group': {
+            '_id': {
+                'collection': '$collection',
+                'command_name': '$command_name',
+                'shape': '$shape',
+            },
+            'total_ms': {'$sum': '$duration_ms'},
+            'count': {'$sum': 1},
+            'max_ms': {'$max': '$duration_ms'},
+            'routes': {'$addToSet': '$route'},
+            'last_seen': {'$last': '$ts'},
+            'sample_command': {'$last': '$command'},
+            # $max skips missing values, so any sampled plan is kept
+            'explain': {'$max': '$explain'},
+        }},
+        {'$sort': {'total_ms': -1}},
+        {'$limit': limit},
+    ]
+    results = []
+    async for row in db[COLLECTIONS['slow_queries']].aggregate(pipeline):
+        key = row.pop('_id')
+        row.update(key)
+        row['avg_ms'] = round(row['total_ms'] / row['count'], 3)
+        row['total_ms'] = round(row['total_ms'], 3)
+        results.append(row)
+    return results
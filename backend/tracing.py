@@ -0,0 +1,311 @@
+"""
+Lightweight in-process request tracing.
+
+Each sampled request gets a root span, with child spans for every MongoDB
+command (from the command listener) and every `@traced` helper (the async
+helpers in utils.py), so a trace shows the waterfall of awaits in a handler.
+
+Traces continue the W3C `traceparent` header when one is sent (its sampled
+flag decides), and otherwise are sampled at TRACE_SAMPLE_RATE. The trace id
+is returned in `X-Trace-Id` either way. Sampled traces are written, one per
+line, as OTLP/JSON `ExportTraceServiceRequest` documents to the rotating file
+TRACE_EXPORT_FILE, which an OpenTelemetry collector's file receiver can pick
+up; `scripts/show_trace.py` prints them as a waterfall.
+
+The current span lives in a ContextVar. Motor copies the context onto its
+executor threads, so DB spans attach to the span that issued the command,
+and tasks started with asyncio.gather attach to the span that started them.
+The root span ends when the response body has been sent, so streamed
+responses (exports) are timed in full and their DB spans are kept.
+Unsampled requests record nothing.
+"""
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+from fastapi import Request
+import functools
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from db_monitoring import command_listener, CommandRecord
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.environ.get('TRACING_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', '0.01'))
+TRACE_EXPORT_FILE = os.environ.get(
+    'TRACE_EXPORT_FILE', str(Path(__file__).parent / 'logs' / 'traces.jsonl')
+)
+TRACE_SERVICE_NAME = os.environ.get('TRACE_SERVICE_NAME', 'marketplace-api')
+# Spans kept per trace; a runaway request stops recording rather than growing without bound
+TRACE_MAX_SPANS = 1000
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+STATUS_UNSET = 0
+STATUS_ERROR = 2
+
+TRACEPARENT = re.compile(r'^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+traces_exported_total = registry.counter(
+    'traces_exported_total',
+    'Sampled request traces written to the trace export file'
+)
+
+_file_logger = logging.getLogger('traces')
+
+# ============================================================
+# SPANS
+# ============================================================
+
+class Trace:
+    """Spans of one sampled request, collected until the root span ends"""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List['Span'] = []
+        self.dropped = 0
+        self._lock = threading.Lock()  # DB spans are added from executor threads
+
+    def add(self, span: 'Span'):
+        with self._lock:
+            if len(self.spans) < TRACE_MAX_SPANS:
+                self.spans.append(span)
+            else:
+                self.dropped += 1
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'kind', 'start_ns', 'end_ns',
+                 'attributes', 'status', 'status_message')
+
+    def __init__(self, trace: Trace, name: str, kind: int = SPAN_KIND_INTERNAL,
+                 parent_id: Optional[str] = None, start_ns: Optional[int] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.status = STATUS_UNSET
+        self.status_message = ''
+
+    def set_error(self, message: str):
+        self.status = STATUS_ERROR
+        self.status_message = message
+
+    def end(self, end_ns: Optional[int] = None):
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        self.trace.add(self)
+
+_current_span: ContextVar[Optional[Span]] = ContextVar('current_span', default=None)
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace.trace_id if span else None
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes):
+    """Child span of the current one; does nothing outside a sampled trace"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(parent.trace, name, kind, parent.span_id, attributes=attributes)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.set_error(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+def traced(fn: Callable[..., Awaitable[Any]]) -> Callable[..., Awaitable[Any]]:
+    """Decorator: run an async function in a span named after it"""
+    name = f"{fn.__module__}.{fn.__qualname__}"
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        if _current_span.get() is None:
+            return await fn(*args, **kwargs)
+        with span(name, **{'code.function': fn.__qualname__, 'code.namespace': fn.__module__}):
+            return await fn(*args, **kwargs)
+    return wrapper
+
+# ============================================================
+# DB SPANS
+# ============================================================
+
+def _on_command(record: CommandRecord):
+    """CommandListener observer; runs on the Motor executor thread, in the issuer's context"""
+    parent = _current_span.get()
+    if parent is None:
+        return
+    start_ns = int(record.started_at * 1_000_000_000)
+    db_span = Span(parent.trace, f"{record.command_name} {record.collection}", SPAN_KIND_CLIENT,
+                   parent.span_id, start_ns=start_ns, attributes={
+                       'db.system': 'mongodb',
+                       'db.name': record.database_name,
+                       'db.operation': record.command_name,
+                       'db.mongodb.collection': record.collection,
+                   })
+    if record.outcome != 'success':
+        db_span.set_error(record.outcome)
+    db_span.end(start_ns + int(record.duration * 1_000_000_000))
+
+# ============================================================
+# PROPAGATION AND REQUEST MIDDLEWARE
+# ============================================================
+
+def parse_traceparent(header: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace id, parent span id, sampled) from a W3C traceparent header, if valid"""
+    match = TRACEPARENT.match((header or '').strip().lower())
+    if not match:
+        return None
+    trace_id, parent_id, flags = match.groups()
+    if trace_id == '0' * 32 or parent_id == '0' * 16:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 1)
+
+async def trace_requests(request: Request, call_next):
+    """HTTP middleware: root span per request, exported if sampled"""
+    if not TRACING_ENABLED:
+        return await call_next(request)
+
+    incoming = parse_traceparent(request.headers.get('traceparent'))
+    if incoming:
+        trace_id, parent_id, sampled = incoming
+    else:
+        trace_id, parent_id, sampled = os.urandom(16).hex(), None, random.random() < TRACE_SAMPLE_RATE
+    if not sampled:
+        response = await call_next(request)
+        response.headers['X-Trace-Id'] = trace_id
+        return response
+
+    trace = Trace(trace_id)
+    root = Span(trace, f"{request.method} {request.url.path}", SPAN_KIND_SERVER, parent_id, attributes={
+        'http.method': request.method,
+        'url.path': request.url.path,
+    })
+    token = _current_span.set(root)
+    try:
+        response = await call_next(request)
+    except BaseException as e:
+        root.set_error(f"{type(e).__name__}: {e}")
+        _end_root(request, root)
+        raise
+    finally:
+        _current_span.reset(token)
+
+    root.attributes['http.status_code'] = response.status_code
+    if response.status_code >= 500:
+        root.set_error(f"HTTP {response.status_code}")
+    response.headers['X-Trace-Id'] = trace_id
+    # The body is sent after this returns (and, for a StreamingResponse, still
+    # produced by the handler's task, which keeps the root as its current span)
+    response.body_iterator = _end_root_after_body(response.body_iterator, request, root)
+    return response
+
+def _end_root(request: Request, root: Span):
+    """End the request's root span and export its trace"""
+    route = getattr(request.scope.get('route'), 'path', None)
+    if route:
+        root.name = f"{request.method} {route}"
+        root.attributes['http.route'] = route
+    root.end()
+    export_trace(root.trace)
+
+async def _end_root_after_body(body: AsyncIterator[bytes], request: Request, root: Span):
+    try:
+        async for chunk in body:
+            yield chunk
+    except BaseException as e:
+        root.set_error(f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _end_root(request, root)
+
+# ============================================================
+# EXPORT
+# ============================================================
+
+def _attribute_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+def _attributes(attributes: Dict[str, Any]) -> List[dict]:
+    return [{'key': k, 'value': _attribute_value(v)} for k, v in attributes.items()]
+
+def _otlp_span(s: Span) -> dict:
+    otlp = {
+        'traceId': s.trace.trace_id,
+        'spanId': s.span_id,
+        'name': s.name,
+        'kind': s.kind,
+        'startTimeUnixNano': str(s.start_ns),
+        'endTimeUnixNano': str(s.end_ns),
+        'attributes': _attributes(s.attributes),
+        'status': {'code': s.status, 'message': s.status_message} if s.status else {'code': s.status},
+    }
+    if s.parent_id:
+        otlp['parentSpanId'] = s.parent_id
+    return otlp
+
+def to_otlp(trace: Trace) -> dict:
+    """Trace as an OTLP/JSON ExportTraceServiceRequest"""
+    resource = {'service.name': TRACE_SERVICE_NAME, 'process.pid': os.getpid()}
+    if trace.dropped:
+        resource['trace.dropped_spans'] = trace.dropped
+    return {'resourceSpans': [{
+        'resource': {'attributes': _attributes(resource)},
+        'scopeSpans': [{
+            'scope': {'name': __name__},
+            'spans': [_otlp_span(s) for s in sorted(trace.spans, key=lambda s: s.start_ns)],
+        }],
+    }]}
+
+def export_trace(trace: Trace):
+    if not _file_logger.handlers:
+        return
+    with trace._lock:
+        line = json.dumps(to_otlp(trace), separators=(',', ':'))
+    _file_logger.info(line)
+    traces_exported_total.inc()
+
+def start_tracing():
+    """Open the export file and attach the DB span observer"""
+    if not TRACING_ENABLED:
+        return
+    if not _file_logger.handlers:
+        export_path = Path(TRACE_EXPORT_FILE)
+        export_path.parent.mkdir(parents=True, exist_ok=True)
+        handler = RotatingFileHandler(export_path, maxBytes=50 * 1024 * 1024, backupCount=5)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        _file_logger.addHandler(handler)
+        _file_logger.setLevel(logging.INFO)
+        _file_logger.propagate = False
+
+    command_listener.add_observer(_on_command)
+    logger.info(f"Tracing enabled (sample rate {TRACE_SAMPLE_RATE}, exporting to {TRACE_EXPORT_FILE})")
+
+def stop_tracing():
+    command_listener.remove_observer(_on_command)
@@ -1,30 +1,65 @@
-from typing import Optional
-from datetime import datetime
+from typing import Optional, List, Dict, Sequence, Union
+from datetime import datetime, timedelta
+import os
+import uuid
+import numpy as np
+from fastapi import HTTPException
+from pymongo import UpdateOne, ReturnDocument
 from database import get_database, COLLECTIONS
 from models import (
-    VendorWallet, SettlementTransaction, Notification,
-    NotificationType, CommissionSettings
+    VendorWallet, Notification, NotificationType, Payout, PayoutStatus,
+    PayoutRun, PayoutBatchItem, PayoutBatchResult, PayoutItemResult
 )
+from wallet_shards import increment_wallet, debit_payouts, get_wallet_with_shards, sharding_enabled
+from ledger import record_ledger_entry, record_ledger_entries, build_ledger_entry
+from cache import cache, invalidate_reviews
+from repository import get_user, get_vendor, get_booking, get_vendor_by_user, prime
+from scheduler import acquire_lease, release_lease
+from tracing import traced
 
 # ============================================================
 # COMMISSION CALCULATIONS
 # ============================================================
 
-async def get_commission_rate(vendor_id: str) -> float:
-    """Get commission rate for a vendor (vendor-specific or default)"""
+# Commission rates live in the shared cache; admin updates invalidate them on
+# every worker (see cache.py).
+COMMISSION_CACHE_SECONDS = float(os.environ.get('COMMISSION_CACHE_SECONDS', '60'))
+DEFAULT_COMMISSION_RATE = 15.0
+
+@traced
+async def invalidate_commission_cache(vendor_id: Optional[str] = None):
+    """Drop cached commission rates (one vendor's, or the default and all vendors')"""
+    if vendor_id:
+        await cache.invalidate(f"commission:vendor:{vendor_id}")
+        return
+    await cache.invalidate_prefix("commission:")
+
+async def _load_default_commission_rate() -> float:
     db = get_database()
-    
-    # Check if vendor has custom rate
-    vendor = await db[COLLECTIONS['vendors']].find_one({'id': vendor_id})
-    if vendor and 'commission_rate' in vendor:
+    settings = await db[COLLECTIONS['commission_settings']].find_one({}, {'default_rate': 1})
+    return settings.get('default_rate', DEFAULT_COMMISSION_RATE) if settings else DEFAULT_COMMISSION_RATE
+
+@traced
+async def get_default_commission_rate() -> float:
+    """Platform default commission rate from commission_settings (cached)"""
+    return await cache.get_or_load("commission:default", COMMISSION_CACHE_SECONDS,
+                                   _load_default_commission_rate)
+
+@traced
+async def resolve_commission_rate(vendor: dict) -> float:
+    """Commission rate for an already-fetched vendor document"""
+    if 'commission_rate' in vendor:
         return vendor['commission_rate']
-    
-    # Get default rate from settings
-    settings = await db[COLLECTIONS['commission_settings']].find_one({})
-    if settings:
-        return settings.get('default_rate', 15.0)
-    
-    return 15.0  # Fallback default
+    return await get_default_commission_rate()
+
+@traced
+async def get_commission_rate(vendor_id: str) -> float:
+    """Get commission rate for a vendor (vendor-specific or default)"""
+    async def load() -> float:
+        db = get_database()
+        vendor = await db[COLLECTIONS['vendors']].find_one({'id': vendor_id}, {'commission_rate': 1})
+        return await resolve_commission_rate(vendor or {})
+    return await cache.get_or_load(f"commission:vendor:{vendor_id}", COMMISSION_CACHE_SECONDS, load)
 
 def calculate_commission(total_amount: float, commission_rate: float) -> dict:
     """Calculate commission breakdown"""
@@ -38,10 +73,37 @@ def calculate_commission(total_amount: float, commission_rate: float) -> dict:
         'commission_rate': commission_rate
     }
 
+def _round_money(values: np.ndarray) -> np.ndarray:
+    """np.round to 2 places, agreeing exactly with Python's round()"""
+    rounded = np.round(values, 2)
+    # np.round scales by 100 first, which can tip values sitting on a half-cent
+    # the other way; redo those few with round()
+    scaled = values * 100
+    near_half = np.flatnonzero(np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6)
+    if near_half.size:
+        rounded[near_half] = [round(float(v), 2) for v in values[near_half]]
+    return rounded
+
+def calculate_commission_batch(total_amounts: Sequence[float],
+                               commission_rates: Union[float, Sequence[float]]) -> dict:
+    """Vectorized calculate_commission; returns arrays, element-wise identical to it"""
+    totals = np.asarray(total_amounts, dtype=np.float64)
+    rates = np.broadcast_to(np.asarray(commission_rates, dtype=np.float64), totals.shape)
+    commission_amounts = _round_money((totals * rates) / 100)
+    vendor_amounts = _round_money(totals - commission_amounts)
+    
+    return {
+        'total_amount': totals,
+        'commission_amount': commission_amounts,
+        'vendor_amount': vendor_amounts,
+        'commission_rate': rates
+    }
+
 # ============================================================
 # WALLET MANAGEMENT
 # ============================================================
 
+@traced
 async def create_vendor_wallet(vendor_id: str):
     """Create wallet for newly approved vendor"""
     db = get_database()
@@ -55,27 +117,20 @@ async def create_vendor_wallet(vendor_id: str):
     await db[COLLECTIONS['vendor_wallets']].insert_one(wallet.dict())
     return wallet
 
+@traced
 async def update_wallet_on_booking(vendor_id: str, booking_id: str, 
                                    total_amount: float, commission_amount: float, 
                                    vendor_amount: float):
     """Update vendor wallet when booking is confirmed"""
-    db = get_database()
+    # Update wallet balance and totals (sharded when WALLET_COUNTER_SHARDS > 1)
+    await increment_wallet(vendor_id, {
+        'balance': vendor_amount,
+        'total_earned': total_amount,
+        'total_commission': commission_amount
+    })
     
-    # Update wallet balance and totals
-    await db[COLLECTIONS['vendor_wallets']].update_one(
-        {'vendor_id': vendor_id},
-        {
-            '$inc': {
-                'balance': vendor_amount,
-                'total_earned': total_amount,
-                'total_commission': commission_amount
-            },
-            '$set': {'updated_at': datetime.utcnow()}
-        }
-    )
-    
-    # Record settlement transaction
-    transaction = SettlementTransaction(
+    # Record ledger entry
+    await record_ledger_entry(
         vendor_id=vendor_id,
         booking_id=booking_id,
         transaction_type="booking_earnings",
@@ -83,56 +138,58 @@ async def update_wallet_on_booking(vendor_id: str, booking_id: str,
         commission_amount=commission_amount,
         net_amount=vendor_amount
     )
-    await db[COLLECTIONS['settlement_transactions']].insert_one(transaction.dict())
 
+@traced
 async def get_vendor_wallet(vendor_id: str) -> Optional[dict]:
-    """Get vendor wallet details"""
-    db = get_database()
-    return await db[COLLECTIONS['vendor_wallets']].find_one({'vendor_id': vendor_id})
+    """Get vendor wallet details, including unfolded shard amounts"""
+    return await get_wallet_with_shards(vendor_id)
 
 # ============================================================
 # PAYOUT MANAGEMENT
 # ============================================================
 
+# How long a batch settle may hold payouts before another settle can take them over
+PAYOUT_CLAIM_SECONDS = 600
+# Only one payout run at a time; a run that dies keeps the lease this long at most
+PAYOUT_RUN_LEASE = 'payout_run'
+PAYOUT_RUN_LEASE_SECONDS = 300
+
+@traced
 async def process_payout(payout_id: str, settled_by: str, 
                         settlement_notes: Optional[str] = None,
                         payout_reference: Optional[str] = None,
                         status: str = "completed"):
-    """Mark payout as completed and update wallet"""
-    db = get_database()
+    """Mark payout as completed or failed and update wallet; returns the payout"""
+    now = datetime.utcnow()
     
-    # Get payout details
-    payout = await db[COLLECTIONS['payouts']].find_one({'id': payout_id})
-    if not payout:
-        raise ValueError("Payout not found")
-    
-    # Update payout status
-    await db[COLLECTIONS['payouts']].update_one(
+    # Only open payouts not claimed by a running batch settle; settling twice would debit twice
+    payout = await update_or_raise(
+        COLLECTIONS['payouts'],
         {'id': payout_id},
         {
             '$set': {
                 'status': status,
                 'settled_by': settled_by,
-                'settled_at': datetime.utcnow(),
+                'settled_at': now,
                 'settlement_notes': settlement_notes,
                 'payout_reference': payout_reference,
-                'updated_at': datetime.utcnow()
+                # Cleared by finish_payout_debits once the wallet and ledger have it
+                'wallet_debit_pending': status == "completed",
+                'updated_at': now
             }
-        }
+        },
+        expect={
+            'status': {'$in': [PayoutStatus.pending.value, PayoutStatus.processing.value]},
+            '$or': [{'settlement_claim': None},
+                    {'settlement_claimed_at': {'$lt': now - timedelta(seconds=PAYOUT_CLAIM_SECONDS)}}]
+        },
+        not_found="Payout not found",
+        conflict="Payout already settled"
     )
     
-    # If completed, update wallet
+    # If completed, debit the wallet and record the ledger entry
     if status == "completed":
-        await db[COLLECTIONS['vendor_wallets']].update_one(
-            {'vendor_id': payout['vendor_id']},
-            {
-                '$inc': {
-                    'balance': -payout['amount'],  # Deduct from balance
-                    'total_paid_out': payout['amount']  # Add to paid out total
-                },
-                '$set': {'updated_at': datetime.utcnow()}
-            }
-        )
+        await finish_payout_debits([payout_id])
         
         # Create notification
         await create_notification(
@@ -141,11 +198,233 @@ async def process_payout(payout_id: str, settled_by: str,
             title="Payout Completed",
             message=f"Your payout of ₹{payout['amount']} has been processed successfully."
         )
+    
+    return payout
+
+@traced
+async def find_payable_vendors(min_balance: float) -> List[dict]:
+    """Vendors whose balance net of open payouts is at least min_balance"""
+    db = get_database()
+    pipeline = []
+    if not sharding_enabled():
+        # Shards can hold part of the balance, so only prefilter when there are none
+        pipeline.append({'$match': {'balance': {'$gte': min_balance}}})
+    else:
+        pipeline.append({'$lookup': {
+            'from': COLLECTIONS['vendor_wallet_shards'],
+            'localField': 'vendor_id',
+            'foreignField': 'vendor_id',
+            'as': 'shards'
+        }})
+    pipeline += [
+        {'$lookup': {
+            'from': COLLECTIONS['payouts'],
+            'let': {'vendor_id': '$vendor_id'},
+            'pipeline': [
+                {'$match': {'$expr': {'$and': [
+                    {'$eq': ['$vendor_id', '$$vendor_id']},
+                    # Completed payouts count until their wallet debit has landed
+                    {'$or': [
+                        {'$in': ['$status', [PayoutStatus.pending.value, PayoutStatus.processing.value]]},
+                        {'$eq': ['$wallet_debit_pending', True]},
+                    ]},
+                ]}}},
+                {'$group': {'_id': None, 'amount': {'$sum': '$amount'}}},
+            ],
+            'as': 'open_payouts'
+        }},
+        {'$addFields': {'available': {'$round': [{'$subtract': [
+            {'$add': ['$balance', {'$sum': {'$ifNull': ['$shards.balance', []]}},
+                      {'$sum': {'$ifNull': ['$shards.folding.balance', []]}}]},
+            {'$ifNull': [{'$arrayElemAt': ['$open_payouts.amount', 0]}, 0]},
+        ]}, 2]}}},
+        {'$match': {'available': {'$gte': min_balance}}},
+        {'$project': {'_id': 0, 'vendor_id': 1, 'available': 1}},
+    ]
+    return await db[COLLECTIONS['vendor_wallets']].aggregate(pipeline, allowDiskUse=True).to_list(None)
+
+@traced
+async def create_payout_run(min_balance: float, payout_method: Optional[str] = None,
+                            created_by: Optional[str] = None, dry_run: bool = False) -> PayoutRun:
+    """Create a pending payout of the full available balance for every payable vendor"""
+    run = PayoutRun(min_balance=min_balance, dry_run=dry_run, created_by=created_by)
+    if dry_run:
+        return await _plan_payout_run(run, payout_method)
+
+    # Two runs computing balances at once would both pay them out; the lease is
+    # owned by the run, so even a second run from the same worker is refused
+    if not await acquire_lease(PAYOUT_RUN_LEASE, PAYOUT_RUN_LEASE_SECONDS, owner=run.id):
+        raise HTTPException(status_code=409, detail="Another payout run is in progress")
+    try:
+        return await _plan_payout_run(run, payout_method)
+    finally:
+        await release_lease(PAYOUT_RUN_LEASE, owner=run.id)
+
+async def _plan_payout_run(run: PayoutRun, payout_method: Optional[str]) -> PayoutRun:
+    db = get_database()
+    payable = await find_payable_vendors(run.min_balance)
+    vendors = await db[COLLECTIONS['vendors']].find(
+        {'id': {'$in': [p['vendor_id'] for p in payable]}, 'status': 'approved'},
+        {'id': 1, 'user_id': 1}
+    ).to_list(None)
+    user_ids = {v['id']: v['user_id'] for v in vendors}
+
+    run.payouts = [
+        Payout(vendor_id=p['vendor_id'], amount=p['available'], payout_method=payout_method,
+               status=PayoutStatus.pending, payout_run_id=run.id)
+        for p in payable if p['vendor_id'] in user_ids
+    ]
+    run.vendor_count = len(run.payouts)
+    run.total_amount = round(sum(p.amount for p in run.payouts), 2)
+    if run.dry_run or not run.payouts:
+        return run
+
+    await db[COLLECTIONS['payouts']].insert_many([p.dict() for p in run.payouts], ordered=False)
+    await create_notifications([
+        Notification(
+            user_id=user_ids[p.vendor_id],
+            notification_type=NotificationType.payout_processed,
+            title="Payout Initiated",
+            message=f"A payout of ₹{p.amount} has been initiated and is being processed.",
+            related_vendor_id=p.vendor_id
+        )
+        for p in run.payouts
+    ])
+    return run
+
+@traced
+async def settle_payouts(items: List[PayoutBatchItem], settled_by: str) -> PayoutBatchResult:
+    """Settle many payouts with a fixed number of round-trips"""
+    db = get_database()
+    payouts_collection = db[COLLECTIONS['payouts']]
+    requested = {item.payout_id: item for item in items}
+    now = datetime.utcnow()
+
+    # Claim the open payouts so a concurrent settle of the same ids can't double-pay
+    claim_id = str(uuid.uuid4())
+    await payouts_collection.update_many(
+        {'id': {'$in': list(requested)},
+         'status': {'$in': [PayoutStatus.pending.value, PayoutStatus.processing.value]},
+         # A claim left behind by a crashed settle expires
+         '$or': [{'settlement_claim': None},
+                 {'settlement_claimed_at': {'$lt': now - timedelta(seconds=PAYOUT_CLAIM_SECONDS)}}]},
+        {'$set': {'status': PayoutStatus.processing.value, 'settlement_claim': claim_id,
+                  'settlement_claimed_at': now, 'updated_at': now}}
+    )
+    found = await payouts_collection.find(
+        {'id': {'$in': list(requested)}},
+        {'id': 1, 'vendor_id': 1, 'amount': 1, 'settlement_claim': 1}
+    ).to_list(None)
+    found = {p['id']: p for p in found}
+    claimed = [p for p in found.values() if p.get('settlement_claim') == claim_id]
+
+    outcomes = {}
+    for payout_id in requested:
+        payout = found.get(payout_id)
+        if not payout:
+            outcomes[payout_id] = "not_found"
+        elif payout.get('settlement_claim') != claim_id:
+            outcomes[payout_id] = "already_settled"
+        else:
+            outcomes[payout_id] = requested[payout_id].status
+    result = PayoutBatchResult(results=[
+        PayoutItemResult(payout_id=payout_id, result=outcome,
+                         vendor_id=found[payout_id]['vendor_id'] if payout_id in found else None,
+                         amount=found[payout_id]['amount'] if payout_id in found else None)
+        for payout_id, outcome in outcomes.items()
+    ])
+    result.skipped = len(requested) - len(claimed)
+    if not claimed:
+        return result
+
+    await payouts_collection.bulk_write([
+        UpdateOne(
+            {'id': p['id'], 'settlement_claim': claim_id},
+            {'$set': {
+                'status': requested[p['id']].status,
+                'settled_by': settled_by,
+                'settled_at': now,
+                'settlement_notes': requested[p['id']].settlement_notes,
+                'payout_reference': requested[p['id']].payout_reference,
+                # Set with the status so a crash before the debit leaves it to finish_payout_debits
+                'wallet_debit_pending': requested[p['id']].status == "completed",
+                'updated_at': now
+            }, '$unset': {'settlement_claim': '', 'settlement_claimed_at': ''}}
+        )
+        for p in claimed
+    ], ordered=False)
+
+    completed = [p for p in claimed if requested[p['id']].status == "completed"]
+    debits: Dict[str, float] = {}
+    for p in completed:
+        debits[p['vendor_id']] = debits.get(p['vendor_id'], 0.0) + p['amount']
+    await finish_payout_debits([p['id'] for p in completed])
+
+    vendors = await db[COLLECTIONS['vendors']].find(
+        {'id': {'$in': list(debits)}}, {'id': 1, 'user_id': 1}
+    ).to_list(None)
+    user_ids = {v['id']: v['user_id'] for v in vendors}
+    await create_notifications([
+        Notification(
+            user_id=user_ids[p['vendor_id']],
+            notification_type=NotificationType.payout_processed,
+            title="Payout Completed",
+            message=f"Your payout of ₹{p['amount']} has been processed successfully.",
+            related_vendor_id=p['vendor_id']
+        )
+        for p in completed if p['vendor_id'] in user_ids
+    ])
+
+    result.completed = len(completed)
+    result.failed = len(claimed) - len(completed)
+    result.total_paid_out = round(sum(debits.values()), 2)
+    return result
+
+@traced
+async def finish_payout_debits(payout_ids: Optional[List[str]] = None) -> int:
+    """Apply the wallet debit and ledger entry of completed payouts still marked
+    wallet_debit_pending; returns how many were finished.
+
+    With payout_ids, finishes those payouts (the settle that just completed
+    them). Without, finishes payouts whose settle stopped partway, once they
+    are older than PAYOUT_CLAIM_SECONDS. Both steps are idempotent, so a
+    payout is never debited or entered in the ledger twice.
+    """
+    db = get_database()
+    payouts_collection = db[COLLECTIONS['payouts']]
+    query = {'status': PayoutStatus.completed.value, 'wallet_debit_pending': True}
+    if payout_ids is not None:
+        if not payout_ids:
+            return 0
+        query['id'] = {'$in': payout_ids}
+    else:
+        query['settled_at'] = {'$lt': datetime.utcnow() - timedelta(seconds=PAYOUT_CLAIM_SECONDS)}
+    pending = await payouts_collection.find(
+        query, {'id': 1, 'vendor_id': 1, 'amount': 1, 'settled_at': 1}
+    ).to_list(None)
+    if not pending:
+        return 0
+
+    await debit_payouts(pending)
+    ids = [p['id'] for p in pending]
+    recorded = set(await db[COLLECTIONS['settlement_transactions']].distinct(
+        'payout_id', {'payout_id': {'$in': ids}, 'transaction_type': "payout"}
+    ))
+    await record_ledger_entries([
+        build_ledger_entry(p['vendor_id'], "payout", -p['amount'], payout_id=p['id'],
+                           settled_at=p['settled_at'])
+        for p in pending if p['id'] not in recorded
+    ])
+    await payouts_collection.update_many(
+        {'id': {'$in': ids}}, {'$set': {'wallet_debit_pending': False}}
+    )
+    return len(pending)
 
 # ============================================================
 # REVIEW & RATING MANAGEMENT
 # ============================================================
 
+@traced
 async def update_vendor_rating(vendor_id: str):
     """Recalculate vendor's average rating"""
     db = get_database()
@@ -167,6 +446,7 @@ async def update_vendor_rating(vendor_id: str):
             },
             upsert=True
         )
+        await invalidate_reviews(vendor_id)
         return
     
     # Calculate average
@@ -186,11 +466,14 @@ async def update_vendor_rating(vendor_id: str):
         },
         upsert=True
     )
+    # Reviews and the summary change together
+    await invalidate_reviews(vendor_id)
 
 # ============================================================
 # NOTIFICATION MANAGEMENT
 # ============================================================
 
+@traced
 async def create_notification(user_id: str, notification_type: NotificationType,
                              title: str, message: Optional[str] = None,
                              related_booking_id: Optional[str] = None,
@@ -210,6 +493,17 @@ async def create_notification(user_id: str, notification_type: NotificationType,
     await db[COLLECTIONS['notifications']].insert_one(notification.dict())
     return notification
 
+@traced
+async def create_notifications(notifications: List[Notification]):
+    """Insert many notifications in one round-trip"""
+    if not notifications:
+        return
+    db = get_database()
+    await db[COLLECTIONS['notifications']].insert_many(
+        [notification.dict() for notification in notifications], ordered=False
+    )
+
+@traced
 async def create_booking_notifications(booking: dict, vendor: dict):
     """Create notifications for booking events"""
     # Notify customer
@@ -236,44 +530,47 @@ async def create_booking_notifications(booking: dict, vendor: dict):
 # TIME SLOT MANAGEMENT
 # ============================================================
 
-async def check_slot_availability(time_slot_id: str) -> bool:
-    """Check if a time slot has available capacity"""
+@traced
+async def check_slot_availability(time_slot_id: str, seats: int = 1) -> bool:
+    """Check if a time slot has capacity for `seats` more passengers"""
     db = get_database()
     
     slot = await db[COLLECTIONS['time_slots']].find_one({'id': time_slot_id})
     if not slot:
         return False
     
-    return slot['is_available'] and slot['booked_count'] < slot['capacity']
+    return slot['is_available'] and slot['booked_count'] + seats <= slot['capacity']
 
-async def increment_slot_booking(time_slot_id: str):
-    """Increment booked count for a time slot"""
+@traced
+async def increment_slot_booking(time_slot_id: str, seats: int = 1) -> bool:
+    """Atomically reserve seats on a time slot; False if it lacks capacity"""
     db = get_database()
     
-    result = await db[COLLECTIONS['time_slots']].update_one(
-        {'id': time_slot_id},
+    # Capacity check, increment and the is_available flag change in one update,
+    # so concurrent bookings can't oversell the last seats
+    slot = await db[COLLECTIONS['time_slots']].find_one_and_update(
         {
-            '$inc': {'booked_count': 1},
-            '$set': {'updated_at': datetime.utcnow()}
-        }
+            'id': time_slot_id,
+            'is_available': True,
+            '$expr': {'$lte': [{'$add': ['$booked_count', seats]}, '$capacity']}
+        },
+        [
+            {'$set': {'booked_count': {'$add': ['$booked_count', seats]}, 'updated_at': datetime.utcnow()}},
+            {'$set': {'is_available': {'$lt': ['$booked_count', '$capacity']}}}
+        ],
+        projection={'_id': 1}
     )
-    
-    # Check if slot is now full
-    slot = await db[COLLECTIONS['time_slots']].find_one({'id': time_slot_id})
-    if slot and slot['booked_count'] >= slot['capacity']:
-        await db[COLLECTIONS['time_slots']].update_one(
-            {'id': time_slot_id},
-            {'$set': {'is_available': False, 'updated_at': datetime.utcnow()}}
-        )
+    return slot is not None
 
-async def decrement_slot_booking(time_slot_id: str):
-    """Decrement booked count for a time slot (on cancellation)"""
+@traced
+async def decrement_slot_booking(time_slot_id: str, seats: int = 1):
+    """Release seats on a time slot (on cancellation)"""
     db = get_database()
     
     await db[COLLECTIONS['time_slots']].update_one(
         {'id': time_slot_id},
         {
-            '$inc': {'booked_count': -1},
+            '$inc': {'booked_count': -seats},
             '$set': {'is_available': True, 'updated_at': datetime.utcnow()}
         }
     )
@@ -282,22 +579,49 @@ async def decrement_slot_booking(time_slot_id: str):
 # AUTHORIZATION HELPERS
 # ============================================================
 
+@traced
+async def update_or_raise(collection: str, query: dict, update: dict,
+                          owner: Optional[dict] = None, expect: Optional[dict] = None,
+                          not_found: str = "Not found", forbidden: str = "Not authorized",
+                          conflict: str = "Conflicting update") -> dict:
+    """Update one document in a single round-trip and return the post-image.
+    
+    `owner` (ownership) and `expect` (state preconditions) are equality filters
+    added to the update filter. Only when nothing matched is the document read
+    once more, to answer 404 (missing), 403 (not the owner) or 409 (state)."""
+    db = get_database()
+    document = await db[collection].find_one_and_update(
+        {**query, **(owner or {}), **(expect or {})},
+        update,
+        return_document=ReturnDocument.AFTER
+    )
+    if document:
+        prime(collection, document)
+        return document
+    
+    existing = await db[collection].find_one(query, {k: 1 for k in owner or {}} or {'_id': 1})
+    if not existing:
+        raise HTTPException(status_code=404, detail=not_found)
+    if owner and any(existing.get(k) != v for k, v in owner.items()):
+        raise HTTPException(status_code=403, detail=forbidden)
+    raise HTTPException(status_code=409, detail=conflict)
+
+@traced
 async def get_user_role(user_id: str) -> Optional[str]:
     """Get user's role"""
-    db = get_database()
-    user = await db[COLLECTIONS['users']].find_one({'id': user_id})
+    user = await get_user(user_id)
     return user['role'] if user else None
 
+@traced
 async def is_vendor_owner(user_id: str, vendor_id: str) -> bool:
     """Check if user owns the vendor account"""
-    db = get_database()
-    vendor = await db[COLLECTIONS['vendors']].find_one({'id': vendor_id})
+    vendor = await get_vendor(vendor_id)
     return vendor and vendor['user_id'] == user_id
 
+@traced
 async def is_booking_participant(user_id: str, booking_id: str) -> bool:
     """Check if user is customer or vendor of the booking"""
-    db = get_database()
-    booking = await db[COLLECTIONS['bookings']].find_one({'id': booking_id})
+    booking = await get_booking(booking_id)
     if not booking:
         return False
     
@@ -306,10 +630,10 @@ async def is_booking_participant(user_id: str, booking_id: str) -> bool:
         return True
     
     # Check if vendor
-    vendor = await db[COLLECTIONS['vendors']].find_one({'id': booking['vendor_id']})
+    vendor = await get_vendor(booking['vendor_id'])
     return vendor and vendor['user_id'] == user_id
 
+@traced
 async def get_vendor_by_user_id(user_id: str) -> Optional[dict]:
     """Get vendor profile by user ID"""
-    db = get_database()
-    return await db[COLLECTIONS['vendors']].find_one({'user_id': user_id})
+    return await get_vendor_by_user(user_id)
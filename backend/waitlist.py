@@ -0,0 +1,228 @@
+"""
+Per-slot FIFO waitlists.
+
+Customers join a full time slot's waitlist and get the next `position` from a
+counter on the slot document (`waitlist_seq`, bumped with `$inc`). Whenever
+seats come back to a slot (booking cancelled, hold released or expired),
+`promote_waitlist` turns the head of the queue into a pending booking:
+
+1. claim the lowest-position waiting entry with one `find_one_and_update`
+   (served by the (time_slot_id, status, position) index, so the waitlist is
+   never scanned),
+2. reserve its seats with the same atomic capacity check as a booking,
+3. write the booking, mark the entry promoted and notify the customer.
+
+If the head doesn't fit in the freed seats it goes back to waiting and
+promotion stops, so later (smaller) entries never jump the queue.
+
+The claim records `promoting_at` and the booking id to use, and the entry is
+flagged `seats_reserved` once step 2 succeeds. A promotion whose worker died
+is picked up by `recover_stale_promotions` (run by the hold sweeper) after
+PROMOTION_CLAIM_SECONDS: if its booking was written the entry is marked
+promoted, otherwise any reserved seats are given back and the entry returns
+to its place in the queue.
+"""
+from typing import Optional, List
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from pymongo import ReturnDocument
+import asyncio
+import logging
+import uuid
+
+from database import get_database, COLLECTIONS
+from models import (
+    WaitlistEntry, WaitlistJoin, WaitlistStatus, Booking, BookingStatus,
+    NotificationType
+)
+from metrics import registry
+from repository import get_package, get_vendor
+from utils import (
+    resolve_commission_rate, calculate_commission, create_notification,
+    increment_slot_booking, decrement_slot_booking
+)
+
+logger = logging.getLogger(__name__)
+
+# Entries promoted per freed-seats event at most
+MAX_PROMOTIONS_PER_RELEASE = 20
+# Promotions still claimed after this long were interrupted and are recovered
+PROMOTION_CLAIM_SECONDS = 300
+
+waitlist_total = registry.counter(
+    'waitlist_entries_total',
+    'Waitlist outcomes',
+    ('outcome',)
+)
+
+async def join_waitlist(entry_data: WaitlistJoin, customer_id: Optional[str] = None) -> WaitlistEntry:
+    """Append a customer to the slot's waitlist"""
+    db = get_database()
+    slot = await db[COLLECTIONS['time_slots']].find_one_and_update(
+        {'id': entry_data.time_slot_id},
+        {'$inc': {'waitlist_seq': 1}},
+        projection={'waitlist_seq': 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if not slot:
+        raise HTTPException(status_code=404, detail="Time slot not found")
+    entry = WaitlistEntry(
+        position=slot['waitlist_seq'],
+        customer_id=customer_id,
+        **entry_data.dict()
+    )
+    await db[COLLECTIONS['waitlist_entries']].insert_one(entry.dict())
+    waitlist_total.inc(outcome='joined')
+    return entry
+
+async def leave_waitlist(entry_id: str) -> Optional[dict]:
+    """Remove a waiting entry from the queue; None if it isn't waiting"""
+    db = get_database()
+    entry = await db[COLLECTIONS['waitlist_entries']].find_one_and_update(
+        {'id': entry_id, 'status': WaitlistStatus.waiting.value},
+        {'$set': {'status': WaitlistStatus.left.value}},
+        return_document=ReturnDocument.AFTER
+    )
+    if entry:
+        waitlist_total.inc(outcome='left')
+    return entry
+
+async def _build_booking(entry: dict) -> Optional[Booking]:
+    """Price a pending booking for a waitlist entry; None if no longer bookable"""
+    package, vendor = await asyncio.gather(get_package(entry['package_id']), get_vendor(entry['vendor_id']))
+    if not package or not package.get('is_active') or not vendor or not vendor.get('is_approved'):
+        return None
+
+    commission_rate = await resolve_commission_rate(vendor)
+    financial_breakdown = calculate_commission(round(package['price'] * entry['seats'], 2), commission_rate)
+    return Booking(
+        id=entry['booking_id'],
+        customer_id=entry.get('customer_id'),
+        vendor_id=entry['vendor_id'],
+        package_id=entry['package_id'],
+        time_slot_id=entry['time_slot_id'],
+        customer_name=entry['customer_name'],
+        customer_email=entry['customer_email'],
+        customer_phone=entry.get('customer_phone'),
+        seats=entry['seats'],
+        total_amount=financial_breakdown['total_amount'],
+        commission_amount=financial_breakdown['commission_amount'],
+        vendor_amount=financial_breakdown['vendor_amount'],
+        notes=entry.get('notes'),
+        status=BookingStatus.pending
+    )
+
+async def _requeue(entry: dict):
+    """Return a claimed entry to its place in the queue"""
+    db = get_database()
+    await db[COLLECTIONS['waitlist_entries']].update_one(
+        {'id': entry['id'], 'status': WaitlistStatus.promoting.value},
+        {'$set': {'status': WaitlistStatus.waiting.value, 'booking_id': None,
+                  'promoting_at': None, 'seats_reserved': False}}
+    )
+
+async def _mark_promoted(entry: dict, booking_id: str):
+    """Record the promotion and tell the customer"""
+    db = get_database()
+    await db[COLLECTIONS['waitlist_entries']].update_one(
+        {'id': entry['id']},
+        {'$set': {'status': WaitlistStatus.promoted.value, 'booking_id': booking_id,
+                  'promoted_at': datetime.utcnow()}}
+    )
+    waitlist_total.inc(outcome='promoted')
+
+    if entry.get('customer_id'):
+        await create_notification(
+            user_id=entry['customer_id'],
+            notification_type=NotificationType.waitlist_promoted,
+            title="You're off the waitlist",
+            message=f"A spot opened up and your booking for {entry['seats']} seat(s) is now pending.",
+            related_booking_id=booking_id,
+            related_vendor_id=entry['vendor_id']
+        )
+
+async def promote_waitlist(time_slot_id: str, limit: int = MAX_PROMOTIONS_PER_RELEASE) -> List[Booking]:
+    """Turn waitlist entries into pending bookings while the freed seats fit them"""
+    db = get_database()
+    entries = db[COLLECTIONS['waitlist_entries']]
+    promoted = []
+
+    for _ in range(limit):
+        entry = await entries.find_one_and_update(
+            {'time_slot_id': time_slot_id, 'status': WaitlistStatus.waiting.value},
+            {'$set': {'status': WaitlistStatus.promoting.value, 'promoting_at': datetime.utcnow(),
+                      'booking_id': str(uuid.uuid4()), 'seats_reserved': False}},
+            sort=[('position', 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        if not entry:
+            break
+
+        if not await increment_slot_booking(time_slot_id, entry['seats']):
+            # The head doesn't fit yet; keep its place and stop
+            await _requeue(entry)
+            break
+        await entries.update_one({'id': entry['id']}, {'$set': {'seats_reserved': True}})
+
+        try:
+            booking = await _build_booking(entry)
+            if booking:
+                await db[COLLECTIONS['bookings']].insert_one(booking.dict())
+        except Exception:
+            logger.exception(f"Waitlist promotion failed for entry {entry['id']}")
+            await decrement_slot_booking(time_slot_id, entry['seats'])
+            await _requeue(entry)
+            break
+
+        if booking is None:
+            await decrement_slot_booking(time_slot_id, entry['seats'])
+            await entries.update_one({'id': entry['id']},
+                                     {'$set': {'status': WaitlistStatus.skipped.value, 'booking_id': None}})
+            waitlist_total.inc(outcome='skipped')
+            continue
+
+        await _mark_promoted(entry, booking.id)
+        promoted.append(booking)
+
+    return promoted
+
+async def recover_stale_promotions() -> int:
+    """Finish or undo promotions interrupted partway; returns how many were recovered"""
+    db = get_database()
+    entries = db[COLLECTIONS['waitlist_entries']]
+    now = datetime.utcnow()
+    stale = await entries.find(
+        {'status': WaitlistStatus.promoting.value,
+         '$or': [{'promoting_at': {'$lt': now - timedelta(seconds=PROMOTION_CLAIM_SECONDS)}},
+                 {'promoting_at': None}]},
+        {'id': 1, 'promoting_at': 1}
+    ).to_list(None)
+
+    recovered = 0
+    requeued_slots = set()
+    for stale_entry in stale:
+        # Take the claim over, so overlapping recoveries handle each entry once
+        entry = await entries.find_one_and_update(
+            {'id': stale_entry['id'], 'status': WaitlistStatus.promoting.value,
+             'promoting_at': stale_entry.get('promoting_at')},
+            {'$set': {'promoting_at': now}},
+            return_document=ReturnDocument.AFTER
+        )
+        if not entry:
+            continue
+        recovered += 1
+
+        if entry.get('booking_id') and await db[COLLECTIONS['bookings']].find_one(
+                {'id': entry['booking_id']}, {'_id': 1}):
+            await _mark_promoted(entry, entry['booking_id'])
+            continue
+        if entry.get('seats_reserved'):
+            await decrement_slot_booking(entry['time_slot_id'], entry['seats'])
+        await _requeue(entry)
+        requeued_slots.add(entry['time_slot_id'])
+
+    if recovered:
+        waitlist_total.inc(recovered, outcome='recovered')
+    for time_slot_id in requeued_slots:
+        await promote_waitlist(time_slot_id)
+    return recovered
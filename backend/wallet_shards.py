@@ -0,0 +1,176 @@
+"""
+Sharded wallet counters.
+
+A popular vendor's wallet document is updated on every booking confirmation
+and payout, which serializes those writes. With WALLET_COUNTER_SHARDS > 1,
+balance changes are $inc'ed into one of N shard documents in
+`vendor_wallet_shards` chosen at random, and reads add the shards on top of
+the base `vendor_wallets` document. A scheduled job folds shard totals back
+into the base document.
+
+A fold first claims a shard's amounts: one conditional update moves them
+into the shard's `folding` field under a fold token, so a concurrent fold
+can't take the same amounts. It then credits the base wallet unless the
+wallet already lists the token in `applied_folds`, and finally clears the
+claim. A fold interrupted between steps is finished by the next one, and
+reads count `folding` amounts until then.
+
+Payout debits use the same guard: they go to the base document and list the
+payout id in `applied_payouts`, so finishing an interrupted settle can't
+debit a payout twice.
+"""
+from typing import Optional, Dict, List
+from datetime import datetime
+from pymongo import UpdateOne
+import asyncio
+import os
+import random
+import uuid
+
+from database import get_database, COLLECTIONS
+
+# 0 or 1 disables sharding: writes go straight to vendor_wallets
+WALLET_COUNTER_SHARDS = int(os.environ.get('WALLET_COUNTER_SHARDS', '0'))
+WALLET_FOLD_INTERVAL_SECONDS = float(os.environ.get('WALLET_FOLD_INTERVAL_SECONDS', '300'))
+
+# Wallet amounts that are summed across shards
+WALLET_COUNTER_FIELDS = ('balance', 'total_earned', 'total_commission', 'total_paid_out')
+# Fold tokens remembered per wallet, for finishing interrupted folds
+APPLIED_FOLDS_KEPT = 50
+# Payout ids remembered per wallet, for finishing interrupted settles
+APPLIED_PAYOUTS_KEPT = 50
+
+def sharding_enabled() -> bool:
+    return WALLET_COUNTER_SHARDS > 1
+
+async def increment_wallet(vendor_id: str, amounts: dict):
+    """Apply $inc amounts to a vendor wallet, on a random shard when enabled"""
+    db = get_database()
+    now = datetime.utcnow()
+
+    if not sharding_enabled():
+        await db[COLLECTIONS['vendor_wallets']].update_one(
+            {'vendor_id': vendor_id},
+            {'$inc': amounts, '$set': {'updated_at': now}}
+        )
+        return
+
+    shard = random.randrange(WALLET_COUNTER_SHARDS)
+    await db[COLLECTIONS['vendor_wallet_shards']].update_one(
+        {'vendor_id': vendor_id, 'shard': shard},
+        {'$inc': amounts, '$set': {'updated_at': now}},
+        upsert=True
+    )
+
+async def increment_wallets(amounts_by_vendor: Dict[str, dict]):
+    """increment_wallet for many vendors in a single bulk write"""
+    if not amounts_by_vendor:
+        return
+    db = get_database()
+    now = datetime.utcnow()
+
+    if not sharding_enabled():
+        await db[COLLECTIONS['vendor_wallets']].bulk_write([
+            UpdateOne({'vendor_id': vendor_id}, {'$inc': amounts, '$set': {'updated_at': now}})
+            for vendor_id, amounts in amounts_by_vendor.items()
+        ], ordered=False)
+        return
+
+    await db[COLLECTIONS['vendor_wallet_shards']].bulk_write([
+        UpdateOne({'vendor_id': vendor_id, 'shard': random.randrange(WALLET_COUNTER_SHARDS)},
+                  {'$inc': amounts, '$set': {'updated_at': now}}, upsert=True)
+        for vendor_id, amounts in amounts_by_vendor.items()
+    ], ordered=False)
+
+async def debit_payouts(payouts: List[dict]):
+    """Debit completed payouts from their base wallets, each payout at most once"""
+    if not payouts:
+        return
+    db = get_database()
+    now = datetime.utcnow()
+    await db[COLLECTIONS['vendor_wallets']].bulk_write([
+        UpdateOne(
+            {'vendor_id': p['vendor_id'], 'applied_payouts': {'$ne': p['id']}},
+            {'$inc': {'balance': -p['amount'], 'total_paid_out': p['amount']},
+             '$set': {'updated_at': now},
+             '$push': {'applied_payouts': {'$each': [p['id']], '$slice': -APPLIED_PAYOUTS_KEPT}}}
+        )
+        for p in payouts
+    ], ordered=False)
+
+def shard_amount(field: str) -> dict:
+    """Aggregation expression for a shard's amount of field, including any fold in progress"""
+    return {'$add': [{'$ifNull': [f'${field}', 0]}, {'$ifNull': [f'$folding.{field}', 0]}]}
+
+async def get_wallet_with_shards(vendor_id: str) -> Optional[dict]:
+    """Base wallet document with unfolded shard amounts added in"""
+    db = get_database()
+    base_query = db[COLLECTIONS['vendor_wallets']].find_one({'vendor_id': vendor_id})
+    if not sharding_enabled():
+        return await base_query
+
+    shard_query = db[COLLECTIONS['vendor_wallet_shards']].aggregate([
+        {'$match': {'vendor_id': vendor_id}},
+        {'$group': {'_id': None, **{f: {'$sum': shard_amount(f)} for f in WALLET_COUNTER_FIELDS}}},
+    ]).to_list(1)
+    wallet, shard_totals = await asyncio.gather(base_query, shard_query)
+    if not wallet:
+        return None
+    if shard_totals:
+        for field in WALLET_COUNTER_FIELDS:
+            wallet[field] = round(wallet.get(field, 0.0) + shard_totals[0][field], 2)
+    return wallet
+
+async def _apply_fold(shard_id, vendor_id: str, token: str, amounts: dict):
+    """Credit a claimed fold to the base wallet (at most once), then release the shard"""
+    db = get_database()
+    await db[COLLECTIONS['vendor_wallets']].update_one(
+        {'vendor_id': vendor_id, 'applied_folds': {'$ne': token}},
+        {'$inc': amounts, '$set': {'updated_at': datetime.utcnow()},
+         '$push': {'applied_folds': {'$each': [token], '$slice': -APPLIED_FOLDS_KEPT}}}
+    )
+    await db[COLLECTIONS['vendor_wallet_shards']].update_one(
+        {'_id': shard_id, 'fold_token': token},
+        {'$unset': {'fold_token': '', 'folding': ''}}
+    )
+
+async def fold_wallet_shards(vendor_id: Optional[str] = None) -> dict:
+    """Move shard amounts into the base wallet documents"""
+    db = get_database()
+    shards = db[COLLECTIONS['vendor_wallet_shards']]
+    vendor_filter = {'vendor_id': vendor_id} if vendor_id else {}
+    folded = 0
+
+    # Finish folds interrupted after their claim; crediting is idempotent per token
+    async for shard in shards.find({**vendor_filter, 'fold_token': {'$exists': True}}):
+        await _apply_fold(shard['_id'], shard['vendor_id'], shard['fold_token'], shard['folding'])
+        folded += 1
+
+    # Only shards holding a non-zero amount need folding
+    query = {**vendor_filter, 'fold_token': {'$exists': False},
+             '$or': [{f: {'$ne': 0}} for f in WALLET_COUNTER_FIELDS]}
+    has_wallet: Dict[str, bool] = {}
+    async for shard in shards.find(query).batch_size(500):
+        amounts = {f: shard.get(f, 0.0) for f in WALLET_COUNTER_FIELDS if shard.get(f)}
+        if not amounts:
+            continue
+        if shard['vendor_id'] not in has_wallet:
+            has_wallet[shard['vendor_id']] = await db[COLLECTIONS['vendor_wallets']].count_documents(
+                {'vendor_id': shard['vendor_id']}, limit=1
+            ) > 0
+        if not has_wallet[shard['vendor_id']]:
+            # No base wallet to fold into; keep the amounts on the shard
+            continue
+        # Claim exactly the amounts read; increments landing meanwhile stay on the shard
+        token = str(uuid.uuid4())
+        claimed = await shards.update_one(
+            {'_id': shard['_id'], 'fold_token': {'$exists': False}},
+            {'$inc': {f: -v for f, v in amounts.items()},
+             '$set': {'fold_token': token, 'folding': amounts}}
+        )
+        if claimed.modified_count == 0:
+            # Another fold claimed this shard first
+            continue
+        await _apply_fold(shard['_id'], shard['vendor_id'], token, amounts)
+        folded += 1
+    return {'folded_shards': folded}
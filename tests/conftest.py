@@ -0,0 +1,121 @@
+"""
+Shared fixtures: backend modules on sys.path and an in-memory MongoDB.
+
+`db` points the backend's database handles at a fresh mongomock database for
+each test. mongomock fires no command events, so `client` (requests through
+the whole app) counts every mongomock collection call against the request
+being served instead, and the route's DB round-trip budget is enforced as in
+production. DB spans are exercised by feeding the listener directly.
+"""
+from contextvars import ContextVar
+from pathlib import Path
+import functools
+import os
+import sys
+
+os.environ.setdefault('SCHEDULER_ENABLED', 'false')
+os.environ.setdefault('TRACING_ENABLED', 'false')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import httpx
+import mongomock
+import mongomock.aggregate
+import mongomock.collection
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+import database
+from cache import cache
+from request_context import get_request_context
+
+# mongomock has no sessions; code that passes session= still runs against it
+mongomock.ignore_feature('session')
+
+def _union_with_stage(in_collection, database, options):
+    """$unionWith, which mongomock lacks (archive fan-out reads use it)"""
+    if isinstance(options, str):
+        options = {'coll': options}
+    other = database[options['coll']].aggregate(options.get('pipeline', []))
+    return list(in_collection) + list(other)
+
+mongomock.aggregate._PIPELINE_HANDLERS.setdefault('$unionWith', _union_with_stage)
+
+class _Session:
+    """Stand-in for a causally consistent session; mongomock can't start one"""
+    cluster_time = None
+    operation_time = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def advance_cluster_time(self, cluster_time):
+        pass
+
+    def advance_operation_time(self, operation_time):
+        pass
+
+async def _start_session(**options):
+    return _Session()
+
+@pytest.fixture
+def anyio_backend():
+    return 'asyncio'
+
+@pytest.fixture
+async def db():
+    client = AsyncMongoMockClient()
+    client.start_session = _start_session
+    test_db = client['marketplace_test']
+    database.client = client
+    database.db = database.read_db = database.causal_db = test_db
+    await cache.local.clear()
+    yield test_db
+    database.client = None
+    database.db = database.read_db = database.causal_db = None
+
+# Collection methods that are one round-trip to a real server
+ROUND_TRIP_METHODS = (
+    'find', 'find_one', 'find_one_and_update', 'find_one_and_replace', 'find_one_and_delete',
+    'insert_one', 'insert_many', 'update_one', 'update_many', 'replace_one', 'delete_one',
+    'delete_many', 'bulk_write', 'aggregate', 'count_documents', 'estimated_document_count',
+    'distinct',
+)
+FILTER_METHODS = set(ROUND_TRIP_METHODS) - {'insert_one', 'insert_many', 'bulk_write', 'aggregate',
+                                             'estimated_document_count'}
+# mongomock implements some methods with others; only the outermost call counts
+_in_call: ContextVar[bool] = ContextVar('in_mongomock_call', default=False)
+
+def _counted(name, method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        context = get_request_context()
+        if context is None or _in_call.get():
+            return method(self, *args, **kwargs)
+        spec = {}
+        if name in FILTER_METHODS:
+            spec = args[0] if args and isinstance(args[0], dict) else kwargs.get('filter') or {}
+        context.record_db_call((name, self.name, tuple(sorted(spec))))
+        token = _in_call.set(True)
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _in_call.reset(token)
+    return wrapper
+
+@pytest.fixture
+def count_db_calls(monkeypatch):
+    """Count mongomock calls made while serving a request on that request"""
+    for name in ROUND_TRIP_METHODS:
+        method = getattr(mongomock.collection.Collection, name)
+        monkeypatch.setattr(mongomock.collection.Collection, name, _counted(name, method))
+
+@pytest.fixture
+async def client(db, count_db_calls):
+    import server
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+        yield client
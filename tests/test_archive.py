@@ -0,0 +1,34 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from archive import archive_settlements
+
+pytestmark = pytest.mark.anyio
+
+OLD = datetime.utcnow() - timedelta(days=400)
+CUTOFF = datetime.utcnow() - timedelta(days=180)
+
+def _row(vendor_id: str, sequence=None, created_at=OLD) -> dict:
+    return {'vendor_id': vendor_id, 'transaction_type': 'booking_earnings', 'net_amount': 10.0,
+            'sequence': sequence, 'created_at': created_at}
+
+async def test_old_rows_move_once_covered_by_a_checkpoint(db):
+    await db.ledger_sequences.insert_one({'_id': 'v1', 'seq': 3, 'checkpointed_seq': 2})
+    await db.settlement_transactions.insert_many([
+        _row('v1', 1), _row('v1', 2), _row('v1', 3), _row('v1', 4, created_at=datetime.utcnow()),
+    ])
+
+    assert await archive_settlements(CUTOFF) == 2
+
+    remaining = await db.settlement_transactions.find({}, {'sequence': 1}).to_list(None)
+    assert sorted(r['sequence'] for r in remaining) == [3, 4]
+
+async def test_vendors_without_a_ledger_counter_are_archived(db):
+    # Rows from before the ledger had sequences; the vendor has no counter
+    await db.settlement_transactions.insert_many([_row('legacy'), _row('legacy'), _row('legacy', 1)])
+
+    assert await archive_settlements(CUTOFF) == 2
+
+    assert await db.settlement_transactions_archive.count_documents({'vendor_id': 'legacy'}) == 2
+    assert await db.settlement_transactions.count_documents({'vendor_id': 'legacy'}) == 1
@@ -0,0 +1,54 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+CUSTOMER = {'Authorization': 'Bearer auth-c1'}
+OTHER = {'Authorization': 'Bearer auth-c2'}
+ADMIN = {'Authorization': 'Bearer auth-admin'}
+
+@pytest.fixture
+async def client(client, db):
+    await db.users.insert_many([
+        {'id': 'c1', 'supabase_user_id': 'auth-c1', 'role': 'customer'},
+        {'id': 'c2', 'supabase_user_id': 'auth-c2', 'role': 'customer'},
+        {'id': 'a1', 'supabase_user_id': 'auth-admin', 'role': 'admin'},
+    ])
+    await db.time_slots.insert_one({'id': 's1', 'capacity': 4, 'booked_count': 2, 'is_available': True})
+    await db.time_slots.insert_one({'id': 's2', 'capacity': 1, 'booked_count': 1, 'is_available': False})
+    await db.slot_holds.insert_many([
+        {'id': 'h-c1', 'time_slot_id': 's1', 'seats': 1, 'customer_id': 'c1', 'status': 'active'},
+        {'id': 'h-guest', 'time_slot_id': 's1', 'seats': 1, 'customer_id': None, 'status': 'active'},
+    ])
+    await db.waitlist_entries.insert_many([
+        {'id': entry_id, 'time_slot_id': 's2', 'position': position, 'customer_id': customer_id,
+         'vendor_id': 'v1', 'package_id': 'p1', 'customer_name': 'A', 'customer_email': 'a@example.com',
+         'seats': 1, 'status': 'waiting'}
+        for position, (entry_id, customer_id) in enumerate([('w-c1', 'c1'), ('w-guest', None)], 1)
+    ])
+    return client
+
+@pytest.mark.parametrize('headers', [{}, OTHER])
+async def test_customer_hold_cannot_be_released_by_others(client, headers):
+    response = await client.delete('/api/bookings/holds/h-c1', headers=headers)
+    assert response.status_code == 403
+
+@pytest.mark.parametrize('hold_id, headers', [('h-c1', CUSTOMER), ('h-c1', ADMIN), ('h-guest', {})])
+async def test_hold_released_by_its_customer_admin_or_anyone_for_guests(client, db, hold_id, headers):
+    response = await client.delete(f'/api/bookings/holds/{hold_id}', headers=headers)
+    assert response.status_code == 200
+    assert (await db.slot_holds.find_one({'id': hold_id}))['status'] == 'released'
+
+async def test_unknown_hold_is_not_found(client):
+    assert (await client.delete('/api/bookings/holds/missing', headers=CUSTOMER)).status_code == 404
+
+@pytest.mark.parametrize('method', ['GET', 'DELETE'])
+@pytest.mark.parametrize('headers', [{}, OTHER])
+async def test_customer_waitlist_entry_is_private(client, method, headers):
+    response = await client.request(method, '/api/bookings/waitlist/w-c1', headers=headers)
+    assert response.status_code == 403
+
+@pytest.mark.parametrize('entry_id, headers', [('w-c1', CUSTOMER), ('w-c1', ADMIN), ('w-guest', {})])
+async def test_waitlist_entry_open_to_its_customer_admin_or_anyone_for_guests(client, db, entry_id, headers):
+    assert (await client.get(f'/api/bookings/waitlist/{entry_id}', headers=headers)).status_code == 200
+    assert (await client.delete(f'/api/bookings/waitlist/{entry_id}', headers=headers)).status_code == 200
+    assert (await db.waitlist_entries.find_one({'id': entry_id}))['status'] == 'left'
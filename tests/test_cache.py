@@ -0,0 +1,118 @@
+from datetime import datetime
+import asyncio
+
+from fakeredis import FakeServer
+from fakeredis.aioredis import FakeRedis
+import pytest
+
+import cache
+from cache import INVALIDATION_CHANNEL, MemoryCache, RedisCache, TieredCache
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+def server():
+    return FakeServer()
+
+def _redis(server) -> RedisCache:
+    return RedisCache(client=FakeRedis(server=server), prefix='test:')
+
+@pytest.fixture
+async def workers(server, monkeypatch):
+    """Two workers' caches sharing one Redis; the first is the module's `cache`"""
+    first, second = TieredCache(shared=_redis(server)), TieredCache(shared=_redis(server))
+    monkeypatch.setattr(cache, 'cache', first)
+    for worker in (first, second):
+        worker.start()
+    probe = FakeRedis(server=server)
+    while (await probe.pubsub_numsub(INVALIDATION_CHANNEL))[0][1] < 2:
+        await asyncio.sleep(0.01)
+    # Let both subscribers finish the local clear they do on (re)subscribing
+    await asyncio.sleep(0.01)
+    yield first, second
+    await asyncio.gather(first.stop(), second.stop())
+    await probe.aclose()
+
+async def _dropped(worker: TieredCache, key: str) -> bool:
+    """Wait (briefly) for a published invalidation to reach worker's local tier"""
+    for _ in range(100):
+        if await worker.local.get(key) is None:
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+async def test_memory_cache_evicts_least_recently_used():
+    local = MemoryCache(max_entries=2)
+    await local.set('a', 1, 60)
+    await local.set('b', 2, 60)
+    await local.get('a')
+    await local.set('c', 3, 60)
+
+    assert [await local.get(k) for k in ('a', 'b', 'c')] == [1, None, 3]
+
+async def test_memory_cache_expires_entries():
+    local = MemoryCache()
+    await local.set('a', 1, 0)
+
+    assert await local.get('a') is None
+
+async def test_redis_cache_round_trips_through_json_util(server):
+    shared = _redis(server)
+    value = {'id': 'p1', 'price': 99.5, 'created_at': datetime(2030, 1, 1, 9, 30)}
+
+    await shared.set('package:p1', value, 60)
+    assert await shared.get('package:p1') == value
+
+    await shared.delete('package:p1')
+    assert await shared.get('package:p1') is None
+    await shared.close()
+
+async def test_redis_cache_deletes_by_prefix_only_under_its_own_prefix(server):
+    shared, other = _redis(server), RedisCache(client=FakeRedis(server=server), prefix='other:')
+    for key in ('packages:1', 'packages:2', 'package:p1'):
+        await shared.set(key, key, 60)
+    await other.set('packages:1', 'kept', 60)
+
+    await shared.delete_prefix('packages:')
+
+    assert [await shared.get(k) for k in ('packages:1', 'packages:2', 'package:p1')] == [None, None, 'package:p1']
+    assert await other.get('packages:1') == 'kept'
+    await asyncio.gather(shared.close(), other.close())
+
+async def test_local_miss_fills_from_the_shared_tier(workers):
+    first, second = workers
+    await first.set('package:p1', {'id': 'p1'}, 60)
+
+    async def loader():
+        raise AssertionError("should be served from Redis")
+
+    assert await second.local.get('package:p1') is None
+    assert await second.get_or_load('package:p1', 60, loader) == {'id': 'p1'}
+    assert (await second.local.get('package:p1'))['value'] == {'id': 'p1'}
+
+async def test_invalidate_package_evicts_other_workers(workers):
+    first, second = workers
+    for worker in workers:
+        await worker.set('package:p1', {'id': 'p1'}, 60)
+        await worker.set('packages:page:1', ['p1'], 60)
+    await second.set('package:p2', {'id': 'p2'}, 60)
+    assert await second.local.get('package:p1') is not None
+
+    await cache.invalidate_package('p1')
+
+    assert await _dropped(second, 'package:p1')
+    assert await _dropped(second, 'packages:page:1')
+    assert await second.get('package:p2') == {'id': 'p2'}
+    assert await first.get('package:p1') is None
+
+async def test_invalidate_vendor_visibility_evicts_other_workers(workers):
+    first, second = workers
+    for key in ('vendor:v1', 'vendors:page:1', 'package:p1', 'reviews:v1:page:1', 'reviews:v2:page:1'):
+        await second.set(key, key, 60)
+    assert await second.local.get('vendor:v1') is not None
+
+    await cache.invalidate_vendor('v1', visibility=True)
+
+    for key in ('vendor:v1', 'vendors:page:1', 'package:p1', 'reviews:v1:page:1'):
+        assert await _dropped(second, key), key
+    assert await second.get('reviews:v2:page:1') == 'reviews:v2:page:1'
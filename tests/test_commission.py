@@ -0,0 +1,49 @@
+import pytest
+
+from utils import (calculate_commission, calculate_commission_batch, get_commission_rate,
+                   get_default_commission_rate, invalidate_commission_cache)
+
+# Half-cent and large values where np.round's scale-by-100 can disagree with round()
+AMOUNTS = [0.005, 0.015, 1.005, 2.675, 10.075, 99.995, 1234.565, 1e7 + 0.015, 0.0, 0.01]
+RATES = [0.0, 10.0, 12.5, 15.0, 17.25, 33.333]
+
+@pytest.mark.parametrize('rate', RATES)
+def test_batch_matches_calculate_commission_element_wise(rate):
+    batch = calculate_commission_batch(AMOUNTS, rate)
+
+    for i, amount in enumerate(AMOUNTS):
+        single = calculate_commission(amount, rate)
+        assert float(batch['commission_amount'][i]) == single['commission_amount'], amount
+        assert float(batch['vendor_amount'][i]) == single['vendor_amount'], amount
+
+def test_batch_accepts_a_rate_per_amount():
+    rates = RATES[:3] * 3 + [15.0]
+
+    batch = calculate_commission_batch(AMOUNTS, rates)
+
+    for i, (amount, rate) in enumerate(zip(AMOUNTS, rates)):
+        assert float(batch['commission_amount'][i]) == calculate_commission(amount, rate)['commission_amount']
+
+@pytest.mark.anyio
+async def test_invalidation_picks_up_a_changed_vendor_rate(db):
+    await db.vendors.insert_one({'id': 'v1', 'commission_rate': 10.0})
+    assert await get_commission_rate('v1') == 10.0
+
+    await db.vendors.update_one({'id': 'v1'}, {'$set': {'commission_rate': 12.0}})
+    assert await get_commission_rate('v1') == 10.0
+
+    await invalidate_commission_cache('v1')
+    assert await get_commission_rate('v1') == 12.0
+
+@pytest.mark.anyio
+async def test_invalidation_picks_up_a_changed_default_rate(db):
+    await db.commission_settings.insert_one({'default_rate': 15.0})
+    await db.vendors.insert_one({'id': 'v1'})
+    assert await get_default_commission_rate() == 15.0
+    assert await get_commission_rate('v1') == 15.0
+
+    await db.commission_settings.update_one({}, {'$set': {'default_rate': 18.0}})
+    await invalidate_commission_cache()
+
+    assert await get_default_commission_rate() == 18.0
+    assert await get_commission_rate('v1') == 18.0
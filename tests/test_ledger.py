@@ -0,0 +1,73 @@
+import pytest
+
+import ledger
+from ledger import (
+    build_ledger_entry, checkpoint_vendor_ledger, get_wallet_statement, ledger_balance,
+    record_ledger_entries, record_ledger_entry
+)
+
+pytestmark = pytest.mark.anyio
+
+VENDOR = 'v1'
+# Credits of 1..10, then a payout of -20: balances 1, 3, 6, ..., 55, 35
+AMOUNTS = [float(n) for n in range(1, 11)] + [-20.0]
+
+@pytest.fixture
+async def entries(db, monkeypatch):
+    monkeypatch.setattr(ledger, 'LEDGER_CHECKPOINT_INTERVAL', 3)
+    monkeypatch.setattr(ledger, 'LEDGER_SETTLE_SECONDS', 0)
+    for amount in AMOUNTS[:5]:
+        await record_ledger_entry(VENDOR, 'booking_earnings', amount)
+    await record_ledger_entries([build_ledger_entry(VENDOR, 'booking_earnings', amount)
+                                 for amount in AMOUNTS[5:10]])
+    await record_ledger_entry(VENDOR, 'payout', AMOUNTS[10])
+    return db
+
+def _running(upto: int) -> float:
+    return sum(AMOUNTS[:upto])
+
+async def test_sequences_are_contiguous(entries):
+    rows = await entries.settlement_transactions.find({}, {'sequence': 1}).sort('sequence', 1).to_list(None)
+    assert [r['sequence'] for r in rows] == list(range(1, len(AMOUNTS) + 1))
+
+async def test_balance_is_the_same_with_and_without_checkpoints(entries):
+    assert await ledger_balance(VENDOR) == 35.0
+
+    assert await checkpoint_vendor_ledger(VENDOR) == 3
+    assert await entries.wallet_checkpoints.count_documents({}) == 3
+    assert await ledger_balance(VENDOR) == 35.0
+    for sequence in (1, 3, 4, 9, 10):
+        assert await ledger_balance(VENDOR, max_sequence=sequence) == _running(sequence)
+
+async def test_checkpointing_is_idempotent(entries):
+    await checkpoint_vendor_ledger(VENDOR)
+    assert await checkpoint_vendor_ledger(VENDOR) == 0
+    assert await entries.wallet_checkpoints.count_documents({}) == 3
+
+async def test_statement_pages_cover_every_entry_with_running_balances(entries):
+    await checkpoint_vendor_ledger(VENDOR)
+    seen = []
+    cursor = None
+    while True:
+        page = await get_wallet_statement(VENDOR, cursor=cursor, limit=4)
+        assert page.balance == 35.0
+        seen += page.entries
+        if page.next_cursor is None:
+            break
+        cursor = page.next_cursor
+
+    assert [e.sequence for e in seen] == list(range(len(AMOUNTS), 0, -1))
+    for entry in seen:
+        assert entry.balance_after == _running(entry.sequence)
+
+async def test_archived_entries_still_count(entries):
+    await checkpoint_vendor_ledger(VENDOR)
+    old = await entries.settlement_transactions.find({'sequence': {'$lte': 3}}).to_list(None)
+    await entries.settlement_transactions_archive.insert_many(old)
+    await entries.settlement_transactions.delete_many({'sequence': {'$lte': 3}})
+
+    assert await ledger_balance(VENDOR) == 35.0
+    assert await ledger_balance(VENDOR, max_sequence=2) == _running(2)
+    page = await get_wallet_statement(VENDOR, limit=len(AMOUNTS))
+    assert [e.sequence for e in page.entries][-3:] == [3, 2, 1]
+    assert page.entries[-1].balance_after == 1.0
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import utils
+from ledger import ledger_balance
+from models import PayoutBatchItem
+from utils import create_payout_run, finish_payout_debits, settle_payouts
+from wallet_shards import debit_payouts
+
+pytestmark = pytest.mark.anyio
+
+VENDORS = ['v1', 'v2', 'v3']
+
+@pytest.fixture
+async def wallets(db, monkeypatch):
+    for vendor_id in VENDORS:
+        await db.vendors.insert_one({'id': vendor_id, 'user_id': f"u-{vendor_id}", 'status': 'approved'})
+        await db.vendor_wallets.insert_one({'vendor_id': vendor_id, 'balance': 1000.0, 'total_paid_out': 0.0})
+
+    async def find_payable_vendors(min_balance):
+        # mongomock can't run the real $lookup with let; same arithmetic, with a yield
+        # between the reads so concurrent runs interleave
+        wallets = await db.vendor_wallets.find().to_list(None)
+        await asyncio.sleep(0)
+        payable = []
+        for wallet in wallets:
+            open_payouts = await db.payouts.find({'vendor_id': wallet['vendor_id'],
+                                                  'status': {'$in': ['pending', 'processing']}}).to_list(None)
+            available = wallet['balance'] - sum(p['amount'] for p in open_payouts)
+            if available >= min_balance:
+                payable.append({'vendor_id': wallet['vendor_id'], 'available': available})
+        return payable
+
+    monkeypatch.setattr(utils, 'find_payable_vendors', find_payable_vendors)
+    return db
+
+async def _wallet(db, vendor_id: str) -> dict:
+    return await db.vendor_wallets.find_one({'vendor_id': vendor_id})
+
+async def test_concurrent_runs_create_one_payout_per_vendor(wallets):
+    results = await asyncio.gather(create_payout_run(500.0), create_payout_run(500.0),
+                                   return_exceptions=True)
+
+    assert sum(isinstance(r, HTTPException) and r.status_code == 409 for r in results) == 1
+    for vendor_id in VENDORS:
+        assert await wallets.payouts.count_documents({'vendor_id': vendor_id}) == 1
+
+async def test_next_run_proceeds_after_the_first_finishes(wallets):
+    await wallets.vendor_wallets.update_one({'vendor_id': 'v1'}, {'$inc': {'balance': 600.0}})
+    await create_payout_run(500.0)
+    await wallets.vendor_wallets.update_one({'vendor_id': 'v1'}, {'$inc': {'balance': 600.0}})
+
+    run = await create_payout_run(500.0)
+
+    assert [p.vendor_id for p in run.payouts] == ['v1']
+
+async def test_interrupted_settle_is_finished_once(wallets, monkeypatch):
+    run = await create_payout_run(500.0)
+    payout_id = next(p.id for p in run.payouts if p.vendor_id == 'v1')
+
+    async def crash(payout_ids=None):
+        raise RuntimeError("worker died")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(utils, 'finish_payout_debits', crash)
+        with pytest.raises(RuntimeError):
+            await settle_payouts([PayoutBatchItem(payout_id=payout_id, status='completed')], 'admin')
+
+    payout = await wallets.payouts.find_one({'id': payout_id})
+    assert payout['status'] == 'completed' and payout['wallet_debit_pending']
+    assert (await _wallet(wallets, 'v1'))['balance'] == 1000.0
+
+    # Fresh settles are left to their own settle; stale ones are finished
+    assert await finish_payout_debits() == 0
+    # Negative: settled_at is stored at millisecond precision and can equal 'now'
+    monkeypatch.setattr(utils, 'PAYOUT_CLAIM_SECONDS', -1)
+    assert await finish_payout_debits() == 1
+    assert await finish_payout_debits() == 0
+
+    wallet = await _wallet(wallets, 'v1')
+    assert wallet['balance'] == 0.0 and wallet['total_paid_out'] == 1000.0
+    assert await ledger_balance('v1') == -1000.0
+    assert not (await wallets.payouts.find_one({'id': payout_id}))['wallet_debit_pending']
+
+async def test_finishing_after_a_partial_debit_applies_each_half_once(wallets):
+    run = await create_payout_run(500.0)
+    payout = next(p for p in run.payouts if p.vendor_id == 'v2')
+    await wallets.payouts.update_one({'id': payout.id}, {'$set': {'status': 'completed',
+                                                                  'wallet_debit_pending': True}})
+    # The wallet debit landed before the settle stopped; the ledger entry didn't
+    await debit_payouts([{'id': payout.id, 'vendor_id': 'v2', 'amount': payout.amount}])
+
+    assert await finish_payout_debits([payout.id]) == 1
+
+    assert (await _wallet(wallets, 'v2'))['balance'] == 0.0
+    assert await wallets.settlement_transactions.count_documents({'payout_id': payout.id}) == 1
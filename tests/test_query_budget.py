@@ -0,0 +1,122 @@
+import logging
+
+import pytest
+
+import query_budget
+from query_budget import QueryBudgetExceeded, check_query_budget, get_route_budget
+from request_context import RequestContext
+
+ROUTE = '/api/test/budget'
+
+def _context(calls: int, shape=('find', 'bookings', ('id',))) -> RequestContext:
+    context = RequestContext({'method': 'GET', 'path': ROUTE})
+    for _ in range(calls):
+        context.record_db_call(shape)
+    return context
+
+@pytest.fixture(autouse=True)
+def budget(monkeypatch):
+    monkeypatch.setitem(query_budget.ROUTE_QUERY_BUDGETS, ROUTE, 3)
+    query_budget.reset_query_report()
+
+def test_within_budget_passes():
+    check_query_budget(_context(3))
+    assert query_budget.query_report()[ROUTE]['max_queries'] == 3
+
+def test_overrun_raises_under_pytest():
+    assert query_budget.is_strict()
+    with pytest.raises(QueryBudgetExceeded, match="made 4 DB round-trips"):
+        check_query_budget(_context(4))
+
+def test_overrun_only_logs_outside_strict_mode(monkeypatch, caplog):
+    monkeypatch.delenv('PYTEST_CURRENT_TEST')
+    monkeypatch.delenv('DB_QUERY_BUDGET_STRICT', raising=False)
+    with caplog.at_level(logging.WARNING, logger='query_budget'):
+        check_query_budget(_context(4))
+    assert 'budget 3' in caplog.text
+
+def test_repeated_shape_is_reported_as_n_plus_one(monkeypatch, caplog):
+    monkeypatch.setitem(query_budget.ROUTE_QUERY_BUDGETS, ROUTE, 100)
+    with caplog.at_level(logging.WARNING, logger='query_budget'):
+        check_query_budget(_context(query_budget.N_PLUS_ONE_THRESHOLD - 1))
+        assert 'Possible N+1' not in caplog.text
+        check_query_budget(_context(query_budget.N_PLUS_ONE_THRESHOLD))
+    assert 'Possible N+1' in caplog.text
+
+def test_unlisted_route_uses_default_budget():
+    assert get_route_budget('/api/not/listed') == query_budget.DEFAULT_QUERY_BUDGET
+
+def test_middleware_raises_for_route_over_budget(monkeypatch):
+    from fastapi.testclient import TestClient
+    import server
+
+    monkeypatch.setitem(query_budget.ROUTE_QUERY_BUDGETS, '/api/health', -1)
+    with pytest.raises(QueryBudgetExceeded):
+        TestClient(server.app).get('/api/health')
+
+# ============================================================
+# ROUTE BUDGETS
+# ============================================================
+
+CUSTOMER = {'Authorization': 'Bearer auth-customer'}
+VENDOR_USER = {'Authorization': 'Bearer auth-vendor'}
+ADMIN = {'Authorization': 'Bearer auth-admin'}
+
+@pytest.fixture
+async def marketplace(client, db):
+    from models import Booking, Package, TimeSlot, User, Vendor, VendorWallet
+
+    users = [User(id='customer', email='c@example.com', name='C', supabase_user_id='auth-customer'),
+             User(id='vendor-user', email='v@example.com', name='V', role='vendor',
+                  supabase_user_id='auth-vendor'),
+             User(id='admin', email='a@example.com', name='A', role='admin', supabase_user_id='auth-admin')]
+    await db.users.insert_many([u.dict() for u in users])
+    await db.vendors.insert_one(Vendor(id='v1', user_id='vendor-user', company_name='Sky', contact_email='v@example.com',
+                                       contact_phone='1', status='approved', is_approved=True).dict())
+    await db.vendor_wallets.insert_one(VendorWallet(vendor_id='v1').dict())
+    await db.packages.insert_one(Package(id='p1', vendor_id='v1', name='Tandem', price=100.0,
+                                         duration_minutes=30).dict())
+    await db.time_slots.insert_one(TimeSlot(id='s1', vendor_id='v1', package_id='p1', slot_date='2030-01-01',
+                                            start_time='09:00', end_time='10:00', capacity=10).dict())
+    for booking_id, status in (('b-pending', 'pending'), ('b-confirmed', 'confirmed')):
+        await db.bookings.insert_one(Booking(
+            id=booking_id, customer_id='customer', vendor_id='v1', package_id='p1', time_slot_id='s1',
+            customer_name='C', customer_email='c@example.com', total_amount=100.0,
+            commission_amount=15.0, vendor_amount=85.0, status=status
+        ).dict())
+    await db.time_slots.update_one({'id': 's1'}, {'$set': {'booked_count': 2}})
+    return client
+
+NEW_BOOKING = {'vendor_id': 'v1', 'package_id': 'p1', 'time_slot_id': 's1', 'seats': 2,
+               'customer_name': 'C', 'customer_email': 'c@example.com'}
+
+ROUTE_CALLS = [
+    ('POST', '/api/bookings', NEW_BOOKING, CUSTOMER),
+    ('POST', '/api/bookings/batch', {'bookings': [NEW_BOOKING, NEW_BOOKING]}, CUSTOMER),
+    ('POST', '/api/bookings/holds', {'time_slot_id': 's1', 'seats': 2}, CUSTOMER),
+    ('PUT', '/api/bookings/b-pending/status', {'status': 'confirmed'}, VENDOR_USER),
+    ('PUT', '/api/bookings/b-pending/status', {'status': 'cancelled'}, CUSTOMER),
+    ('GET', '/api/bookings/b-confirmed', None, CUSTOMER),
+    ('GET', '/api/bookings/my-bookings', None, CUSTOMER),
+    ('GET', '/api/packages', None, {}),
+    ('GET', '/api/packages/p1', None, {}),
+    ('GET', '/api/time-slots/availability/p1', None, {}),
+    ('GET', '/api/vendors', None, {}),
+    ('GET', '/api/vendors/v1', None, {}),
+    ('GET', '/api/vendors/dashboard', None, VENDOR_USER),
+    ('GET', '/api/reviews/vendor/v1', None, {}),
+    ('GET', '/api/admin/dashboard', None, ADMIN),
+    ('GET', '/api/admin/payouts', None, ADMIN),
+]
+
+@pytest.mark.anyio
+@pytest.mark.parametrize('method, path, body, headers', ROUTE_CALLS,
+                         ids=[f"{m} {p} {b or ''}" for m, p, b, _ in ROUTE_CALLS])
+async def test_route_stays_within_its_budget(marketplace, method, path, body, headers):
+    response = await marketplace.request(method, path, json=body, headers=headers)
+
+    assert response.status_code == 200, response.text
+    # The middleware raises in strict mode when a route goes over; each of these has its own budget
+    [(route, stats)] = query_budget.query_report().items()
+    assert route in query_budget.ROUTE_QUERY_BUDGETS
+    assert stats['max_queries'] == int(response.headers['X-DB-Query-Count']) <= stats['budget']
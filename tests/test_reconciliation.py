@@ -0,0 +1,54 @@
+import pytest
+
+from ledger import ledger_balance, record_ledger_entry
+from reconciliation import reconcile_wallets
+
+pytestmark = pytest.mark.anyio
+
+VENDOR = 'v1'
+
+@pytest.fixture
+async def history(db):
+    # Earned 100, paid out 30: the wallet should hold 70
+    await record_ledger_entry(VENDOR, 'booking_earnings', 100.0, gross_amount=100.0)
+    await db.payouts.insert_one({'id': 'p1', 'vendor_id': VENDOR, 'amount': 30.0, 'status': 'completed'})
+    return db
+
+async def _wallet(db, balance: float):
+    await db.vendor_wallets.insert_one({'vendor_id': VENDOR, 'balance': balance})
+
+async def _adjustments(db) -> list:
+    return await db.settlement_transactions.find({'transaction_type': 'adjustment'}).to_list(None)
+
+async def test_wallet_only_drift_is_fixed_without_a_ledger_adjustment(history):
+    await record_ledger_entry(VENDOR, 'payout', -30.0, payout_id='p1')
+    await _wallet(history, 75.0)
+
+    run = await reconcile_wallets(fix=True)
+
+    assert run['drifts'][0]['drift'] == 5.0
+    assert run['drifts'][0]['ledger_adjustment'] == 0.0
+    assert (await history.vendor_wallets.find_one({'vendor_id': VENDOR}))['balance'] == 70.0
+    assert await _adjustments(history) == []
+
+async def test_fix_records_an_adjustment_with_the_run_id(history):
+    # The payout's debit reached neither the wallet nor the ledger
+    await _wallet(history, 100.0)
+
+    run = await reconcile_wallets(fix=True)
+
+    assert run['drifts'][0]['ledger_adjustment'] == -30.0
+    [adjustment] = await _adjustments(history)
+    assert adjustment['net_amount'] == -30.0
+    assert adjustment['reconciliation_run_id'] == run['id']
+    assert (await history.vendor_wallets.find_one({'vendor_id': VENDOR}))['balance'] == 70.0
+    assert await ledger_balance(VENDOR) == 70.0
+
+async def test_corrected_vendor_reconciles_on_the_next_run(history):
+    await _wallet(history, 100.0)
+    await reconcile_wallets(fix=True)
+
+    run = await reconcile_wallets(fix=True)
+
+    assert run['drifted_vendors'] == 0
+    assert len(await _adjustments(history)) == 1
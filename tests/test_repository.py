@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from repository import get_loader, get_vendor
+from request_context import begin_request, end_request
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+async def vendors(db, count_db_calls):
+    await db.vendors.insert_many([{'id': 'a', 'company_name': 'A'}, {'id': 'b', 'company_name': 'B'}])
+    return db
+
+async def _in_request(coroutine_function):
+    """Run coroutine_function() as its own request; returns (result, context)"""
+    context, token = begin_request({'method': 'GET', 'path': '/api/test'})
+    try:
+        return await coroutine_function(), context
+    finally:
+        end_request(token)
+
+def _finds(context) -> int:
+    return sum(count for (command, _, _), count in context.query_shapes.items() if command == 'find')
+
+async def test_concurrent_loads_share_one_find(vendors):
+    async def load():
+        return await asyncio.gather(get_vendor('a'), get_vendor('b'), get_vendor('a'), get_vendor('missing'))
+
+    (a, b, a_again, missing), context = await _in_request(load)
+
+    assert _finds(context) == 1
+    assert (a['company_name'], b['company_name']) == ('A', 'B')
+    assert a_again is a
+    assert missing is None
+
+async def test_loads_are_memoized_for_the_rest_of_the_request(vendors):
+    async def load():
+        first = await get_vendor('a')
+        return first, await get_vendor('a'), await get_vendor('missing'), await get_vendor('missing')
+
+    (first, second, missing, missing_again), context = await _in_request(load)
+
+    assert second is first
+    assert missing is None and missing_again is None
+    assert _finds(context) == 2
+
+async def test_nothing_is_memoized_into_the_next_request(vendors):
+    _, first = await _in_request(lambda: get_vendor('a'))
+    await vendors.vendors.update_one({'id': 'a'}, {'$set': {'company_name': 'A2'}})
+
+    vendor, second = await _in_request(lambda: get_vendor('a'))
+
+    assert vendor['company_name'] == 'A2'
+    assert _finds(second) == 1
+    assert second.loaders[('vendors', 'id')] is not first.loaders[('vendors', 'id')]
+
+async def test_outside_a_request_each_call_gets_a_fresh_loader(vendors):
+    assert get_loader('vendors') is not get_loader('vendors')
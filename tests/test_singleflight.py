@@ -0,0 +1,26 @@
+import asyncio
+
+import pytest
+
+from request_context import begin_request, end_request, get_request_context
+from singleflight import SingleFlight
+
+pytestmark = pytest.mark.anyio
+
+async def test_concurrent_calls_share_one_run_outside_any_request():
+    flights = SingleFlight()
+    runs = []
+
+    async def load():
+        runs.append(get_request_context())
+        await asyncio.sleep(0.01)
+        return 'value'
+
+    _, token = begin_request({'method': 'GET', 'path': '/api/test'})
+    try:
+        results = await asyncio.gather(*(flights.do('key', load) for _ in range(5)))
+    finally:
+        end_request(token)
+
+    assert results == ['value'] * 5
+    assert runs == [None]
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from utils import increment_slot_booking
+
+pytestmark = pytest.mark.anyio
+
+@pytest.fixture
+async def client(client, db):
+    await db.vendors.insert_one({'id': 'v1', 'is_approved': True})
+    await db.packages.insert_one({'id': 'p1', 'vendor_id': 'v1', 'price': 100.0, 'is_active': True})
+    await db.time_slots.insert_many([
+        {'id': 's1', 'capacity': 4, 'booked_count': 2, 'is_available': True},
+        {'id': 's2', 'capacity': 4, 'booked_count': 0, 'is_available': True},
+        {'id': 's3', 'capacity': 1, 'booked_count': 1, 'is_available': False},
+    ])
+    return client
+
+def _booking(time_slot_id: str, seats: int) -> dict:
+    return {'vendor_id': 'v1', 'package_id': 'p1', 'time_slot_id': time_slot_id, 'seats': seats,
+            'customer_name': 'C', 'customer_email': 'c@example.com'}
+
+async def _booked(db, time_slot_id: str) -> int:
+    return (await db.time_slots.find_one({'id': time_slot_id}))['booked_count']
+
+async def test_booking_more_seats_than_remain_fails(client, db):
+    response = await client.post('/api/bookings', json=_booking('s1', 3))
+
+    assert response.status_code == 400
+    assert await _booked(db, 's1') == 2
+    assert await db.bookings.count_documents({}) == 0
+
+async def test_booking_the_last_seats_closes_the_slot(client, db):
+    assert (await client.post('/api/bookings', json=_booking('s1', 2))).status_code == 200
+
+    slot = await db.time_slots.find_one({'id': 's1'})
+    assert (slot['booked_count'], slot['is_available']) == (4, False)
+
+async def test_concurrent_reservations_never_oversell(client, db):
+    results = await asyncio.gather(*(increment_slot_booking('s2') for _ in range(10)))
+
+    assert results.count(True) == 4
+    assert await _booked(db, 's2') == 4
+
+async def test_batch_with_an_unavailable_slot_releases_the_other_seats(client, db):
+    batch = {'bookings': [_booking('s2', 1), _booking('s2', 2), _booking('s3', 1)]}
+
+    response = await client.post('/api/bookings/batch', json=batch)
+
+    assert response.status_code == 400
+    assert 's3' in response.json()['detail']
+    assert [await _booked(db, s) for s in ('s2', 's3')] == [0, 1]
+    assert await db.bookings.count_documents({}) == 0
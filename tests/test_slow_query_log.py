@@ -0,0 +1,25 @@
+import slow_query_log
+from db_monitoring import CommandRecord
+
+def _record(collection: str) -> CommandRecord:
+    return CommandRecord('find', collection, {'find': collection, 'filter': {'id': 'x'}},
+                         'db', 0.0, 0.5, 'success', None)
+
+def test_explain_is_throttled_per_shape(monkeypatch):
+    monkeypatch.setattr(slow_query_log, 'SLOW_QUERY_EXPLAIN_SAMPLE_RATE', 1.0)
+    monkeypatch.setattr(slow_query_log, '_last_explained', slow_query_log.OrderedDict())
+    record = _record('bookings')
+    shape = slow_query_log.command_query_shape(record)
+    assert slow_query_log._should_explain(record, shape)
+    assert not slow_query_log._should_explain(record, shape)
+
+def test_explained_shapes_are_bounded(monkeypatch):
+    monkeypatch.setattr(slow_query_log, 'SLOW_QUERY_EXPLAIN_SAMPLE_RATE', 1.0)
+    monkeypatch.setattr(slow_query_log, 'SLOW_QUERY_EXPLAIN_MAX_SHAPES', 10)
+    monkeypatch.setattr(slow_query_log, '_last_explained', slow_query_log.OrderedDict())
+    for i in range(25):
+        record = _record(f'collection_{i}')
+        assert slow_query_log._should_explain(record, slow_query_log.command_query_shape(record))
+    assert len(slow_query_log._last_explained) == 10
+    assert ('collection_24', 'find', slow_query_log.command_query_shape(_record('collection_24'))) \
+        in slow_query_log._last_explained
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+import tracing
+from tracing import span, trace_requests
+
+SAMPLED = {'traceparent': '00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01'}
+
+@pytest.fixture
+def exported(monkeypatch):
+    traces = []
+    monkeypatch.setattr(tracing, 'TRACING_ENABLED', True)
+    monkeypatch.setattr(tracing, 'export_trace', traces.append)
+    return traces
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.middleware('http')(trace_requests)
+
+    @app.get('/stream')
+    async def stream():
+        async def rows():
+            for n in range(3):
+                with span(f"chunk {n}"):
+                    await asyncio.sleep(0.01)
+                yield f"{n}\n"
+        return StreamingResponse(rows(), media_type='text/plain')
+
+    @app.get('/plain')
+    async def plain():
+        return {'ok': True}
+
+    return TestClient(app)
+
+def _root(trace):
+    return next(s for s in trace.spans if s.kind == tracing.SPAN_KIND_SERVER)
+
+def test_streamed_body_is_inside_the_root_span(client, exported):
+    response = client.get('/stream', headers=SAMPLED)
+
+    assert response.text == '0\n1\n2\n'
+    [trace] = exported
+    root = _root(trace)
+    chunks = [s for s in trace.spans if s.name.startswith('chunk')]
+    assert len(chunks) == 3
+    assert all(c.parent_id == root.span_id and c.end_ns <= root.end_ns for c in chunks)
+    assert root.attributes['http.route'] == '/stream'
+
+def test_plain_response_is_exported_once(client, exported):
+    response = client.get('/plain', headers=SAMPLED)
+
+    assert response.headers['X-Trace-Id'] == '4bf92f3577b34da6a3ce929d0e0e4736'
+    [trace] = exported
+    assert _root(trace).attributes['http.status_code'] == 200
@@ -0,0 +1,54 @@
+from fastapi import HTTPException
+import pytest
+
+from request_context import begin_request, end_request
+from utils import process_payout, update_or_raise
+
+pytestmark = pytest.mark.anyio
+
+OWNER = {'vendor_id': 'v1'}
+
+@pytest.fixture
+async def packages(db, count_db_calls):
+    await db.packages.insert_one({'id': 'p1', 'vendor_id': 'v1', 'price': 100.0, 'is_active': True})
+    return db
+
+async def _update(package_id: str = 'p1', **kwargs):
+    """update_or_raise on p1 inside a request; returns (result or error, DB calls made)"""
+    context, token = begin_request({'method': 'PUT', 'path': '/api/test'})
+    try:
+        result = await update_or_raise('packages', {'id': package_id},
+                                       {'$set': {'price': 120.0}}, **kwargs)
+    except HTTPException as error:
+        result = error
+    finally:
+        end_request(token)
+    return result, context.db_calls
+
+async def test_success_returns_the_post_image_in_one_round_trip(packages):
+    document, calls = await _update(owner=OWNER, expect={'is_active': True})
+
+    assert document['price'] == 120.0
+    assert calls == 1
+
+@pytest.mark.parametrize('kwargs, status', [
+    ({'package_id': 'missing', 'owner': OWNER}, 404),
+    ({'owner': {'vendor_id': 'v2'}}, 403),
+    ({'owner': OWNER, 'expect': {'is_active': False}}, 409),
+])
+async def test_failure_status_costs_one_extra_find(packages, kwargs, status):
+    error, calls = await _update(**kwargs)
+
+    assert isinstance(error, HTTPException)
+    assert error.status_code == status
+    assert calls == 2
+    assert (await packages.packages.find_one({'id': 'p1'}))['price'] == 100.0
+
+async def test_settling_a_completed_payout_conflicts(db):
+    await db.payouts.insert_one({'id': 'po1', 'vendor_id': 'v1', 'amount': 50.0, 'status': 'completed'})
+
+    with pytest.raises(HTTPException) as error:
+        await process_payout('po1', settled_by='admin')
+
+    assert error.value.status_code == 409
+    assert (await db.payouts.find_one({'id': 'po1'}))['status'] == 'completed'
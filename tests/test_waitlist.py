@@ -0,0 +1,69 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from models import WaitlistJoin
+from waitlist import join_waitlist, recover_stale_promotions
+
+pytestmark = pytest.mark.anyio
+
+STALE = datetime.utcnow() - timedelta(hours=1)
+
+def _entry(entry_id: str, position: int, **fields) -> dict:
+    return {'id': entry_id, 'time_slot_id': 's1', 'position': position, 'customer_id': None,
+            'vendor_id': 'v1', 'package_id': 'p1', 'customer_name': 'A', 'customer_email': 'a@example.com',
+            'seats': 2, 'status': 'promoting', 'booking_id': f"b-{entry_id}", **fields}
+
+@pytest.fixture
+async def slot(db):
+    # Full slot: nothing is promoted again once entries go back to waiting
+    await db.time_slots.insert_one({'id': 's1', 'capacity': 4, 'booked_count': 4, 'is_available': False})
+    return db
+
+async def _status(db, entry_id: str) -> dict:
+    return await db.waitlist_entries.find_one({'id': entry_id})
+
+async def test_join_unknown_slot_is_not_found(db):
+    data = WaitlistJoin(vendor_id='v1', package_id='p1', time_slot_id='missing',
+                        customer_name='A', customer_email='a@example.com')
+    with pytest.raises(HTTPException) as e:
+        await join_waitlist(data)
+    assert e.value.status_code == 404
+
+async def test_interrupted_promotion_is_redone_from_the_queue(slot):
+    await slot.packages.insert_one({'id': 'p1', 'vendor_id': 'v1', 'price': 100.0, 'is_active': True})
+    await slot.vendors.insert_one({'id': 'v1', 'is_approved': True, 'commission_rate': 10.0})
+    await slot.waitlist_entries.insert_one(_entry('e1', 1, promoting_at=STALE, seats_reserved=True))
+
+    assert await recover_stale_promotions() == 1
+
+    # The reserved seats went back and the entry, still at the head, was promoted afresh
+    entry = await _status(slot, 'e1')
+    assert entry['status'] == 'promoted' and entry['booking_id'] != 'b-e1'
+    assert await slot.bookings.count_documents({}) == 1
+    assert (await slot.time_slots.find_one({'id': 's1'}))['booked_count'] == 4
+
+async def test_promotion_interrupted_before_reserving_keeps_the_seats(slot):
+    await slot.waitlist_entries.insert_one(_entry('e1', 1, promoting_at=STALE, seats_reserved=False))
+
+    assert await recover_stale_promotions() == 1
+
+    assert (await _status(slot, 'e1'))['status'] == 'waiting'
+    assert (await slot.time_slots.find_one({'id': 's1'}))['booked_count'] == 4
+
+async def test_promotion_with_a_written_booking_is_completed(slot):
+    await slot.waitlist_entries.insert_one(_entry('e1', 1, promoting_at=STALE, seats_reserved=True))
+    await slot.bookings.insert_one({'id': 'b-e1', 'time_slot_id': 's1', 'seats': 2, 'status': 'pending'})
+
+    assert await recover_stale_promotions() == 1
+
+    entry = await _status(slot, 'e1')
+    assert entry['status'] == 'promoted' and entry['booking_id'] == 'b-e1'
+    assert (await slot.time_slots.find_one({'id': 's1'}))['booked_count'] == 4
+
+async def test_promotion_in_progress_is_left_alone(slot):
+    await slot.waitlist_entries.insert_one(_entry('e1', 1, promoting_at=datetime.utcnow(), seats_reserved=True))
+
+    assert await recover_stale_promotions() == 0
+    assert (await _status(slot, 'e1'))['status'] == 'promoting'
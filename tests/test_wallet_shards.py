@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+import wallet_shards
+from wallet_shards import fold_wallet_shards, get_wallet_with_shards, increment_wallet
+
+pytestmark = pytest.mark.anyio
+
+VENDOR = 'v1'
+
+@pytest.fixture
+async def wallet(db, monkeypatch):
+    monkeypatch.setattr(wallet_shards, 'WALLET_COUNTER_SHARDS', 4)
+    await db.vendor_wallets.insert_one({'vendor_id': VENDOR, 'balance': 100.0, 'total_earned': 100.0,
+                                        'total_commission': 0.0, 'total_paid_out': 0.0})
+    return db
+
+async def _base(db) -> dict:
+    return await db.vendor_wallets.find_one({'vendor_id': VENDOR})
+
+async def test_fold_moves_shard_amounts_into_base_wallet(wallet):
+    for _ in range(10):
+        await increment_wallet(VENDOR, {'balance': 85.0, 'total_earned': 100.0, 'total_commission': 15.0})
+    assert (await get_wallet_with_shards(VENDOR))['balance'] == 950.0
+
+    await fold_wallet_shards()
+
+    base = await _base(wallet)
+    assert base['balance'] == 950.0
+    assert base['total_commission'] == 150.0
+    assert all(s['balance'] == 0 for s in await wallet.vendor_wallet_shards.find().to_list(None))
+    assert (await get_wallet_with_shards(VENDOR))['balance'] == 950.0
+
+async def test_concurrent_folds_credit_once(wallet):
+    for _ in range(8):
+        await increment_wallet(VENDOR, {'balance': 10.0})
+
+    await asyncio.gather(fold_wallet_shards(), fold_wallet_shards(VENDOR), fold_wallet_shards())
+    await fold_wallet_shards()
+
+    assert (await _base(wallet))['balance'] == 180.0
+    assert (await get_wallet_with_shards(VENDOR))['balance'] == 180.0
+
+async def test_fold_interrupted_after_claim_is_finished_once(wallet):
+    # Claimed (amounts moved to `folding`) but the base wallet not yet credited
+    await wallet.vendor_wallet_shards.insert_one({'vendor_id': VENDOR, 'shard': 0, 'balance': 0.0,
+                                                  'fold_token': 't1', 'folding': {'balance': 40.0}})
+    assert (await get_wallet_with_shards(VENDOR))['balance'] == 140.0
+
+    await fold_wallet_shards()
+    await fold_wallet_shards()
+
+    assert (await _base(wallet))['balance'] == 140.0
+    shard = await wallet.vendor_wallet_shards.find_one({'shard': 0})
+    assert 'fold_token' not in shard and 'folding' not in shard
+
+async def test_fold_interrupted_after_credit_is_not_credited_again(wallet):
+    await wallet.vendor_wallets.update_one({'vendor_id': VENDOR},
+                                           {'$inc': {'balance': 40.0}, '$set': {'applied_folds': ['t1']}})
+    await wallet.vendor_wallet_shards.insert_one({'vendor_id': VENDOR, 'shard': 0, 'balance': 0.0,
+                                                  'fold_token': 't1', 'folding': {'balance': 40.0}})
+
+    await fold_wallet_shards()
+
+    assert (await _base(wallet))['balance'] == 140.0
+    assert 'fold_token' not in await wallet.vendor_wallet_shards.find_one({'shard': 0})
+
+async def test_shards_without_base_wallet_are_kept(wallet):
+    await wallet.vendor_wallet_shards.insert_one({'vendor_id': 'ghost', 'shard': 1, 'balance': 5.0})
+
+    assert await fold_wallet_shards() == {'folded_shards': 0}
+    assert (await wallet.vendor_wallet_shards.find_one({'vendor_id': 'ghost'}))['balance'] == 5.0